@@ -0,0 +1,67 @@
+# adaptive_skip.py
+import math
+
+MOTION_STATE = 'motion'
+ACTIVE_STATE = 'active'
+
+
+# Chooses how many frames the capture reader skips between processed frames.
+# Each processed frame costs `cost` seconds and consumes (skip + 1) / fps
+# seconds of stream, so the lag behind the stream grows by the difference.
+# The skip is the smallest one that brings the lag back within the budget of
+# the current state (motion-only or detection-active), from a smoothed cost
+# per state so switching states reacts at once instead of after a ramp.
+class AdaptiveSkipController:
+
+    def __init__(self, fps, motion_budget=0.1, active_budget=0.5, max_skip=30, smoothing=0.2, gain=1.0, initial_skip=0):
+        self.fps = fps
+        self.budgets = {MOTION_STATE: motion_budget, ACTIVE_STATE: active_budget}
+        self.max_skip = max_skip
+        self.smoothing = smoothing
+        self.gain = gain
+        self.costs = {MOTION_STATE: None, ACTIVE_STATE: None}
+        self.skip = initial_skip
+        self.lag = 0.0
+
+        # Counters
+        self.updates = 0
+        self.changes = 0
+        self.skip_total = 0
+        self.max_lag = 0.0
+
+    # Feed the processing cost of one frame and the stream time it advanced
+    # (interval). lag overrides the modelled lag when it can be measured, e.g.
+    # from the age of live frames. Returns the skip for the next frames.
+    def update(self, cost, active, interval, lag=None, fps=None):
+        if fps:
+            self.fps = fps
+        state = ACTIVE_STATE if active else MOTION_STATE
+        previous = self.costs[state]
+        self.costs[state] = cost if previous is None else previous + self.smoothing * (cost - previous)
+
+        if lag is None:
+            lag = self.lag + cost - interval
+        self.lag = max(0.0, lag)
+        self.max_lag = max(self.max_lag, self.lag)
+
+        # Stream seconds each processed frame has to cover to pay back the excess lag
+        needed = (self.costs[state] + self.gain * (self.lag - self.budgets[state])) * self.fps
+        skip = min(self.max_skip, max(0, math.ceil(needed) - 1))
+        if skip != self.skip:
+            self.changes += 1
+        self.skip = skip
+
+        self.updates += 1
+        self.skip_total += skip
+        return skip
+
+    def stats(self):
+        return {
+            'skip': self.skip,
+            'mean_skip': self.skip_total / self.updates if self.updates else 0.0,
+            'lag_seconds': self.lag,
+            'max_lag_seconds': self.max_lag,
+            'motion_cost_ms': (self.costs[MOTION_STATE] or 0.0) * 1000,
+            'active_cost_ms': (self.costs[ACTIVE_STATE] or 0.0) * 1000,
+            'changes': self.changes,
+        }
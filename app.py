@@ -1,51 +1,175 @@
 # app.py
+import argparse
 import os
+import time
 import cv2
-import supervision as sv
-from ultralytics import YOLOWorld
-from collections import defaultdict
+import numpy as np
+import yaml
 import signal
 import sys
+from adaptive_skip import AdaptiveSkipController
+from capture_reader import DROP_FIFO, CaptureReader, ImageSequenceCapture
+from metrics import PipelineMetrics
+from mjpeg_reader import MJPEGCapture, decode_reduction
+from motion_backends import create_motion_backend
+from motion_regions import detect_regions, plan_regions
+from phash_index import NearDuplicateFilter
+from shard_store import close_writers, encode_sample_files, get_writer
+from post_processer import confirm_yolo_conversion, crop_and_convert, crop_and_convert_boxes, draw_bounding_box, format_yolo_label, format_yolo_labels
+from track_state import TrackStateStore
+from writer_pool import WriterPool
 from config.configs import *
 
-
-# Initialize dictionaries
-detected_objects = defaultdict(list)
-consecutive_detections = defaultdict(int)
+# Asynchronous screenshot/label writer, started by start_writer_pool()
+writer_pool = None
+
+# Per-stage timings for every stream, exported by start_metrics()
+pipeline_metrics = PipelineMetrics()
+
+
+# Per-stream detection state (one per camera)
+class DetectionState:
+
+    def __init__(self, name=None, consecutive_seconds=None):
+        self.name = name
+        self.tracks = TrackStateStore(CONFIDENCE_LEVEL, CONSECUTIVE_FRAMES, MAX_SCREENSHOTS,
+                                      capacity=TRACK_STATE_CAPACITY, ttl_frames=TRACK_STATE_TTL_FRAMES,
+                                      consecutive_seconds=consecutive_seconds)
+        self.duplicates = NearDuplicateFilter(DEDUP_MAX_DISTANCE, DEDUP_WINDOW) if DEDUP_ENABLED else None
+        self.consecutive_no_tracker_count = 0
+        self.object_detection_active = False
+        self.last_frame = None
+        self.frame_interval = None  # stream seconds since the previous processed frame
+        self.tracker = None  # ByteTrack tracker for motion-region inference
+        self.regions = {'region_frames': 0, 'full_frames': 0, 'crops': 0, 'crop_pixels': 0, 'frame_pixels': 0}
+
+# Consecutive detection threshold in stream seconds, or None to count frames
+def consecutive_seconds(fps):
+    if CONSECUTIVE_SECONDS is not None:
+        return CONSECUTIVE_SECONDS
+    if ADAPTIVE_SKIP and fps > 0:
+        return CONSECUTIVE_FRAMES * (FRAMES_TO_SKIP + 1) / fps
+    return None
+
+# Stream time covered by the frame just read: the frames grabbed since the
+# previous one at the stream FPS, or wall-clock time when the stream reports none
+def update_frame_interval(state, reader, fps):
+    previous = state.last_frame
+    state.last_frame = (reader.last_frame_index, reader.last_frame_time)
+    if fps > 0:
+        previous_index = previous[0] if previous is not None else -1
+        state.frame_interval = (reader.last_frame_index - previous_index) / fps
+    else:
+        state.frame_interval = reader.last_frame_time - previous[1] if previous is not None else 0.0
+
+# Retune the reader skip from the cost of one iteration. Live streams measure
+# the lag as the age of the frame, replays model it from stream time.
+def adapt_skip(controller, reader, state, cost, active, fps, replay):
+    lag = None if replay else time.monotonic() - reader.last_frame_time
+    skip = controller.update(cost, active, state.frame_interval, lag, fps or reader.capture_fps())
+    reader.set_skip(skip)
 
 def signal_handler(sig, frame):
     print('Signal received, exiting program.')
+    if writer_pool is not None:
+        print('Flushing pending screenshots...')
+        writer_pool.close(timeout=WRITER_FLUSH_TIMEOUT)
+    close_writers()
+    pipeline_metrics.stop()
     sys.exit(0)
 
+# Start the background writer pool when asynchronous saving is enabled
+def start_writer_pool(backpressure=WRITER_BACKPRESSURE):
+    global writer_pool
+    if WRITER_ASYNC and writer_pool is None:
+        writer_pool = WriterPool(workers=WRITER_WORKERS, queue_size=WRITER_QUEUE_SIZE,
+                                 backpressure=backpressure, spill_dir=WRITER_SPILL_DIR,
+                                 metrics=pipeline_metrics)
+        pipeline_metrics.register_gauges('writer', writer_pool.stats)
+    return writer_pool
+
+def stop_writer_pool():
+    global writer_pool
+    if writer_pool is not None:
+        writer_pool.close(timeout=WRITER_FLUSH_TIMEOUT)
+        writer_pool = None
+    close_writers()  # seal the open shards
+
+# Start the metrics endpoint and/or periodic JSONL dump
+def start_metrics():
+    if METRICS_PORT:
+        pipeline_metrics.start_http_server(METRICS_PORT, METRICS_HOST)
+    if METRICS_JSONL_PATH:
+        pipeline_metrics.start_jsonl_dump(METRICS_JSONL_PATH, METRICS_JSONL_INTERVAL)
+
+# Record the ultralytics preprocess/inference/postprocess split of a result
+def record_inference_speed(result, stream=None):
+    for stage, ms in result.speed.items():
+        if ms is not None:
+            pipeline_metrics.observe(f'yolo_{stage}', ms, stream)
+
 # Create necessary directories for screenshots and labels
 def create_directories():
     directories = [ORIGINAL_IMAGE_DIR, ORIGINAL_LABEL_DIR]
+    if STREAMING_POSTPROCESS:
+        directories = [PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR] + ([PLOT_IMAGE_DIR] if STREAMING_SAVE_PLOTS else [])
+    if STORAGE_BACKEND == 'shards':
+        directories = [PROCESSED_SHARD_DIR if STREAMING_POSTPROCESS else ORIGINAL_SHARD_DIR]
     for directory in directories:
         os.makedirs(directory, exist_ok=True)
 
 # Load a pretrained YOLOv8s-worldv2 model
 def initialize_model():
+    # Imported here so tools that only need the helpers of this module start fast
+    from ultralytics import YOLOWorld
+    from embedding_cache import set_classes_cached
+    from inference_backend import load_backend_model
+
+    if INFERENCE_BACKEND != 'torch':
+        # Class-fixed ONNX/OpenVINO export, exported on first use
+        return load_backend_model(MODEL_PATH, MODEL_CLASSES, INFERENCE_BACKEND, INFERENCE_INT8, INFERENCE_IMGSZ)
     model = YOLOWorld(MODEL_PATH)
     classes = MODEL_CLASSES
-    model.set_classes(classes)
+    if EMBEDDING_CACHE_DIR:
+        # Cached class embeddings skip loading the CLIP text encoder
+        cached = set_classes_cached(model, MODEL_PATH, classes, EMBEDDING_CACHE_DIR)
+        print(f"Class embeddings {'loaded from' if cached else 'saved to'} {EMBEDDING_CACHE_DIR}")
+    else:
+        model.set_classes(classes)
     return model
 
-# Initialize Video Capture
+# Initialize Video Capture (a stream URL, a video file or a directory of frames).
+# Raises IOError when the source cannot be opened.
 def initialize_video_capture(url):
-    cap = cv2.VideoCapture(url)
+    cap = None
+    if os.path.isdir(url):
+        cap = ImageSequenceCapture(url, fps=REPLAY_FPS)
+    elif MJPEG_NATIVE_READER and url.startswith(('http://', 'https://')):
+        # Region inference crops the full-resolution frame, so it is decoded at full size
+        reduction = decode_reduction(SCALE_FRAME_WIDTH, SCALE_FRAME_HEIGHT) if MJPEG_REDUCED_DECODE and not REGION_INFERENCE else 1
+        cap = MJPEGCapture(url, reduction)
+        if cap.isOpened():
+            print(f"Reading MJPEG stream {url} at 1/{reduction} scale")
+        else:
+            cap = None
+    if cap is None:
+        cap = cv2.VideoCapture(url)
     if not cap.isOpened():
-        print("Error: Unable to open video stream")
-        exit()
+        raise IOError(f"Unable to open video stream {url}")
     return cap
 
+# Scale a captured frame to the processing size. Sources decoding at reduced
+# scale already did part of it (or all of it, then the frame is used as is).
+def scale_frame(frame, cap):
+    reduction = getattr(cap, 'reduction', 1)
+    fx, fy = SCALE_FRAME_WIDTH * reduction, SCALE_FRAME_HEIGHT * reduction
+    if abs(fx - 1.0) < 1e-6 and abs(fy - 1.0) < 1e-6:
+        return frame
+    return cv2.resize(frame, (0, 0), fx=fx, fy=fy)
+
 # Motion Detection
-def detect_motion(frame, back_sub):
-    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    blurred_frame = cv2.GaussianBlur(gray_frame, (5, 5), 0)
-    fg_mask = back_sub.apply(blurred_frame)
-    _, thresh = cv2.threshold(fg_mask, 244, 255, cv2.THRESH_BINARY)
-    motion_pixels = cv2.countNonZero(thresh)
-    return motion_pixels, fg_mask
+def detect_motion(frame, motion_backend):
+    return motion_backend.detect(frame)
 
 # Perform Object Detection
 def perform_object_detection(model, frame, TRACKER_CONFIG_PATH):
@@ -60,149 +184,396 @@ def perform_object_detection(model, frame, TRACKER_CONFIG_PATH):
     )
     return results
 
-def save_screenshot(ORIGINAL_IMAGE_DIR, class_name, class_id, confidence, track_id, screenshot_count_for_object, scaled_frame):
-    screenshot_path = os.path.join(ORIGINAL_IMAGE_DIR, f"{class_name}_{class_id}_{confidence:.6}_{track_id}_SSC_{screenshot_count_for_object}.jpg")
-    cv2.imwrite(screenshot_path, scaled_frame)
-    print(f"Screenshot saved: {screenshot_path}")
-
+# Build a per-stream ByteTrack tracker from the shared tracker config
+def create_tracker(fps):
+    import supervision as sv
+
+    with open(TRACKER_CONFIG_PATH, 'r') as f:
+        tracker_config = yaml.safe_load(f)
+    return sv.ByteTrack(
+        track_activation_threshold=tracker_config['track_high_thresh'],
+        lost_track_buffer=tracker_config['track_buffer'],
+        minimum_matching_threshold=tracker_config['match_thresh'],
+        frame_rate=fps or 30
+    )
 
-def save_bbox_coordinates(ORIGINAL_LABEL_DIR, class_name, class_id, confidence, track_id, screenshot_count_for_object, bbox, original_width, original_height):
+# Detect on full-resolution crops of the moving regions (REGION_INFERENCE), or
+# on the whole scaled frame when there are none to pick. Boxes are returned in
+# scaled-frame coordinates and tracked with the stream's ByteTrack tracker.
+def perform_region_detection(state, model, frame, scaled_frame, motion_mask):
+    regions = plan_regions(motion_mask, frame.shape[:2])
+    stats = state.regions
+    if regions is None:
+        height, width = scaled_frame.shape[:2]
+        detections, results = detect_regions(model, scaled_frame, np.array([[0, 0, width, height]]), (1.0, 1.0))
+        stats['full_frames'] += 1
+        stats['crop_pixels'] += width * height
+        stats['frame_pixels'] += width * height
+    else:
+        scale = (scaled_frame.shape[1] / frame.shape[1], scaled_frame.shape[0] / frame.shape[0])
+        detections, results = detect_regions(model, frame, regions, scale)
+        stats['region_frames'] += 1
+        stats['crops'] += len(regions)
+        stats['crop_pixels'] += int(np.prod(regions[:, 2:] - regions[:, :2], axis=1).sum())
+        stats['frame_pixels'] += frame.shape[0] * frame.shape[1]
+    return state.tracker.update_with_detections(detections), results
+
+# Build the shared file name for a screenshot and its label
+def capture_basename(class_name, class_id, confidence, track_id, screenshot_count_for_object, stream_name=None):
+    basename = f"{class_name}_{class_id}_{confidence:.6}_{track_id}_SSC_{screenshot_count_for_object}"
+    if stream_name:
+        basename = f"{stream_name}_{basename}"
+    return basename
+
+# Build the file name for a per-frame capture holding num_objects labels
+def frame_basename(frame_index, num_objects, stream_name=None):
+    basename = f"frame_{frame_index:06d}_{num_objects}obj"
+    if stream_name:
+        basename = f"{stream_name}_{basename}"
+    return basename
+
+# Raw label line read back by post_processer.py
+def raw_label(class_id, bbox, original_width, original_height):
     x_tl, y_tl, x_br, y_br = map(int, bbox)
-    bbox_label_path = os.path.join(ORIGINAL_LABEL_DIR, f"{class_name}_{class_id}_{confidence:.6}_{track_id}_SSC_{screenshot_count_for_object}.txt")
-    with open(bbox_label_path, 'w') as f:
-        f.write(f"{class_id} {original_width} {original_height} {x_tl} {y_tl} {x_br} {y_br}")
-    print(f"BBOX coordinates saved: {bbox_label_path}")
+    return f"{class_id} {original_width} {original_height} {x_tl} {y_tl} {x_br} {y_br}"
+
+# Write a capture as one shard sample; images are JPEG encoded by the writer
+def save_sample(shard_dir, key, images, texts, metadata, label="Sample"):
+    if writer_pool is not None:
+        writer_pool.submit_sample(shard_dir, key, images, texts, metadata, label=label)
+        return
+    get_writer(shard_dir).write(key, encode_sample_files(images, texts), metadata)
+    print(f"{label} saved: {shard_dir}{key}")
+
+# Structured metadata stored with a sample instead of being parsed from its name
+def capture_metadata(class_name, class_id, confidence, track_id, screenshot_count_for_object, bbox, original_width, original_height, stream_name=None):
+    return {'class_name': class_name, 'class_id': class_id, 'confidence': confidence, 'track_id': track_id,
+            'screenshot': screenshot_count_for_object, 'stream': stream_name, 'bbox': list(map(int, bbox)),
+            'width': original_width, 'height': original_height}
+
+def frame_metadata(frame_index, class_ids, bboxes, original_width, original_height, stream_name=None):
+    return {'frame': frame_index, 'stream': stream_name, 'width': original_width, 'height': original_height,
+            'objects': [{'class_id': class_id, 'bbox': list(map(int, bbox))} for class_id, bbox in zip(class_ids, bboxes)]}
+
+# Write a capture's files, through the writer pool as one job when it is running
+def save_files(files, label):
+    if writer_pool is not None:
+        writer_pool.submit_files(files, label=label)
+        return
+    for path, payload in files:
+        if isinstance(payload, str):
+            with open(path, 'w') as f:
+                f.write(payload)
+        else:
+            cv2.imwrite(path, payload)
+    print(f"{label} saved: {files[0][0]}")
+
+# Screenshot and raw label of one object, written or dropped together
+def save_capture(ORIGINAL_IMAGE_DIR, ORIGINAL_LABEL_DIR, class_name, class_id, confidence, track_id, screenshot_count_for_object, bbox, scaled_frame, original_width, original_height, stream_name=None):
+    basename = capture_basename(class_name, class_id, confidence, track_id, screenshot_count_for_object, stream_name)
+    screenshot_path = os.path.join(ORIGINAL_IMAGE_DIR, basename + ".jpg")
+    bbox_label_path = os.path.join(ORIGINAL_LABEL_DIR, basename + ".txt")
+    label = raw_label(class_id, bbox, original_width, original_height)
+    save_files([(screenshot_path, scaled_frame), (bbox_label_path, label)], "Screenshot")
+
+# Shard variant of save_capture: image, raw label and metadata in one sample
+def save_capture_sample(class_name, class_id, confidence, track_id, screenshot_count_for_object, bbox, scaled_frame, original_width, original_height, stream_name=None):
+    basename = capture_basename(class_name, class_id, confidence, track_id, screenshot_count_for_object, stream_name)
+    label = raw_label(class_id, bbox, original_width, original_height)
+    metadata = capture_metadata(class_name, class_id, confidence, track_id, screenshot_count_for_object, bbox, original_width, original_height, stream_name)
+    save_sample(ORIGINAL_SHARD_DIR, basename, {'jpg': scaled_frame}, {'txt': label}, metadata, label="Capture")
+
+# Crop the in-memory frame and write the final processed image and YOLO label
+# directly, skipping the original_data round trip through post_processer.py
+def save_processed_capture(class_name, class_id, confidence, track_id, screenshot_count_for_object, bbox, scaled_frame, original_width, original_height, stream_name=None):
+    x_tl, y_tl, x_br, y_br = map(int, bbox)
+    cropped_image, voc_box, yolo_bbox = crop_and_convert(scaled_frame, original_width, original_height, x_tl, y_tl, x_br, y_br)
+
+    basename = capture_basename(class_name, class_id, confidence, track_id, screenshot_count_for_object, stream_name)
+    image_path = os.path.join(PROCESSED_IMAGE_DIR, basename + ".jpg")
+    label_path = os.path.join(PROCESSED_LABEL_DIR, basename + ".txt")
+    label = format_yolo_label(class_id, yolo_bbox)
+    plot_image = draw_bounding_box(cropped_image.copy(), *voc_box) if STREAMING_SAVE_PLOTS else None
+
+    if STORAGE_BACKEND == 'shards':
+        metadata = capture_metadata(class_name, class_id, confidence, track_id, screenshot_count_for_object, bbox, original_width, original_height, stream_name)
+        save_sample(PROCESSED_SHARD_DIR, basename, {'jpg': cropped_image, 'plot.jpg': plot_image}, {'txt': label}, metadata, label="Processed capture")
+        return
+
+    files = [(image_path, cropped_image), (label_path, label)]
+    if plot_image is not None:
+        files.append((os.path.join(PLOT_IMAGE_DIR, basename + ".jpg"), plot_image))
+    save_files(files, "Processed capture")
+
+# Save one screenshot and one multi-line label for all labelled detections of a frame
+def save_frame_capture(ORIGINAL_IMAGE_DIR, ORIGINAL_LABEL_DIR, frame_index, class_ids, bboxes, scaled_frame, original_width, original_height, stream_name=None):
+    basename = frame_basename(frame_index, len(class_ids), stream_name)
+    screenshot_path = os.path.join(ORIGINAL_IMAGE_DIR, basename + ".jpg")
+    bbox_label_path = os.path.join(ORIGINAL_LABEL_DIR, basename + ".txt")
+    label = '\n'.join(raw_label(class_id, bbox, original_width, original_height) for class_id, bbox in zip(class_ids, bboxes))
+
+    if STORAGE_BACKEND == 'shards':
+        metadata = frame_metadata(frame_index, class_ids, bboxes, original_width, original_height, stream_name)
+        save_sample(ORIGINAL_SHARD_DIR, basename, {'jpg': scaled_frame}, {'txt': label}, metadata, label="Frame capture")
+        return
+
+    save_files([(screenshot_path, scaled_frame), (bbox_label_path, label)], f"Frame capture ({len(class_ids)} objects)")
+
+# Streaming variant of save_frame_capture: one crop covering every box
+def save_processed_frame(frame_index, class_ids, bboxes, scaled_frame, original_width, original_height, stream_name=None):
+    cropped_image, voc_boxes, yolo_bboxes = crop_and_convert_boxes(scaled_frame, original_width, original_height, bboxes)
+    valid = confirm_yolo_conversion(yolo_bboxes, voc_boxes, cropped_image.shape[1], cropped_image.shape[0])
+
+    basename = frame_basename(frame_index, len(class_ids), stream_name)
+    image_path = os.path.join(PROCESSED_IMAGE_DIR, basename + ".jpg")
+    label_path = os.path.join(PROCESSED_LABEL_DIR, basename + ".txt")
+    label = format_yolo_labels(np.asarray(class_ids)[valid].tolist(), yolo_bboxes[valid].tolist())
+    plot_image = None
+    if STREAMING_SAVE_PLOTS:
+        plot_image = cropped_image.copy()
+        for voc_box in voc_boxes.tolist():
+            draw_bounding_box(plot_image, *voc_box)
+
+    if STORAGE_BACKEND == 'shards':
+        metadata = frame_metadata(frame_index, class_ids, bboxes, original_width, original_height, stream_name)
+        save_sample(PROCESSED_SHARD_DIR, basename, {'jpg': cropped_image, 'plot.jpg': plot_image}, {'txt': label}, metadata, label="Processed frame capture")
+        return
+
+    files = [(image_path, cropped_image), (label_path, label)]
+    if plot_image is not None:
+        files.append((os.path.join(PLOT_IMAGE_DIR, basename + ".jpg"), plot_image))
+    save_files(files, f"Processed frame capture ({len(class_ids)} objects)")
+
+# Check the object crop against recent captures of its class before anything is encoded
+def find_duplicate_capture(state, class_name, track_id, bbox, scaled_frame):
+    if state.duplicates is None:
+        return None
+    x_tl, y_tl, x_br, y_br = map(int, bbox)
+    with pipeline_metrics.time('dedup', state.name):
+        return state.duplicates.check(class_name, scaled_frame[max(0, y_tl):y_br, max(0, x_tl):x_br], track_id)
+
+# Switch object detection on/off based on the amount of motion
+def update_motion_gate(state, motion_pixels):
+    if motion_pixels > MOTION_THRESHOLD + HYSTERESIS_DEADBAND:
+        print("Motion Detected")
+        state.tracks.reset_counts()  # Reset consecutive detection and screenshot counts for all objects
+        state.object_detection_active = True
+
+    elif motion_pixels < MOTION_THRESHOLD - HYSTERESIS_DEADBAND:
+        # Switch to motion detection
+        print("Motion Not Detected")
+
+# Update consecutive counts for one frame of tracked detections and save screenshots
+def process_detections(state, detections, scaled_frame, original_width, original_height):
+    tracks = state.tracks
+    num_detections = len(detections)
+
+    class_names = detections.data['class_name'].tolist() if num_detections else []
+    if detections.tracker_id is not None:
+        track_ids = detections.tracker_id.tolist()
+    else:
+        track_ids = [None] * num_detections
+
+    # Confidence gating and consecutive counts for every detection at once
+    slots, counts, ready = tracks.update(class_names, track_ids, detections.confidence if num_detections else [], state.frame_interval)
+
+    # Print the number of consecutive frames detected
+    for i in np.flatnonzero(counts).tolist():
+        print(f"Class Name: {class_names[i]}, Class ID: {detections.class_id[i]}, Confidence: {detections.confidence[i]:.3f}, Track ID: {track_ids[i]} detected for {counts[i]} consecutive frames.")
+
+    # Objects detected with high confidence for CONSECUTIVE_FRAMES consecutive frames
+    frame_captured = False
+    for i in np.flatnonzero(ready).tolist():
+        class_name, track_id, slot = class_names[i], track_ids[i], slots[i]
+        class_id = int(detections.class_id[i])
+        confidence = float(detections.confidence[i])
+
+        # Check if the maximum number of screenshots has been reached for this object
+        if tracks.can_capture(slot):
+            # Near-identical captures of a static object re-tracked under a new
+            # track_id are not saved and do not count towards its screenshots
+            duplicate = find_duplicate_capture(state, class_name, track_id, detections.xyxy[i], scaled_frame)
+            if duplicate is not None:
+                tracks.restart_consecutive(slot)
+                print(f"Class Name: {class_name}, Track ID: {track_id} is a near duplicate of Track ID: {duplicate[0]} (distance {duplicate[1]}), not saved")
+                continue
+
+            # Count the screenshot and reset the consecutive count to avoid repeated screenshots
+            screenshot_count_for_object = tracks.record_screenshot(slot)
+
+            if CAPTURE_PER_FRAME:
+                # The frame is saved once below, whichever objects triggered it
+                frame_captured = True
+            else:
+                with pipeline_metrics.time('save', state.name):
+                    if STREAMING_POSTPROCESS:
+                        save_processed_capture(class_name, class_id, confidence, track_id, screenshot_count_for_object, detections.xyxy[i], scaled_frame, original_width, original_height, state.name)
+                    elif STORAGE_BACKEND == 'shards':
+                        save_capture_sample(class_name, class_id, confidence, track_id, screenshot_count_for_object, detections.xyxy[i], scaled_frame, original_width, original_height, state.name)
+                    else:
+                        save_capture(ORIGINAL_IMAGE_DIR, ORIGINAL_LABEL_DIR, class_name, class_id, confidence, track_id, screenshot_count_for_object, detections.xyxy[i], scaled_frame, original_width, original_height, state.name)
+
+            # Print the current screenshot count
+            print(f"Class Name: {class_name}, Class ID: {class_id}, Confidence: {confidence:.3f}, Track ID: {track_id} reached {screenshot_count_for_object} of {MAX_SCREENSHOTS} screenshots")
+
+        # Check if every object has reached the maximum number of screenshots
+        if tracks.all_saturated():
+            print("Maximum number of screenshots reached for all objects.")
+            tracks.reset_consecutive()  # Reset consecutive detection count for all objects
+            state.object_detection_active = False
+            break
 
-def main():
+    # One image for the whole frame, labelled with every confident detection in it
+    if frame_captured:
+        labelled = np.flatnonzero(detections.confidence >= CONFIDENCE_LEVEL)
+        class_ids = detections.class_id[labelled].tolist()
+        bboxes = detections.xyxy[labelled]
+        with pipeline_metrics.time('save', state.name):
+            if STREAMING_POSTPROCESS:
+                save_processed_frame(tracks.frame, class_ids, bboxes, scaled_frame, original_width, original_height, state.name)
+            else:
+                save_frame_capture(ORIGINAL_IMAGE_DIR, ORIGINAL_LABEL_DIR, tracks.frame, class_ids, bboxes, scaled_frame, original_width, original_height, state.name)
+
+    if num_detections:  # if any object is being detected
+        state.consecutive_no_tracker_count = 0
+        # print("Object is being detected")
+    else:
+        state.consecutive_no_tracker_count += 1
+        print(f"Consecutive frames with no detection: {state.consecutive_no_tracker_count}")
+
+    if state.consecutive_no_tracker_count >= 30:
+        state.consecutive_no_tracker_count = 0
+        print("Closing window due to 30 consecutive frames with no tracker_id")
+
+        state.object_detection_active = False
+        return False
+
+    return True
+
+# Print total and per-stage frames per second after an offline replay
+def print_replay_report(frames_processed, elapsed):
+    print(f"Replay finished: {frames_processed} frames in {elapsed:.2f}s ({frames_processed / elapsed if elapsed else 0.0:.1f} FPS)")
+    for stage, stats in pipeline_metrics.snapshot()['stages'].get('default', {}).items():
+        stage_fps = 1000.0 / stats['mean_ms'] if stats['mean_ms'] else float('inf')
+        print(f"  {stage:<18} {stats['count']:>7} calls  {stats['mean_ms']:8.2f} ms/call  {stage_fps:9.1f} FPS")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Motion-gated YOLO-World dataset capture")
+    parser.add_argument('--replay', metavar='SOURCE',
+                        help="Run headless over a recorded video file or image directory as fast as possible")
+    parser.add_argument('--headless', action='store_true', help="Do not display the foreground mask")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    import supervision as sv
+
+    replay = args.replay is not None
+    headless = args.headless or replay
 
     model = initialize_model()
-    cap = initialize_video_capture(VIDEO_SOURCE)
-    back_sub = cv2.createBackgroundSubtractorMOG2(history=BG_HISTORY, varThreshold=BG_THRESHOLD, detectShadows=BG_SHADOWS)
+    try:
+        cap = initialize_video_capture(args.replay if replay else VIDEO_SOURCE)
+    except IOError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    motion_backend = create_motion_backend(MOTION_BACKEND)
 
     # Register the signal handler
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
     create_directories()
-
-    # Initialize a counter for the screenshots
-    object_screenshot_count = {}
-    consecutive_no_tracker_count = 0
-    object_detection_active = False
+    # Replay never drops work so the output matches what live mode would save
+    start_writer_pool('block' if replay else WRITER_BACKPRESSURE)
+    start_metrics()
 
     # Retrieve original video properties
     w, h, fps = (int(cap.get(x)) for x in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FPS))
     print(f"Original FPS: {fps}, Frame shape: {w}x{h}")
 
+    # Initialize the detection state for the stream
+    state = DetectionState(consecutive_seconds=consecutive_seconds(fps))
+
+    # Decode frames on a background thread so inference never falls behind the camera.
+    # Every policy keeps one frame in FRAMES_TO_SKIP + 1; replay also never drops
+    # a kept frame for lag.
+    reader = CaptureReader(cap, policy=DROP_FIFO if replay else CAPTURE_DROP_POLICY, buffer_size=CAPTURE_BUFFER_SIZE,
+                           skip=FRAMES_TO_SKIP, max_frame_age=CAPTURE_MAX_FRAME_AGE,
+                           metrics=pipeline_metrics, block=replay, live=not replay).start()
+    controller = None
+    if ADAPTIVE_SKIP:
+        controller = AdaptiveSkipController(fps, MOTION_LAG_BUDGET, ACTIVE_LAG_BUDGET, ADAPTIVE_MAX_SKIP,
+                                            ADAPTIVE_SMOOTHING, initial_skip=FRAMES_TO_SKIP)
+        pipeline_metrics.register_gauges('adaptive_skip', controller.stats)
+    pipeline_metrics.register_gauges('capture', reader.stats)
+    if isinstance(cap, MJPEGCapture):
+        pipeline_metrics.register_gauges('mjpeg', cap.stats)
+    pipeline_metrics.register_gauges('motion_backend', motion_backend.cost)
+    pipeline_metrics.register_gauges('tracks', state.tracks.stats)
+    if REGION_INFERENCE:
+        state.tracker = create_tracker(fps)
+        pipeline_metrics.register_gauges('regions', lambda: dict(state.regions))
+    if state.duplicates is not None:
+        pipeline_metrics.register_gauges('dedup', state.duplicates.stats)
+
+    frames_processed = 0
+    start_time = time.perf_counter()
+
     while True:
-        for _ in range(FRAMES_TO_SKIP):
-            ret = cap.grab()  # Grab frames but don't decode them
-            if not ret:
-                print("Error: Unable to grab frame")
-                break
-        
         # Read the next frame to process
-        ret, frame = cap.read()
+        with pipeline_metrics.time('read'):
+            ret, frame = reader.read()
         if not ret:
-            print("Error: Unable to read frame")
+            if not replay:
+                print("Error: Unable to read frame")
             break
+        pipeline_metrics.tick()
+        frames_processed += 1
+        iteration_start = time.perf_counter()
+        active = state.object_detection_active
+        update_frame_interval(state, reader, fps)
 
         # Resize the frame by 50%
-        scaled_frame = cv2.resize(frame, (0, 0), fx=SCALE_FRAME_WIDTH, fy=SCALE_FRAME_HEIGHT)
+        with pipeline_metrics.time('resize'):
+            scaled_frame = scale_frame(frame, cap)
 
         # Count non-zero pixels in the thresholded image
-        motion_pixels, fg_mask = detect_motion(scaled_frame, back_sub)
+        with pipeline_metrics.time('motion'):
+            motion_pixels, fg_mask = detect_motion(scaled_frame, motion_backend)
 
         # Check if object detection is currently active
-        if object_detection_active:
-            results = perform_object_detection(model, scaled_frame, TRACKER_CONFIG_PATH)
-            # print(f"Speed: Preprocess: {results[0].speed['preprocess']:.2f} ms, Inference: {results[0].speed['inference']:.2f} ms, Postprocess: {results[0].speed['postprocess']:.2f} ms")
+        if state.object_detection_active and REGION_INFERENCE:
+            with pipeline_metrics.time('inference'):
+                detections, results = perform_region_detection(state, model, frame, scaled_frame, motion_backend.threshold(fg_mask))
+            for result in results:
+                record_inference_speed(result)
+            original_height, original_width = scaled_frame.shape[:2]
+            with pipeline_metrics.time('detections'):
+                process_detections(state, detections, scaled_frame, original_width, original_height)
+
+        elif state.object_detection_active:
+            with pipeline_metrics.time('inference'):
+                results = perform_object_detection(model, scaled_frame, TRACKER_CONFIG_PATH)
+            record_inference_speed(results[0])
             orig_shape = results[0].orig_shape
             original_height, original_width = orig_shape
 
             # Iterate through each result if results is a list
-            for result in results:
-
-                detections = sv.Detections.from_ultralytics(result)
-                class_names = detections.data['class_name'].tolist()
-                confidences = detections.confidence.tolist()
-                class_ids = detections.class_id.tolist()
-                xyxy = detections.xyxy.tolist()
-
-                if detections.tracker_id is not None:
-                    track_ids = detections.tracker_id.tolist()
-                else:
-                    track_ids = [None] * len(class_names)
-
-                # Update the detected_objects dictionary
-                for class_name, confidence, track_id, class_id, bbox in zip(class_names, confidences, track_ids, class_ids, xyxy):
-                    # print(f"Class Name: {class_name}, Class ID: {class_id}, Confidence: {confidence:.3f}, Track ID: {track_id}")
-                    key = (class_name, track_id)
-
-                    # Update consecutive detection count
-                    if confidence >= CONFIDENCE_LEVEL: 
-                        consecutive_detections[key] = consecutive_detections.get(key, 0) + 1
-
-                        # Print the number of consecutive frames detected
-                        print(f"Class Name: {class_name}, Class ID: {class_id}, Confidence: {confidence:.3f}, Track ID: {track_id} detected for {consecutive_detections[key]} consecutive frames.")
-
-                        # Check if the object has been detected with high confidence for 10 consecutive frames
-                        if consecutive_detections[key] == CONSECUTIVE_FRAMES: 
-
-                            # Check if the maximum number of screenshots has been reached for this object
-                            if key not in object_screenshot_count or object_screenshot_count[key] < MAX_SCREENSHOTS:
-                                screenshot_count_for_object = object_screenshot_count.get(key, 0) + 1
-                                object_screenshot_count[key] = screenshot_count_for_object
-
-                                save_screenshot(ORIGINAL_IMAGE_DIR, class_name, class_id, confidence, track_id, screenshot_count_for_object, scaled_frame)
-                                save_bbox_coordinates(ORIGINAL_LABEL_DIR, class_name, class_id, confidence, track_id, screenshot_count_for_object, bbox, original_width, original_height)
-
-                                # Get the current screenshot count for this object
-                                i = object_screenshot_count.get(key, 0)
-
-                                # Print the current screenshot count
-                                print(f"Class Name: {class_name}, Class ID: {class_id}, Confidence: {confidence:.3f}, Track ID: {track_id} reached {i} of {MAX_SCREENSHOTS} screenshots")
-                                
-                                # Reset consecutive detection count to avoid repeated screenshots
-                                consecutive_detections[key] = 0
-
-                            # Check if any object has reached the maximum number of screenshots
-                            if all(count >= MAX_SCREENSHOTS for count in object_screenshot_count.values()):
-                                print("Maximum number of screenshots reached for all objects.")
-                                for key in consecutive_detections:
-                                    consecutive_detections[key] = 0  # Reset consecutive detection count for all objects
-                                object_detection_active = False
-                                break
-
-                    else:
-                        # Reset the count if confidence drops
-                        consecutive_detections[key] = 0
-
-                if class_names:  # if any object is being detected
-                    consecutive_no_tracker_count = 0
-                    # print("Object is being detected")
-                else:
-                    consecutive_no_tracker_count += 1
-                    print(f"Consecutive frames with no detection: {consecutive_no_tracker_count}")
-
-                if consecutive_no_tracker_count >= 30:
-                    consecutive_no_tracker_count = 0
-                    print("Closing window due to 30 consecutive frames with no tracker_id")
-
-                    object_detection_active = False
-                    break
+            with pipeline_metrics.time('detections'):
+                for result in results:
+                    detections = sv.Detections.from_ultralytics(result)
+                    if not process_detections(state, detections, scaled_frame, original_width, original_height):
+                        break
 
         else:
-            if motion_pixels > MOTION_THRESHOLD + HYSTERESIS_DEADBAND:
-                print("Motion Detected")
-                for key in consecutive_detections:
-                    consecutive_detections[key] = 0  # Reset consecutive detection count for all objects
-                object_screenshot_count = {}  # Reset object screenshot count dictionary
-                object_detection_active = True
+            update_motion_gate(state, motion_pixels)
+
+        if controller is not None:
+            adapt_skip(controller, reader, state, time.perf_counter() - iteration_start, active, fps, replay)
 
-            elif motion_pixels < MOTION_THRESHOLD - HYSTERESIS_DEADBAND:
-                # Switch to motion detection
-                print("Motion Not Detected")
+        if headless:
+            continue
 
         # Display the resized frame and the foreground mask
         cv2.imshow('Foreground Mask', fg_mask)
@@ -210,8 +581,23 @@ def main():
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    elapsed = time.perf_counter() - start_time
+    print(f"Capture stats: {reader.stats()}")
+    if isinstance(cap, MJPEGCapture):
+        print(f"MJPEG stream stats: {cap.stats()}")
+    print(f"Motion backend cost: {motion_backend.cost()}")
+    if controller is not None:
+        print(f"Adaptive skip: {controller.stats()}")
+    reader.stop()
+    stop_writer_pool()
+    if replay:
+        print_replay_report(frames_processed, elapsed)
+    if METRICS_JSONL_PATH:
+        pipeline_metrics.write_jsonl(METRICS_JSONL_PATH)
+    pipeline_metrics.stop()
     cap.release()
-    cv2.destroyAllWindows()
+    if not headless:
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     main()
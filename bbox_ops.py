@@ -0,0 +1,88 @@
+# bbox_ops.py
+import numpy as np
+
+# Vectorised bounding box conversions on N x 4 arrays.
+# raw:  class_id image_w image_h x_tl y_tl x_br y_br (app.py capture labels)
+# voc:  x_tl y_tl x_br y_br in pixels
+# yolo: x_c y_c w h normalised to the image size
+
+
+# Split N x 7 raw capture labels into class ids, image sizes and VOC boxes
+def split_raw(raw):
+    raw = np.asarray(raw, dtype=np.int64).reshape(-1, 7)
+    return raw[:, 0], raw[:, 1:3], raw[:, 3:7]
+
+# VOC pixels -> YOLO (same arithmetic as pybboxes, so results are bit-identical)
+def voc_to_yolo(voc, image_w, image_h):
+    voc = np.asarray(voc, dtype=np.float64).reshape(-1, 4)
+    image_w = np.asarray(image_w, dtype=np.float64)
+    image_h = np.asarray(image_h, dtype=np.float64)
+    w = voc[:, 2] - voc[:, 0]
+    h = voc[:, 3] - voc[:, 1]
+    x_c = (voc[:, 0] + w / 2) / image_w
+    y_c = (voc[:, 1] + h / 2) / image_h
+    return np.stack([x_c, y_c, w / image_w, h / image_h], axis=1)
+
+# YOLO -> VOC pixels, rounded half to even like Python's round()
+def yolo_to_voc(yolo, image_w, image_h):
+    yolo = np.asarray(yolo, dtype=np.float64).reshape(-1, 4)
+    image_w = np.asarray(image_w, dtype=np.float64)
+    image_h = np.asarray(image_h, dtype=np.float64)
+    x_tl = (yolo[:, 0] - yolo[:, 2] / 2) * image_w
+    y_tl = (yolo[:, 1] - yolo[:, 3] / 2) * image_h
+    x_br = x_tl + yolo[:, 2] * image_w
+    y_br = y_tl + yolo[:, 3] * image_h
+    return np.rint(np.stack([x_tl, y_tl, x_br, y_br], axis=1)).astype(np.int64)
+
+# Horizontal offset of the square crop (side = crop_size) that keeps each box in
+# view, centred when possible (vectorised post_processer.crop_image)
+def square_crop_offsets(voc, image_w, crop_size):
+    voc = np.asarray(voc, dtype=np.int64).reshape(-1, 4)
+    image_w = np.broadcast_to(np.asarray(image_w, dtype=np.int64), (len(voc),))
+    crop_size = np.broadcast_to(np.asarray(crop_size, dtype=np.int64), (len(voc),))
+    crop_x = (image_w - crop_size) // 2
+    crop_x = np.where(voc[:, 0] < crop_x, voc[:, 0], np.where(voc[:, 2] > crop_x + crop_size, voc[:, 2] - crop_size, crop_x))
+    return crop_x
+
+# Shift boxes into crop coordinates and clip them to the crop (per-box or shared values)
+def apply_crop(voc, crop_x, crop_y, crop_w, crop_h):
+    voc = np.asarray(voc, dtype=np.int64).reshape(-1, 4)
+    x = np.clip(voc[:, [0, 2]] - np.reshape(crop_x, (-1, 1)), 0, np.reshape(crop_w, (-1, 1)))
+    y = np.clip(voc[:, [1, 3]] - np.reshape(crop_y, (-1, 1)), 0, np.reshape(crop_h, (-1, 1)))
+    return np.stack([x[:, 0], y[:, 0], x[:, 1], y[:, 1]], axis=1)
+
+# Mask of boxes that are ordered, non-degenerate and inside the image
+def valid_voc(voc, image_w, image_h):
+    voc = np.asarray(voc).reshape(-1, 4)
+    return ((voc[:, 0] >= 0) & (voc[:, 1] >= 0) & (voc[:, 0] < voc[:, 2]) & (voc[:, 1] < voc[:, 3])
+            & (voc[:, 2] <= image_w) & (voc[:, 3] <= image_h))
+
+# Mask of boxes whose YOLO -> VOC round trip lands within tolerance pixels
+def validate_roundtrip(voc, yolo, image_w, image_h, tolerance=0):
+    error = np.abs(yolo_to_voc(yolo, image_w, image_h) - np.asarray(voc).reshape(-1, 4)).max(axis=1)
+    return error <= tolerance
+
+# Box covering every box of each group (e.g. all boxes of one multi-object label)
+def union_boxes(voc, groups):
+    voc = np.asarray(voc, dtype=np.int64).reshape(-1, 4)
+    groups = np.asarray(groups, dtype=np.intp)
+    union = np.empty((int(groups.max()) + 1 if len(groups) else 0, 4), dtype=np.int64)
+    union[:, :2] = np.iinfo(np.int64).max
+    union[:, 2:] = np.iinfo(np.int64).min
+    np.minimum.at(union[:, :2], groups, voc[:, :2])
+    np.maximum.at(union[:, 2:], groups, voc[:, 2:])
+    return union
+
+# Full raw -> square crop -> YOLO conversion for many labels at once. Boxes
+# sharing a group id (one frame) share the crop that covers all of them.
+# Returns class ids, crop offsets, YOLO boxes and a mask of boxes that failed validation.
+def convert_raw_labels(raw, tolerance=0, groups=None):
+    class_ids, image_sizes, voc = split_raw(raw)
+    image_w, image_h = image_sizes[:, 0], image_sizes[:, 1]
+    crop_size = image_h  # square crops keep the full frame height
+    crop_voc = voc if groups is None else union_boxes(voc, groups)[groups]
+    crop_x = square_crop_offsets(crop_voc, image_w, crop_size)
+    cropped = apply_crop(voc, crop_x, 0, crop_size, image_h)
+    yolo = voc_to_yolo(cropped, crop_size, image_h)
+    ok = valid_voc(cropped, crop_size, image_h) & validate_roundtrip(cropped, yolo, crop_size, image_h, tolerance)
+    return class_ids, crop_x, yolo, ~ok
@@ -0,0 +1,5 @@
+# benchmarks/__main__.py
+from benchmarks.run import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+# benchmarks/run.py
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from benchmarks.synthetic import synthetic_frames, write_capture_set, write_video
+from config.configs import *
+
+# Full-resolution boxes (x1, y1, x2, y2) times this are scaled-frame boxes
+BOX_SCALE = np.array([SCALE_FRAME_WIDTH, SCALE_FRAME_HEIGHT, SCALE_FRAME_WIDTH, SCALE_FRAME_HEIGHT])
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Relative slowdown (or memory growth) above which a metric counts as a regression
+REGRESSION_TOLERANCE = 0.15
+
+# Workload sizes; --quick runs a smaller one for a fast smoke check
+SIZES = {
+    'full': {'width': 1280, 'height': 720, 'fps': 30, 'frames': 300, 'captures': 500},
+    'quick': {'width': 640, 'height': 360, 'fps': 30, 'frames': 60, 'captures': 100},
+}
+
+
+# Time fn() over items calls and return calls per second
+def throughput(fn, items, key):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {key: items / elapsed if elapsed else 0.0, 'seconds': elapsed}
+
+def bench_resize(frames):
+    def run():
+        for frame in frames:
+            cv2.resize(frame, (0, 0), fx=SCALE_FRAME_WIDTH, fy=SCALE_FRAME_HEIGHT)
+    return throughput(run, len(frames), 'frames_per_second')
+
+# Decoding camera JPEGs to the processing size: a full decode and resize, or a
+# DCT-domain reduced decode as the MJPEG reader does
+def bench_jpeg_decode(jpegs, reduced):
+    from mjpeg_reader import REDUCED_DECODE_FLAGS, decode_reduction
+
+    reduction = decode_reduction(SCALE_FRAME_WIDTH, SCALE_FRAME_HEIGHT) if reduced else 1
+    fx, fy = SCALE_FRAME_WIDTH * reduction, SCALE_FRAME_HEIGHT * reduction
+    def run():
+        for jpeg in jpegs:
+            frame = cv2.imdecode(jpeg, REDUCED_DECODE_FLAGS[reduction])
+            if fx != 1.0 or fy != 1.0:
+                cv2.resize(frame, (0, 0), fx=fx, fy=fy)
+    return throughput(run, len(jpegs), 'frames_per_second')
+
+def bench_motion(scaled_frames, backend_name):
+    from motion_backends import create_motion_backend
+
+    backend = create_motion_backend(backend_name)
+    def run():
+        for frame in scaled_frames:
+            backend.detect(frame)
+    return throughput(run, len(scaled_frames), 'frames_per_second')
+
+# Background decode thread delivering every frame of a video file
+def bench_capture(video_path):
+    from capture_reader import DROP_FIFO, CaptureReader
+
+    cap = cv2.VideoCapture(video_path)
+    reader = CaptureReader(cap, policy=DROP_FIFO, buffer_size=8, block=True, live=False)
+    delivered = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        reader.start()
+        while True:
+            ret, _ = reader.read()
+            if not ret:
+                break
+            delivered += 1
+    elapsed = time.perf_counter() - start
+    reader.stop()
+    cap.release()
+    return {'frames_per_second': delivered / elapsed if elapsed else 0.0, 'seconds': elapsed}
+
+def bench_tracks(boxes_per_frame):
+    from track_state import TrackStateStore
+
+    store = TrackStateStore(CONFIDENCE_LEVEL, CONSECUTIVE_FRAMES, MAX_SCREENSHOTS, TRACK_STATE_CAPACITY, TRACK_STATE_TTL_FRAMES)
+    count = len(boxes_per_frame[0])
+    class_names = [MODEL_CLASSES[i % len(MODEL_CLASSES)] for i in range(count)]
+    track_ids = list(range(count))
+    confidences = np.full(count, 0.9)
+    def run():
+        for _ in boxes_per_frame:
+            store.update(class_names, track_ids, confidences)
+    return throughput(run, len(boxes_per_frame), 'frames_per_second')
+
+def bench_dedup(scaled_frames, boxes_per_frame):
+    from phash_index import NearDuplicateFilter
+
+    duplicates = NearDuplicateFilter(DEDUP_MAX_DISTANCE, DEDUP_WINDOW)
+    crops = [frame[int(y1):int(y2), int(x1):int(x2)]
+             for frame, boxes in zip(scaled_frames, boxes_per_frame) for x1, y1, x2, y2 in (boxes * BOX_SCALE).tolist()]
+    def run():
+        for index, crop in enumerate(crops):
+            duplicates.check('object', crop, index)
+    return throughput(run, len(crops), 'checks_per_second')
+
+# Detection loop of app.py on ground-truth detections: gating, consecutive
+# counts, dedup and synchronous capture saves into workdir. width and height
+# are those of the scaled frames, the frame size app.py runs the model on.
+def bench_detection_loop(scaled_frames, boxes_per_frame, width, height, workdir):
+    import supervision as sv
+    import app
+
+    os.chdir(workdir)
+    app.writer_pool = None
+    app.create_directories()
+    state = app.DetectionState()
+
+    all_detections = []
+    for boxes in boxes_per_frame:
+        count = len(boxes)
+        class_ids = np.arange(count) % len(MODEL_CLASSES)
+        all_detections.append(sv.Detections(
+            xyxy=boxes * BOX_SCALE, confidence=np.full(count, 0.9), class_id=class_ids, tracker_id=np.arange(count),
+            data={'class_name': np.array([MODEL_CLASSES[i] for i in class_ids])}))
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for frame, detections in zip(scaled_frames, all_detections):
+                state.object_detection_active = True
+                app.process_detections(state, detections, frame, width, height)
+    return throughput(run, len(scaled_frames), 'frames_per_second')
+
+# Capture loop of app.py without a model: background decode, resize and the
+# motion gate, end to end over a video file
+def bench_motion_loop(video_path):
+    import app
+    from capture_reader import DROP_FIFO, CaptureReader
+    from motion_backends import create_motion_backend
+
+    cap = cv2.VideoCapture(video_path)
+    reader = CaptureReader(cap, policy=DROP_FIFO, buffer_size=CAPTURE_BUFFER_SIZE, block=True, live=False).start()
+    backend = create_motion_backend(MOTION_BACKEND)
+    state = app.DetectionState()
+    frames = 0
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        while True:
+            ret, frame = reader.read()
+            if not ret:
+                break
+            scaled_frame = cv2.resize(frame, (0, 0), fx=SCALE_FRAME_WIDTH, fy=SCALE_FRAME_HEIGHT)
+            motion_pixels, _ = app.detect_motion(scaled_frame, backend)
+            app.update_motion_gate(state, motion_pixels)
+            state.object_detection_active = False
+            frames += 1
+    elapsed = time.perf_counter() - start
+    reader.stop()
+    cap.release()
+    return {'frames_per_second': frames / elapsed if elapsed else 0.0, 'seconds': elapsed}
+
+def bench_postprocess(image_dir, label_dir, output_dir, workers):
+    from post_processer import process_folders
+
+    dirs = [os.path.join(output_dir, name) for name in ('images', 'labels', 'plots')]
+    for directory in dirs:
+        os.makedirs(directory, exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = process_folders([image_dir], [label_dir], *dirs, workers=workers)
+    return {'files_per_second': report['files_per_second'], 'seconds': report['elapsed'], 'failed': report['failed']}
+
+# GCS sync to the local filesystem stand-in bucket
+def bench_upload_gcs(local_dir, bucket_root, workers):
+    from google_upload import FilesystemClient, list_upload_jobs, upload_files
+
+    bucket = FilesystemClient(bucket_root).bucket('bench')
+    jobs = list_upload_jobs(local_dir, 'processed')
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = upload_files(bucket, jobs, workers)
+    return {'files_per_second': report['files_per_second'], 'megabytes_per_second': report['megabytes_per_second'],
+            'seconds': report['elapsed'], 'failed': report['failed']}
+
+# Roboflow upload path over HTTP against the local mock server, without rate limit or latency
+def bench_upload_roboflow(image_dir, label_dir, journal_path, workers):
+    import roboflow_uploader
+    from upload_journal import UploadJournal
+
+    mock = roboflow_uploader.MockRoboflowServer().start()
+    project = roboflow_uploader.HTTPProject(mock.url, 'mock', 'benchmark')
+    journal = UploadJournal(journal_path)
+    original_dirs = roboflow_uploader.PROCESSED_IMAGE_DIR, roboflow_uploader.PROCESSED_LABEL_DIR
+    roboflow_uploader.PROCESSED_IMAGE_DIR, roboflow_uploader.PROCESSED_LABEL_DIR = image_dir, label_dir
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = roboflow_uploader.upload_new_samples(project, journal, 'files', rate=0, concurrency=workers)
+    finally:
+        roboflow_uploader.PROCESSED_IMAGE_DIR, roboflow_uploader.PROCESSED_LABEL_DIR = original_dirs
+        journal.close()
+        mock.stop()
+    return {'files_per_second': report['samples_per_second'], 'seconds': report['elapsed'], 'failed': report['failed']}
+
+# Every benchmark as name -> callable(workdir); data is generated once up front
+def build_suite(size, suites, workers):
+    params = SIZES[size]
+    data_dir = tempfile.mkdtemp(prefix='bench_data_')
+    print(f"Generating synthetic data in {data_dir} ({params})")
+
+    generated = list(synthetic_frames(params['width'], params['height'], params['frames'], active_fraction=0.5))
+    frames = [frame for frame, _ in generated]
+    boxes_per_frame = [boxes for _, boxes in generated]
+    scaled_frames = [cv2.resize(frame, (0, 0), fx=SCALE_FRAME_WIDTH, fy=SCALE_FRAME_HEIGHT) for frame in frames]
+    video_path = write_video(os.path.join(data_dir, 'video.avi'), params['width'], params['height'], params['fps'],
+                             params['frames'], active_fraction=0.5)
+    scaled_height, scaled_width = scaled_frames[0].shape[:2]
+    image_dir, label_dir = write_capture_set(os.path.join(data_dir, 'original_data'), params['captures'], scaled_width, scaled_height)
+
+    benchmarks = {}
+    if 'stages' in suites:
+        jpegs = [cv2.imencode('.jpg', frame)[1] for frame in frames]
+        benchmarks['stage.resize'] = lambda workdir: bench_resize(frames)
+        benchmarks['stage.jpeg_decode.full'] = lambda workdir: bench_jpeg_decode(jpegs, False)
+        benchmarks['stage.jpeg_decode.reduced'] = lambda workdir: bench_jpeg_decode(jpegs, True)
+        for backend in ('mog2', 'knn', 'framediff'):
+            benchmarks[f'stage.motion.{backend}'] = lambda workdir, backend=backend: bench_motion(scaled_frames, backend)
+        benchmarks['stage.capture_decode'] = lambda workdir: bench_capture(video_path)
+        benchmarks['stage.track_update'] = lambda workdir: bench_tracks(boxes_per_frame)
+        benchmarks['stage.dedup'] = lambda workdir: bench_dedup(scaled_frames, boxes_per_frame)
+        benchmarks['stage.detection_loop'] = lambda workdir: bench_detection_loop(scaled_frames, boxes_per_frame, scaled_width, scaled_height, workdir)
+    if 'e2e' in suites:
+        processed_dir = os.path.join(data_dir, 'processed_data')
+        benchmarks['e2e.motion_loop'] = lambda workdir: bench_motion_loop(video_path)
+        benchmarks['e2e.postprocess'] = lambda workdir: bench_postprocess(image_dir, label_dir, processed_dir, workers)
+        benchmarks['e2e.upload_gcs'] = lambda workdir: bench_upload_gcs(processed_dir, os.path.join(workdir, 'gcs'), GCS_UPLOAD_WORKERS)
+        benchmarks['e2e.upload_roboflow'] = lambda workdir: bench_upload_roboflow(
+            os.path.join(processed_dir, 'images'), os.path.join(processed_dir, 'labels'), os.path.join(workdir, 'journal.sqlite3'), NUM_WORKERS)
+    return benchmarks, params, data_dir
+
+# Run one benchmark for its metrics, then once more under tracemalloc for the
+# peak Python heap (tracing slows the code, so it is not timed)
+def run_benchmark(fn, memory=True):
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench_run_') as workdir:
+            metrics = fn(workdir)
+        if memory:
+            with tempfile.TemporaryDirectory(prefix='bench_run_') as workdir:
+                tracemalloc.start()
+                fn(workdir)
+                metrics['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+    return metrics
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(size='full', suites=('stages', 'e2e'), workers=POSTPROCESS_WORKERS, memory=True, only=None):
+    benchmarks, params, data_dir = build_suite(size, suites, workers)
+    results = {}
+    try:
+        for name, fn in benchmarks.items():
+            if only and not any(name.startswith(prefix) for prefix in only):
+                continue
+            results[name] = run_benchmark(fn, memory)
+            print(f"{name:<28} " + '  '.join(f"{key} {value:.2f}" for key, value in results[name].items()))
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return {
+        'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(), 'size': size, 'params': params,
+                 'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+                 'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024},
+        'results': results,
+    }
+
+# +1 when larger is better, -1 when smaller is better, 0 for informational
+# metrics (wall time depends on the workload size, throughput does not)
+def metric_direction(metric):
+    if metric.endswith('_per_second'):
+        return 1
+    if metric.endswith(('_mb', '_ms')):
+        return -1
+    return 0
+
+# Metrics that got worse than the baseline by more than tolerance
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    rows = []
+    for name, metrics in results['results'].items():
+        for metric, value in metrics.items():
+            direction = metric_direction(metric)
+            previous = baseline['results'].get(name, {}).get(metric)
+            if not direction or previous is None:
+                continue
+            change = (value - previous) / previous if previous else 0.0
+            rows.append({'benchmark': name, 'metric': metric, 'baseline': previous, 'current': value, 'change': change,
+                         'regression': change * direction < -tolerance})
+    return rows
+
+def print_comparison(rows, baseline):
+    print(f"Compared with baseline {baseline['meta'].get('commit')} ({baseline['meta'].get('time')}):")
+    for row in rows:
+        flag = 'REGRESSION' if row['regression'] else ''
+        print(f"  {row['benchmark']:<28} {row['metric']:<22} {row['baseline']:10.2f} -> {row['current']:10.2f} {row['change']:+7.1%}  {flag}")
+    regressions = sum(row['regression'] for row in rows)
+    print(f"{regressions} regression(s) beyond {REGRESSION_TOLERANCE:.0%}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic data")
+    parser.add_argument('--quick', action='store_true', help="Small workload for a fast smoke check")
+    parser.add_argument('--suite', choices=('stages', 'e2e', 'all'), default='all')
+    parser.add_argument('--only', nargs='+', help="Only run benchmarks whose name starts with one of these prefixes")
+    parser.add_argument('--workers', type=int, default=POSTPROCESS_WORKERS, help="Post-processing worker processes")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the peak memory pass")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline results to compare with")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 when a regression is flagged")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    suites = ('stages', 'e2e') if args.suite == 'all' else (args.suite,)
+    results = run_suite('quick' if args.quick else 'full', suites, args.workers, not args.no_memory, args.only)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+    regressions = []
+    if os.path.isfile(args.baseline) and not args.update_baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('size') != results['meta']['size']:
+            print(f"Baseline was recorded with size {baseline['meta'].get('size')}, not comparing")
+        else:
+            rows = compare(results, baseline)
+            print_comparison(rows, baseline)
+            regressions = [row for row in rows if row['regression']]
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if regressions and args.fail_on_regression:
+        raise SystemExit(1)
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/synthetic.py
+import os
+import cv2
+import numpy as np
+from config.configs import *
+
+
+# Frames of rectangles moving over a noisy textured background. Objects bounce
+# off the frame edges; with active_fraction < 1 they only move during the first
+# part of every cycle, so the motion gate sees idle and busy stretches.
+def synthetic_frames(width=1280, height=720, frames=300, objects=3, noise=8.0, object_size=0.12,
+                     speed=6.0, active_fraction=1.0, cycle=150, seed=0):
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(40, 200, (height, width, 3), dtype=np.uint8), (0, 0), 9)
+    sizes = (rng.uniform(0.5, 1.0, (objects, 2)) * object_size * min(width, height)).astype(int) + 8
+    positions = rng.uniform(0, 1, (objects, 2)) * ([width, height] - sizes)
+    velocities = rng.uniform(-1, 1, (objects, 2)) * speed
+    colors = rng.integers(0, 255, (objects, 3))
+
+    for index in range(frames):
+        if (index % cycle) < active_fraction * cycle:
+            positions += velocities
+            bounced = (positions < 0) | (positions > [width, height] - sizes)
+            velocities[bounced] *= -1
+            positions = np.clip(positions, 0, [width, height] - sizes)
+
+        frame = background.copy()
+        for (x, y), (w, h), color in zip(positions.astype(int).tolist(), sizes.tolist(), colors.tolist()):
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, -1)
+        if noise:
+            frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+        boxes = np.concatenate([positions, positions + sizes], axis=1)
+        yield frame, boxes
+
+# Write a synthetic video file (or a directory of frames when path has no
+# extension, the layout ImageSequenceCapture replays) and return its path
+def write_video(path, width=1280, height=720, fps=30, frames=300, **kwargs):
+    if not os.path.splitext(path)[1]:
+        os.makedirs(path, exist_ok=True)
+        for index, (frame, _) in enumerate(synthetic_frames(width, height, frames, **kwargs)):
+            cv2.imwrite(os.path.join(path, f"{index:06d}.jpg"), frame)
+        return path
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Unable to open a video writer for {path}")
+    for frame, _ in synthetic_frames(width, height, frames, **kwargs):
+        writer.write(frame)
+    writer.release()
+    return path
+
+# Synthetic original_data capture set: scaled frames named and labelled the way
+# app.py saves them (one raw label line per object, in scaled-frame pixels)
+def write_capture_set(directory, count=500, width=640, height=360, objects_per_image=1, jpeg_quality=95, seed=0):
+    image_dir = os.path.join(directory, 'images')
+    label_dir = os.path.join(directory, 'labels')
+    os.makedirs(image_dir, exist_ok=True)
+    os.makedirs(label_dir, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    frames = synthetic_frames(width, height, count, objects=objects_per_image, speed=12.0, seed=seed)
+    for index, (frame, boxes) in enumerate(frames):
+        class_ids = rng.integers(0, len(MODEL_CLASSES), len(boxes))
+        class_name = MODEL_CLASSES[class_ids[0]]
+        confidence = rng.uniform(CONFIDENCE_LEVEL, 1.0)
+        basename = f"{class_name}_{class_ids[0]}_{confidence:.6}_{index}_SSC_1"
+        cv2.imwrite(os.path.join(image_dir, basename + '.jpg'), frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        lines = [f"{class_id} {width} {height} {x1} {y1} {x2} {y2}"
+                 for class_id, (x1, y1, x2, y2) in zip(class_ids.tolist(), boxes.astype(int).tolist())]
+        with open(os.path.join(label_dir, basename + '.txt'), 'w') as f:
+            f.write('\n'.join(lines))
+    return image_dir, label_dir
@@ -0,0 +1,212 @@
+# capture_reader.py
+import os
+import threading
+import time
+from collections import deque
+import cv2
+
+# Drop policies for the capture buffer. Every policy keeps one frame, then
+# grabs (but doesn't decode) the next `skip` frames.
+DROP_LATEST = 'latest'  # keep only the newest kept frame
+DROP_FIFO = 'fifo'      # bounded FIFO of kept frames, oldest dropped when full
+DROP_NTH = 'nth'        # same buffer as 'fifo', from when only this policy skipped frames
+
+DROP_POLICIES = (DROP_LATEST, DROP_NTH, DROP_FIFO)
+
+
+# Decodes frames on a background thread into a bounded ring buffer so slow
+# inference on the consumer side never lets the camera backlog build up
+class CaptureReader:
+
+    def __init__(self, cap, policy=DROP_LATEST, buffer_size=4, skip=0, max_frame_age=1.0, metrics=None, stream=None, block=False, live=True, defer_decode=None):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy} (expected one of {DROP_POLICIES})")
+
+        self.cap = cap
+        self.policy = policy
+        self.skip = skip
+        self.frames_to_skip = 0
+        # Sources that can hand out the encoded frame (MJPEGCapture) are decoded
+        # by the consumer, so frames dropped from the buffer are never decoded
+        self.defer_decode = hasattr(cap, 'retrieve_encoded') if defer_decode is None else defer_decode
+        self.max_frame_age = max_frame_age
+        self.block = block  # wait for the consumer instead of dropping (offline replay)
+        self.live = live    # the end of a recording is not an error
+        self.metrics = metrics
+        self.stream = stream
+
+        maxlen = 1 if policy == DROP_LATEST else max(1, buffer_size)
+        self.buffer = deque(maxlen=maxlen)
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+        # Counters
+        self.frames_grabbed = 0
+        self.frames_decoded = 0
+        self.frames_delivered = 0
+        self.frames_dropped = 0
+        self.frames_stale = 0
+        self.last_frame_time = None
+        self.last_frame_index = None
+        self.start_time = None
+
+    def start(self):
+        self.running = True
+        self.start_time = time.monotonic()
+        self.thread = threading.Thread(target=self._run, name='capture-reader', daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while self.running:
+            start = time.perf_counter()
+            if not self.cap.grab():
+                if self.live:
+                    print("Error: Unable to grab frame")
+                break
+            self.frames_grabbed += 1
+
+            # Keep one frame, then grab the next `skip` without decoding them
+            if self.frames_to_skip > 0:
+                self.frames_to_skip -= 1
+                self.frames_dropped += 1
+                continue
+            self.frames_to_skip = self.skip
+
+            if self.defer_decode:
+                ret, frame = self.cap.retrieve_encoded()
+            else:
+                ret, frame = self.cap.retrieve()
+            if not ret:
+                print("Error: Unable to decode frame")
+                break
+            if not self.defer_decode:
+                self.frames_decoded += 1
+            if self.metrics is not None:
+                self.metrics.observe('grab', (time.perf_counter() - start) * 1000, self.stream)
+
+            with self.condition:
+                if self.block:
+                    self.condition.wait_for(lambda: len(self.buffer) < self.buffer.maxlen or not self.running)
+                if len(self.buffer) == self.buffer.maxlen:
+                    self.frames_dropped += 1
+                self.buffer.append((time.monotonic(), self.frames_grabbed - 1, frame))
+                self.condition.notify()
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+    # Block until a frame is available, mirrors cv2.VideoCapture.read()
+    def read(self, timeout=None):
+        while True:
+            with self.condition:
+                if not self.condition.wait_for(lambda: self.buffer or not self.running, timeout=timeout):
+                    return False, None
+                if not self.buffer:
+                    return False, None
+                timestamp, index, frame = self.buffer.popleft()
+                self.condition.notify_all()
+
+            if not self.defer_decode:
+                break
+            start = time.perf_counter()
+            ret, frame = self.cap.decode(frame)
+            if self.metrics is not None:
+                self.metrics.observe('decode', (time.perf_counter() - start) * 1000, self.stream)
+            if ret:
+                self.frames_decoded += 1
+                break
+            # A corrupt JPEG is skipped, the stream carries on with the next one
+            print("Error: Unable to decode frame")
+            self.frames_dropped += 1
+
+        self.frames_delivered += 1
+        self.last_frame_time = timestamp
+        self.last_frame_index = index
+        if time.monotonic() - timestamp > self.max_frame_age:
+            self.frames_stale += 1
+        return True, frame
+
+    # Change the number of frames grabbed without decoding after each kept frame
+    def set_skip(self, skip):
+        self.skip = skip
+
+    # Frame rate the source is actually delivering, for streams that report none
+    def capture_fps(self):
+        elapsed = time.monotonic() - self.start_time if self.start_time is not None else 0.0
+        return self.frames_grabbed / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        return {
+            'grabbed': self.frames_grabbed,
+            'decoded': self.frames_decoded,
+            'delivered': self.frames_delivered,
+            'dropped': self.frames_dropped,
+            'stale': self.frames_stale,
+            'buffered': len(self.buffer),
+            'skip': self.skip,
+        }
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+
+
+# Image sequence with the subset of the cv2.VideoCapture interface used by the
+# pipeline, so a directory of frames can be replayed like a recorded video
+class ImageSequenceCapture:
+
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, directory, fps=30):
+        self.paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                            if name.lower().endswith(self.IMAGE_EXTENSIONS))
+        self.fps = fps
+        self.position = -1
+        self.shape = None
+        if self.paths:
+            first = cv2.imread(self.paths[0])
+            self.shape = first.shape if first is not None else None
+
+    def isOpened(self):
+        return self.shape is not None
+
+    def grab(self):
+        if self.position + 1 >= len(self.paths):
+            return False
+        self.position += 1
+        return True
+
+    def retrieve(self):
+        if not 0 <= self.position < len(self.paths):
+            return False, None
+        frame = cv2.imread(self.paths[self.position])
+        return frame is not None, frame
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.shape[1] if self.shape else 0
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.shape[0] if self.shape else 0
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.paths)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position + 1
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return max(self.position, 0) * 1000.0 / self.fps
+        return 0
+
+    def release(self):
+        self.paths = []
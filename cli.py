@@ -0,0 +1,91 @@
+# cli.py
+import argparse
+import importlib
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Subcommand -> (module whose main(argv) runs it, help). Modules are imported
+# only when their subcommand runs, so a command never pays for the heavy
+# dependencies (torch, ultralytics, supervision, cloud SDKs) of another.
+COMMANDS = {
+    'capture': ('app', "Motion-gated YOLO-World capture (app.py)"),
+    'multi-camera': ('multi_camera', "Capture from several cameras with one shared model (multi_camera.py)"),
+    'postprocess': ('post_processer', "Crop captures and write YOLO labels (post_processer.py)"),
+    'upload-gcs': ('google_upload', "Incremental sync to Google Cloud Storage (google_upload.py)"),
+    'upload-roboflow': ('roboflow_uploader', "Upload new samples to Roboflow (roboflow_uploader.py)"),
+    'dedup': ('phash_index', "Find near-duplicate captures (phash_index.py)"),
+    'labels': ('label_index', "Index labels, dataset statistics and validation (label_index.py)"),
+    'shards': ('shard_store', "Pack/unpack shard stores (shard_store.py)"),
+    'embeddings': ('embedding_cache', "Build/list class embedding caches (embedding_cache.py)"),
+    'mjpeg': ('mjpeg_reader', "Serve a JPEG sequence as an MJPEG stream / probe a stream (mjpeg_reader.py)"),
+    'backend': ('inference_backend', "Export/benchmark ONNX and OpenVINO models (inference_backend.py)"),
+    'benchmarks': ('benchmarks.run', "Pipeline benchmarks on synthetic data (benchmarks/run.py)"),
+}
+
+# Startup budget for short jobs, checked by `cli.py bench`
+STARTUP_TARGET_SECONDS = 1.0
+
+
+def run_command(name, argv):
+    module_name = COMMANDS[name][0]
+    module = importlib.import_module(module_name)
+    return module.main(argv)
+
+# Wall-clock time from process start to parsed arguments for every subcommand
+# (`--help` imports the module and exits), against a bare interpreter
+def benchmark_startup(commands, repeats=5):
+    cli_path = os.path.abspath(__file__)
+    cwd = os.path.dirname(cli_path)
+    runs = [('python', [sys.executable, '-c', 'pass'])]
+    runs += [(name, [sys.executable, cli_path, name, '--help']) for name in commands]
+
+    report = []
+    for name, command in runs:
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            times.append(time.perf_counter() - start)
+        error = result.stderr.decode('utf-8', 'replace').strip().splitlines()[-1:] if result.returncode else []
+        report.append({'command': name, 'median_seconds': statistics.median(times), 'min_seconds': min(times),
+                       'error': error[0] if error else None})
+    return report
+
+def print_startup_report(report, target=STARTUP_TARGET_SECONDS):
+    print(f"{'command':<16} {'median s':>9} {'min s':>7}")
+    for row in report:
+        if row['error']:
+            status = f"error: {row['error']}"
+        else:
+            status = 'ok' if row['median_seconds'] <= target else f"over {target:.1f}s"
+        print(f"{row['command']:<16} {row['median_seconds']:9.3f} {row['min_seconds']:7.3f}  {status}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dataset capture pipeline", prog='cli.py')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        # Every argument (including --help) is passed through to the module
+        subparsers.add_parser(name, help=help_text, add_help=False)
+    bench = subparsers.add_parser('bench', help="Measure the startup time of every subcommand")
+    bench.add_argument('commands', nargs='*', default=list(COMMANDS), help="Subcommands to measure (default: all)")
+    bench.add_argument('--repeats', type=int, default=5)
+    args, module_argv = parser.parse_known_args(argv)
+    if args.command == 'bench':
+        unknown = [name for name in args.commands if name not in COMMANDS] + module_argv
+        if unknown:
+            parser.error(f"unrecognized arguments: {' '.join(unknown)}")
+    return args, module_argv
+
+def main(argv=None):
+    args, module_argv = parse_args(argv)
+    if args.command == 'bench':
+        report = benchmark_startup(args.commands, args.repeats)
+        print_startup_report(report)
+        return report
+    return run_command(args.command, module_argv)
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,11 @@
 # Video source URL
 VIDEO_SOURCE = 'http://192.168.4.24:8080/video'
 
+# Video source URLs for multi-camera mode (multi_camera.py)
+VIDEO_SOURCES = [VIDEO_SOURCE]
+MULTI_CAMERA_READ_TIMEOUT = 0.05  # seconds a tick waits when no camera has a frame ready
+MULTI_CAMERA_DISPLAY = False
+
 # Model settings
 MODEL_CLASSES = ['lamp', 'chair']
 
@@ -15,9 +20,26 @@ BG_HISTORY = 300
 BG_THRESHOLD = 100
 BG_SHADOWS = True
 
+# Motion detection backend: 'mog2', 'knn', 'framediff' or 'roi'
+MOTION_BACKEND = 'mog2'
+KNN_THRESHOLD = 400.0  # KNN squared distance threshold
+MOTION_DOWNSCALE = 0.25  # extra downscale applied by the frame-difference backend
+FRAME_DIFF_THRESHOLD = 25  # grey-level change that counts as motion
+MOTION_ROIS = []  # (x, y, w, h) regions in scaled-frame pixels evaluated by the roi backend
+MOTION_MASK_PATH = None  # optional mask image, non-zero pixels are evaluated by the roi backend
+MOTION_ROI_BACKEND = 'mog2'  # backend the roi mode runs inside the regions
+
 # Confidence level and consecutive frames
 CONFIDENCE_LEVEL = 0.70
 CONSECUTIVE_FRAMES = 30
+# Count consecutive detections in stream seconds instead of frames when set.
+# With ADAPTIVE_SKIP and no value, it is CONSECUTIVE_FRAMES at the initial skip.
+CONSECUTIVE_SECONDS = None
+
+# Track state store: tracks unseen for TTL detection frames are evicted, least
+# recently seen tracks are evicted beyond CAPACITY
+TRACK_STATE_CAPACITY = 1024
+TRACK_STATE_TTL_FRAMES = 60
 
 # Frame scaling factors
 SCALE_FRAME_WIDTH = 0.5
@@ -27,6 +49,71 @@ SCALE_FRAME_HEIGHT = 0.5
 FRAMES_TO_SKIP = 3
 MAX_SCREENSHOTS = 2
 
+# Adaptive frame skipping (adaptive_skip.py): the reader skip follows the
+# processing cost to keep the loop within a lag budget of the stream, with one
+# budget for motion-only frames and one for detection frames. FRAMES_TO_SKIP
+# is the initial skip.
+ADAPTIVE_SKIP = False
+MOTION_LAG_BUDGET = 0.1  # seconds
+ACTIVE_LAG_BUDGET = 0.5  # seconds
+ADAPTIVE_MAX_SKIP = 30
+ADAPTIVE_SMOOTHING = 0.2  # weight of the newest frame in the smoothed cost
+
+# Motion-region inference (motion_regions.py): once the gate is open, YOLO runs
+# on padded full-resolution crops around the moving regions of the motion mask
+# instead of the whole scaled frame. Detections are tracked with ByteTrack.
+REGION_INFERENCE = False
+REGION_MIN_AREA = 400  # full-resolution pixels of motion for a region to count
+REGION_DILATE = 15  # mask pixels, joins nearby blobs into one region
+REGION_PADDING = 0.25  # fraction of the region size added on every side
+REGION_MIN_SIZE = 320  # smallest crop side in full-resolution pixels
+REGION_MAX_COUNT = 4  # more regions than this run on the full frame
+REGION_MAX_COVERAGE = 0.5  # regions covering more of the frame run on the full frame
+
+# Per-frame capture: save one image per frame, labelled with every confident
+# detection in it, instead of one image copy per detection that is ready
+CAPTURE_PER_FRAME = False
+
+# Near-duplicate suppression: a capture whose object crop is within
+# DEDUP_MAX_DISTANCE bits (64-bit dHash) of one of the last DEDUP_WINDOW
+# captures of the same class from another track is not saved (phash_index.py)
+DEDUP_ENABLED = True
+DEDUP_MAX_DISTANCE = 4
+DEDUP_WINDOW = 256
+
+# Capture reader settings
+CAPTURE_DROP_POLICY = 'latest'  # 'latest' or 'fifo' ('nth' is an alias); FRAMES_TO_SKIP applies to both
+CAPTURE_BUFFER_SIZE = 4
+CAPTURE_MAX_FRAME_AGE = 1.0  # seconds before a delivered frame counts as stale
+REPLAY_FPS = 30  # nominal frame rate of image directories replayed with --replay
+
+# Native MJPEG-over-HTTP reader (mjpeg_reader.py) for http(s) sources such as the
+# IP Webcam /video endpoint: JPEGs dropped by the capture reader are never
+# decoded and kept ones are decoded straight at the scaled frame size. Sources
+# that are not multipart MJPEG fall back to cv2.VideoCapture.
+MJPEG_NATIVE_READER = True
+MJPEG_REDUCED_DECODE = True  # decode at 1/2, 1/4 or 1/8 scale (not with REGION_INFERENCE, which needs full resolution)
+MJPEG_TIMEOUT = 5.0  # seconds without data before the stream counts as broken
+MJPEG_RECONNECT_DELAY = 1.0  # seconds before the first reconnect, doubled for every failed attempt
+MJPEG_RECONNECT_MAX_DELAY = 30.0
+MJPEG_RECONNECT_ATTEMPTS = None  # None keeps retrying forever
+MJPEG_STARTUP_RETRIES = 3  # failed opens retried at startup before the camera counts as unavailable (None retries forever)
+MJPEG_FPS_PROBE_FRAMES = 10  # frames read on open to measure the camera frame rate
+
+# Asynchronous screenshot/label writer settings
+WRITER_ASYNC = True
+WRITER_WORKERS = 2
+WRITER_QUEUE_SIZE = 64
+WRITER_BACKPRESSURE = 'block'  # 'block', 'drop_oldest' or 'spill'
+WRITER_SPILL_DIR = 'spill_data/'  # local directory used by the 'spill' policy
+WRITER_FLUSH_TIMEOUT = 30  # seconds to wait for pending writes on exit
+
+# Pipeline metrics (Prometheus endpoint and/or periodic JSONL dump)
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = None  # e.g. 9108 to serve Prometheus metrics at /metrics
+METRICS_JSONL_PATH = None  # e.g. 'metrics.jsonl'
+METRICS_JSONL_INTERVAL = 10  # seconds between JSONL snapshots
+
 # Directory paths
 ORIGINAL_IMAGE_DIR = 'original_data/images/'
 ORIGINAL_LABEL_DIR = 'original_data/labels/'
@@ -37,11 +124,61 @@ PROCESSED_DIR = 'processed_data/'
 
 PLOT_IMAGE_DIR = 'plot_data/'
 
+# Capture storage: 'files' (one image and label file per capture) or 'shards'
+# (samples appended to size-bounded tar shards with a JSONL index, shard_store.py)
+STORAGE_BACKEND = 'files'
+ORIGINAL_SHARD_DIR = 'original_data/shards/'
+PROCESSED_SHARD_DIR = 'processed_data/shards/'
+SHARD_MAX_BYTES = 256 * 1024 * 1024
+SHARD_MAX_SAMPLES = 10000
+
+# Streaming mode: crop and write YOLO labels straight to processed_data from
+# the capture loop instead of saving originals for post_processer.py
+STREAMING_POSTPROCESS = False
+STREAMING_SAVE_PLOTS = False
+
+# Post-processing settings
+POSTPROCESS_WORKERS = None  # None uses every CPU core
+POSTPROCESS_CHUNKSIZE = 16
+POSTPROCESS_MANIFEST_PATH = 'postprocess_manifest.json'  # records processed inputs for incremental runs
+POSTPROCESS_LABELS_MANIFEST_PATH = 'postprocess_labels_manifest.json'  # same for --labels-only runs
+POSTPROCESS_MANIFEST_SAVE_INTERVAL = 30.0  # seconds between manifest saves during a run
+POSTPROCESS_VERSION = 1  # bump when the crop/label logic changes to reprocess everything
+
 MODEL_PATH = 'model/yolov8s-worldv2.pt'
 TRACKER_CONFIG_PATH = 'config/bytetrack.yaml'
+EMBEDDING_CACHE_DIR = 'model/embeddings/'  # cached class text embeddings (embedding_cache.py), None to always run CLIP
+
+# Inference backend (inference_backend.py): 'torch' runs the weights in PyTorch,
+# 'onnx' and 'openvino' export the model with MODEL_CLASSES fixed once, cache
+# the artifact next to MODEL_PATH and run it on the CPU-optimized runtime
+INFERENCE_BACKEND = 'torch'
+INFERENCE_INT8 = False  # quantize the exported model, calibrated on our own captures
+INFERENCE_IMGSZ = 640
+INFERENCE_CALIBRATION_DIR = PROCESSED_IMAGE_DIR
+INFERENCE_CALIBRATION_IMAGES = 300
+
+# Label index (label_index.py): memory-mapped columns of every label box and
+# image size, for dataset statistics and validation without re-reading files
+LABEL_INDEX_DIR = 'label_index/'
+LABEL_MIN_BOX_SIZE = 2  # pixels, smaller boxes count as degenerate
+
+# Google Cloud Storage upload settings (google_upload.py)
+GCS_UPLOAD_WORKERS = 16  # concurrent uploads sharing one client
+GCS_RESUMABLE_THRESHOLD = 8 * 1024 * 1024  # files larger than this use resumable uploads
+GCS_CHUNK_SIZE = 8 * 1024 * 1024  # resumable chunk size, a multiple of 256 KB
+GCS_UPLOAD_RETRIES = 5
+GCS_RETRY_BACKOFF = 1.0  # seconds before the first retry, doubled for every retry
+GCS_JOURNAL_PATH = 'upload_journal.sqlite3'  # durable record of confirmed uploads for incremental syncs
+GCS_JOURNAL_BATCH_SIZE = 200  # journal rows per commit
 
 # Roboflow upload configs
 NUM_WORKERS = 10
 DATASET_FORMAT = "yolov8"
 PROJECT_LICENSE = "MIT"
 PROJECT_TYPE = "object-detection"
+ROBOFLOW_BATCH_SIZE = 500  # samples per Roboflow upload batch
+ROBOFLOW_RATE_LIMIT = 5.0  # uploads per second across all workers (0 disables the limit)
+ROBOFLOW_RETRIES = 3  # SDK retries per image upload
+ROBOFLOW_JOURNAL_PATH = 'roboflow_journal.sqlite3'  # samples already uploaded to Roboflow
+ROBOFLOW_JOURNAL_BATCH_SIZE = 50  # journal rows per commit
@@ -0,0 +1,151 @@
+# embedding_cache.py
+import argparse
+import hashlib
+import json
+import os
+import time
+from config.configs import *
+
+# Text encoder YOLOWorld.set_classes runs, part of the cache key
+TEXT_MODEL = 'ViT-B/32'
+
+# Background class YOLOWorld.set_classes drops from the class names
+BACKGROUND_CLASS = ' '
+
+
+def weights_digest(weights_path):
+    sha256 = hashlib.sha256()
+    with open(weights_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+# One cache file per (weights, class list, text encoder); class order matters
+def cache_path(cache_dir, digest, classes):
+    key = json.dumps({'weights': digest, 'classes': list(classes), 'text_model': TEXT_MODEL})
+    return os.path.join(cache_dir, hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.pt')
+
+def save_embeddings(path, digest, classes, txt_feats):
+    import torch
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save({'weights': digest, 'classes': list(classes), 'text_model': TEXT_MODEL,
+                'txt_feats': txt_feats.detach().cpu().float()}, temp_path)
+    os.replace(temp_path, path)
+
+# Cached text embeddings for the classes, or None if missing, unreadable or
+# written for another class list
+def load_embeddings(path, classes):
+    if not os.path.isfile(path):
+        return None
+    import torch
+
+    try:
+        entry = torch.load(path, map_location='cpu', weights_only=True)
+    except Exception as e:
+        print(f"Ignoring unreadable embedding cache {path}: {e}")
+        return None
+    if entry.get('classes') != list(classes) or entry.get('text_model') != TEXT_MODEL:
+        return None
+    return entry['txt_feats']
+
+# What YOLOWorld.set_classes does after the text encoder has run
+def apply_embeddings(model, classes, txt_feats):
+    model.model.txt_feats = txt_feats
+    model.model.model[-1].nc = len(classes)
+    names = [name for name in classes if name != BACKGROUND_CLASS]
+    model.model.names = names
+    if model.predictor:
+        model.predictor.model.names = names
+
+# Run the text encoder once and release it again, so it does not stay in memory
+def encode_classes(model, classes):
+    model.set_classes(list(classes))
+    if hasattr(model.model, 'clip_model'):
+        del model.model.clip_model
+    return model.model.txt_feats
+
+# Set the model classes from the cache, encoding and caching them on a miss.
+# Returns True on a cache hit.
+def set_classes_cached(model, weights_path, classes, cache_dir=EMBEDDING_CACHE_DIR):
+    digest = weights_digest(weights_path)
+    path = cache_path(cache_dir, digest, classes)
+    txt_feats = load_embeddings(path, classes)
+    if txt_feats is not None:
+        apply_embeddings(model, classes, txt_feats)
+        return True
+
+    txt_feats = encode_classes(model, classes)
+    save_embeddings(path, digest, classes, txt_feats)
+    return False
+
+# Pre-build the caches of several class vocabularies with one model load
+def build_caches(weights_path, vocabularies, cache_dir=EMBEDDING_CACHE_DIR):
+    from ultralytics import YOLOWorld
+
+    model = YOLOWorld(weights_path)
+    digest = weights_digest(weights_path)
+    built = []
+    for classes in vocabularies:
+        path = cache_path(cache_dir, digest, classes)
+        if load_embeddings(path, classes) is None:
+            save_embeddings(path, digest, classes, encode_classes(model, classes))
+            built.append(path)
+            print(f"Cached {classes} -> {path}")
+        else:
+            print(f"Already cached {classes} -> {path}")
+    return built
+
+# Class vocabularies from --classes arguments and/or a file with one
+# comma-separated vocabulary per line
+def read_vocabularies(class_lists, vocab_file=None):
+    lines = list(class_lists or [])
+    if vocab_file:
+        with open(vocab_file, 'r') as f:
+            lines.extend(line for line in f if line.strip() and not line.startswith('#'))
+    return [[name.strip() for name in line.split(',') if name.strip()] for line in lines]
+
+def list_caches(cache_dir=EMBEDDING_CACHE_DIR):
+    import torch
+
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+    for filename in sorted(os.listdir(cache_dir)):
+        if not filename.endswith('.pt'):
+            continue
+        entry = torch.load(os.path.join(cache_dir, filename), map_location='cpu', weights_only=True)
+        entries.append((filename, entry['weights'][:12], entry['classes']))
+    return entries
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cache YOLO-World class text embeddings")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="Encode and cache class vocabularies")
+    build.add_argument('--weights', default=MODEL_PATH, help="YOLO-World weights the embeddings are for")
+    build.add_argument('--classes', action='append', help="Comma-separated class list (repeatable, default: MODEL_CLASSES)")
+    build.add_argument('--vocab-file', help="File with one comma-separated class list per line")
+    build.add_argument('--cache-dir', default=EMBEDDING_CACHE_DIR)
+    listing = subparsers.add_parser('list', help="List cached vocabularies")
+    listing.add_argument('--cache-dir', default=EMBEDDING_CACHE_DIR)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'list':
+        entries = list_caches(args.cache_dir)
+        for filename, digest, classes in entries:
+            print(f"{filename}  weights {digest}  {classes}")
+        return entries
+
+    vocabularies = read_vocabularies(args.classes, args.vocab_file)
+    if not vocabularies:
+        vocabularies = [MODEL_CLASSES]
+    start_time = time.perf_counter()
+    built = build_caches(args.weights, vocabularies, args.cache_dir)
+    print(f"Built {len(built)} of {len(vocabularies)} embedding caches in {time.perf_counter() - start_time:.2f}s")
+    return built
+
+if __name__ == "__main__":
+    main()
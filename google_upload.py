@@ -1,105 +1,421 @@
+import argparse
+import base64
+import hashlib
 import os
 import csv
+import random
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
-from google.cloud import storage
+from functools import partial
+from shard_store import INDEX_NAME, sealed_shards
+from upload_journal import CONFIRMED_STATUSES, UploadJournal
+from config.configs import *
 
-def upload_to_gcs(bucket_name, source_file_path, destination_blob_name, credentials_file):
-    try:
-        # Initialize the Google Cloud Storage client with the credentials
+try:
+    import google_crc32c  # installed with google-cloud-storage
+except ImportError:
+    google_crc32c = None
+
+# Replace the following variables with your specific values
+BUCKET_NAME = "your-bucket-name"
+CREDENTIALS_FILE = "path/to/your/credentials.json"
+LOG_CSV_PATH = "upload_log.csv"
+
+# Define GCS directory paths
+ORIGINAL_IMAGE_GCS_DIR = 'original_data/images'
+ORIGINAL_LABEL_GCS_DIR = 'original_data/labels'
+PROCESSED_IMAGE_GCS_DIR = 'processed_data/images'
+PROCESSED_LABEL_GCS_DIR = 'processed_data/labels'
+ORIGINAL_SHARD_GCS_DIR = 'original_data/shards'
+PROCESSED_SHARD_GCS_DIR = 'processed_data/shards'
+
+# Local directories and the GCS directories they are uploaded to
+UPLOAD_DIRECTORIES = [
+    (ORIGINAL_IMAGE_DIR, ORIGINAL_IMAGE_GCS_DIR),
+    (ORIGINAL_LABEL_DIR, ORIGINAL_LABEL_GCS_DIR),
+    (PROCESSED_IMAGE_DIR, PROCESSED_IMAGE_GCS_DIR),
+    (PROCESSED_LABEL_DIR, PROCESSED_LABEL_GCS_DIR),
+]
+
+# Shard stores (STORAGE_BACKEND = 'shards'): only sealed shards are uploaded,
+# the shard still being written is left alone
+SHARD_UPLOAD_DIRECTORIES = [
+    (ORIGINAL_SHARD_DIR, ORIGINAL_SHARD_GCS_DIR),
+    (PROCESSED_SHARD_DIR, PROCESSED_SHARD_GCS_DIR),
+]
+
+# HTTP status codes worth retrying
+TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+# Base64 MD5 and CRC32C of a file, in the format GCS reports them
+# (CRC32C is None when google-crc32c is not installed)
+def file_checksums(path):
+    md5 = hashlib.md5()
+    crc32c = google_crc32c.Checksum() if google_crc32c is not None else None
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            md5.update(block)
+            if crc32c is not None:
+                crc32c.update(block)
+    return (base64.b64encode(md5.digest()).decode('ascii'),
+            base64.b64encode(crc32c.digest()).decode('ascii') if crc32c is not None else None)
+
+# Same size and at least one matching checksum (composite objects have no MD5)
+def checksums_match(size, md5, crc32c, remote_size, remote_md5, remote_crc32c):
+    if size != remote_size:
+        return False
+    return (md5 is not None and md5 == remote_md5) or (crc32c is not None and crc32c == remote_crc32c)
+
+
+# Filesystem-backed stand-in for storage.Client. Objects are written below
+# root/<bucket>/, so the upload engine can be exercised without GCS access.
+class FilesystemClient:
+
+    def __init__(self, root):
+        self.root = root
+
+    def bucket(self, bucket_name):
+        return FilesystemBucket(os.path.join(self.root, bucket_name), bucket_name)
+
+    def list_blobs(self, bucket, prefix=''):
+        for root, _, files in os.walk(bucket.path):
+            for file in sorted(files):
+                if file.endswith('.tmp'):
+                    continue
+                name = os.path.relpath(os.path.join(root, file), bucket.path).replace("\\", "/")
+                if name.startswith(prefix):
+                    yield bucket.blob(name)
+
+
+class FilesystemBucket:
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+
+    def blob(self, blob_name, chunk_size=None):
+        return FilesystemBlob(self, blob_name, chunk_size)
+
+    def get_blob(self, blob_name):
+        blob = self.blob(blob_name)
+        return blob if os.path.isfile(blob.path) else None
+
+
+class FilesystemBlob:
+
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+
+    @property
+    def path(self):
+        return os.path.join(self.bucket.path, *self.name.split('/'))
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path)
+
+    @property
+    def md5_hash(self):
+        return file_checksums(self.path)[0]
+
+    @property
+    def crc32c(self):
+        return file_checksums(self.path)[1]
+
+    def upload_from_filename(self, filename, checksum=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(filename, 'rb') as src, open(self.path + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst, self.chunk_size or 1 << 20)
+        os.replace(self.path + '.tmp', self.path)
+
+
+# One client for the whole run: credentials are loaded once and its HTTP
+# session keeps a pool of connections large enough for every worker.
+# STORAGE_EMULATOR_HOST points the client at a local GCS emulator.
+def create_storage_client(credentials_file, pool_size=GCS_UPLOAD_WORKERS):
+    # Imported here so the filesystem stand-in works without the GCS library
+    from google.cloud import storage
+    from requests.adapters import HTTPAdapter
+
+    if os.getenv('STORAGE_EMULATOR_HOST'):
+        from google.auth.credentials import AnonymousCredentials
+        storage_client = storage.Client(project='emulator', credentials=AnonymousCredentials())
+    else:
         storage_client = storage.Client.from_service_account_json(credentials_file)
 
-        # Get the target bucket
-        bucket = storage_client.bucket(bucket_name)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    storage_client._http.mount('https://', adapter)
+    storage_client._http.mount('http://', adapter)
+    return storage_client
+
+# Network errors and 408/429/5xx responses are retried, anything else fails at once
+def is_transient(error):
+    if isinstance(error, (FileNotFoundError, PermissionError, IsADirectoryError)):
+        return False
+    status = getattr(error, 'code', None)
+    if not isinstance(status, int):
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status in TRANSIENT_STATUS_CODES or isinstance(error, (OSError, TimeoutError))
+
+def upload_to_gcs(bucket, source_file_path, destination_blob_name, resumable_threshold=GCS_RESUMABLE_THRESHOLD,
+                  chunk_size=GCS_CHUNK_SIZE, retries=GCS_UPLOAD_RETRIES, backoff=GCS_RETRY_BACKOFF):
+    result = {'source': source_file_path, 'destination': destination_blob_name, 'gcs_path': None, 'status': 'failed',
+              'success': False, 'bytes': 0, 'attempts': 0, 'seconds': 0.0, 'error': None, 'md5_hash': None, 'crc32c': None}
+    start = time.perf_counter()
+    for attempt in range(1, retries + 2):
+        result['attempts'] = attempt
+        try:
+            result['bytes'] = os.path.getsize(source_file_path)
+            # Large files go up as resumable chunked uploads, so a dropped
+            # connection only resends the current chunk
+            blob = bucket.blob(destination_blob_name, chunk_size=chunk_size if result['bytes'] > resumable_threshold else None)
+            blob.upload_from_filename(source_file_path, checksum='md5')
+
+            result['gcs_path'] = f"gs://{bucket.name}/{destination_blob_name}"
+            result['md5_hash'], result['crc32c'] = blob.md5_hash, blob.crc32c
+            result['status'] = 'uploaded'
+            result['success'] = True
+            print(f"File {source_file_path} uploaded to {result['gcs_path']}")
+            break
+        except Exception as e:
+            result['error'] = f"{type(e).__name__}: {e}"
+            if attempt > retries or not is_transient(e):
+                print(f"Failed to upload {source_file_path}: {e}")
+                break
+            # Exponential backoff with jitter so workers don't retry in lockstep
+            delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            print(f"Upload of {source_file_path} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+# Size and checksums of every object below the given GCS directories
+def list_remote_objects(storage_client, bucket, gcs_dirs):
+    remote = {}
+    for gcs_dir in gcs_dirs:
+        for blob in storage_client.list_blobs(bucket, prefix=gcs_dir.rstrip('/') + '/'):
+            remote[blob.name] = (blob.size, blob.md5_hash, blob.crc32c)
+    return remote
+
+# Size and checksums of one object, None if the bucket does not hold it
+def remote_object_info(bucket, blob_name):
+    blob = bucket.get_blob(blob_name)
+    return (blob.size, blob.md5_hash, blob.crc32c) if blob is not None else None
 
-        # Upload the file to the bucket
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(source_file_path)
+# Upload one file unless the bucket already holds an identical object. The
+# upload only counts once the checksums GCS reports match the local ones.
+# remote is a bucket listing, or None to trust the journal and look up only
+# the objects of files it has no confirmed upload for.
+def sync_file(bucket, source_file_path, destination_blob_name, remote, journal_entries):
+    stat = os.stat(source_file_path)
+    entry = journal_entries.get(source_file_path)
+    result = {'source': source_file_path, 'destination': destination_blob_name, 'gcs_path': f"gs://{bucket.name}/{destination_blob_name}",
+              'status': 'present', 'success': True, 'bytes': 0, 'attempts': 0, 'seconds': 0.0, 'error': None,
+              'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
 
-        print(f"File {source_file_path} uploaded to gs://{bucket_name}/{destination_blob_name}")
-        return f"gs://{bucket_name}/{destination_blob_name}", True
-    except Exception as e:
-        print(f"Failed to upload {source_file_path}: {e}")
-        return None, False
+    # Unchanged since a confirmed upload (and, with a listing, still in the bucket): skip without hashing
+    if (entry is not None and entry['status'] in CONFIRMED_STATUSES and entry['destination'] == destination_blob_name
+            and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+            and (remote is None or remote.get(destination_blob_name, (None,))[0] == stat.st_size)):
+        result['md5'], result['crc32c'] = entry['md5'], entry['crc32c']
+        return result
 
-def upload_files_in_directory(bucket_name, local_dir, gcs_dir, credentials_file, log_writer):
-    all_files_uploaded = True
+    result['md5'], result['crc32c'] = file_checksums(source_file_path)
+    remote_object = remote.get(destination_blob_name) if remote is not None else remote_object_info(bucket, destination_blob_name)
+    if remote_object is not None and checksums_match(stat.st_size, result['md5'], result['crc32c'], *remote_object):
+        return result
 
-    # Iterate through files in the local directory
+    upload = upload_to_gcs(bucket, source_file_path, destination_blob_name)
+    result.update(status=upload['status'], success=upload['success'], bytes=upload['bytes'], attempts=upload['attempts'],
+                  seconds=upload['seconds'], error=upload['error'], gcs_path=upload['gcs_path'])
+    if upload['success'] and (upload['md5_hash'] or upload['crc32c']) and not checksums_match(
+            stat.st_size, result['md5'], result['crc32c'], upload['bytes'], upload['md5_hash'], upload['crc32c']):
+        result.update(status='failed', success=False, error="Checksum mismatch after upload")
+    return result
+
+# (source, destination, gcs_dir) for every file below a local directory
+def list_upload_jobs(local_dir, gcs_dir):
+    jobs = []
     for root, _, files in os.walk(local_dir):
-        for file in files:
+        for file in sorted(files):
             source_file_path = os.path.join(root, file)
             relative_path = os.path.relpath(source_file_path, local_dir)
             destination_blob_name = os.path.join(gcs_dir, relative_path).replace("\\", "/")
-            gcs_path, success = upload_to_gcs(bucket_name, source_file_path, destination_blob_name, credentials_file)
-            
-            # Log details to CSV
-            log_writer.writerow({
-                'Upload DateTime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'GCS Original Image Path': gcs_path if gcs_dir == ORIGINAL_IMAGE_GCS_DIR else '',
-                'GCS Original Label Path': gcs_path if gcs_dir == ORIGINAL_LABEL_GCS_DIR else '',
-                'GCS Processed Image Path': gcs_path if gcs_dir == PROCESSED_IMAGE_GCS_DIR else '',
-                'GCS Processed Label Path': gcs_path if gcs_dir == PROCESSED_LABEL_GCS_DIR else '',
-                'Roboflow Status': ''  # Placeholder for Roboflow status if needed
-            })
-
-            # If any file fails to upload, mark all_files_uploaded as False
-            if not success:
-                all_files_uploaded = False
-
-    return all_files_uploaded
-
-def delete_local_files(directory):
-    # Iterate through files and delete them
-    for root, _, files in os.walk(directory):
-        for file in files:
-            file_path = os.path.join(root, file)
-            os.remove(file_path)
-            print(f"Deleted local file: {file_path}")
+            jobs.append((source_file_path, destination_blob_name, gcs_dir))
+    return jobs
+
+# Processed image and label post_processer.py derives from an original capture
+# image or label, empty for any other file
+def derived_outputs(source_file_path):
+    directory, filename = os.path.split(source_file_path)
+    stem = os.path.splitext(filename)[0]
+    if os.path.normpath(directory) not in (os.path.normpath(ORIGINAL_IMAGE_DIR), os.path.normpath(ORIGINAL_LABEL_DIR)):
+        return []
+    outputs = [os.path.join(PROCESSED_IMAGE_DIR, stem + ext) for ext in ('.jpg', '.png')]
+    return outputs + [os.path.join(PROCESSED_LABEL_DIR, stem + '.txt')]
+
+# Jobs for the sealed shards of a shard store, then its index. The index is
+# append-only and the writer keeps using it, so it is uploaded but never
+# deleted locally; the remote copy always lists every uploaded shard.
+def list_shard_jobs(shard_dir, gcs_dir):
+    jobs = [(os.path.join(shard_dir, name), f"{gcs_dir}/{name}", gcs_dir) for name in sorted(sealed_shards(shard_dir))
+            if os.path.isfile(os.path.join(shard_dir, name))]
+    index_path = os.path.join(shard_dir, INDEX_NAME)
+    if os.path.isfile(index_path):
+        jobs.append((index_path, f"{gcs_dir}/{INDEX_NAME}", gcs_dir))
+    return jobs
+
+# Run task(bucket, source, destination) for every job on a pool of threads
+# sharing one bucket (and client). At most workers * 4 jobs are queued at
+# once, so huge job lists stay cheap.
+def upload_files(bucket, jobs, workers=GCS_UPLOAD_WORKERS, on_result=None, task=upload_to_gcs):
+    start_time = time.perf_counter()
+    report = {'total': len(jobs), 'uploaded': 0, 'present': 0, 'failed': 0, 'bytes': 0, 'retries': 0, 'errors': []}
+
+    def collect(done):
+        for future in done:
+            result = dict(future.result(), gcs_dir=pending.pop(future))
+            report[result['status']] += 1
+            report['bytes'] += result['bytes'] if result['status'] == 'uploaded' else 0
+            report['retries'] += max(result['attempts'] - 1, 0)
+            if not result['success']:
+                report['errors'].append((result['source'], result['error']))
+            if on_result is not None:
+                on_result(result)
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for source_file_path, destination_blob_name, gcs_dir in jobs:
+            if len(pending) >= workers * 4:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(task, bucket, source_file_path, destination_blob_name)] = gcs_dir
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    report['elapsed'] = time.perf_counter() - start_time
+    report['files_per_second'] = report['uploaded'] / report['elapsed'] if report['elapsed'] else 0.0
+    report['megabytes_per_second'] = report['bytes'] / 1e6 / report['elapsed'] if report['elapsed'] else 0.0
+    return report
 
+def print_upload_report(report):
+    for source_file_path, error in report['errors']:
+        print(f"[failed] {source_file_path}: {error}")
+    print(f"Uploaded: {report['uploaded']}, Already present: {report['present']}, Failed: {report['failed']}, Retries: {report['retries']} of {report['total']} files, "
+          f"{report['bytes'] / 1e6:.1f} MB in {report['elapsed']:.2f}s "
+          f"({report['files_per_second']:.1f} files/sec, {report['megabytes_per_second']:.2f} MB/sec)")
+
+def log_upload(log_writer, result):
+    gcs_dir, gcs_path = result['gcs_dir'], result['gcs_path']
+    log_writer.writerow({
+        'Upload DateTime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'GCS Original Image Path': gcs_path if gcs_dir in (ORIGINAL_IMAGE_GCS_DIR, ORIGINAL_SHARD_GCS_DIR) else '',
+        'GCS Original Label Path': gcs_path if gcs_dir == ORIGINAL_LABEL_GCS_DIR else '',
+        'GCS Processed Image Path': gcs_path if gcs_dir in (PROCESSED_IMAGE_GCS_DIR, PROCESSED_SHARD_GCS_DIR) else '',
+        'GCS Processed Label Path': gcs_path if gcs_dir == PROCESSED_LABEL_GCS_DIR else '',
+        'Roboflow Status': ''  # Placeholder for Roboflow status if needed
+    })
+
+# Open the log CSV for appending, writing the header for a new file. The
+# caller closes the returned file once every row has been written.
 def create_or_update_log_csv(log_csv_path):
-    # Create or update the CSV file with header
     file_exists = os.path.isfile(log_csv_path)
-    with open(log_csv_path, mode='a', newline='') as file:
-        fieldnames = ['Upload DateTime', 'GCS Original Image Path', 'GCS Original Label Path', 
-                      'GCS Processed Image Path', 'GCS Processed Label Path', 'Roboflow Status']
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        if not file_exists:
-            writer.writeheader()
-        return writer
+    file = open(log_csv_path, mode='a', newline='')
+    fieldnames = ['Upload DateTime', 'GCS Original Image Path', 'GCS Original Label Path',
+                  'GCS Processed Image Path', 'GCS Processed Label Path', 'Roboflow Status']
+    writer = csv.DictWriter(file, fieldnames=fieldnames)
+    if not file_exists:
+        writer.writeheader()
+    return file, writer
 
-if __name__ == "__main__":
-    # Replace the following variables with your specific values
-    BUCKET_NAME = "your-bucket-name"
-    CREDENTIALS_FILE = "path/to/your/credentials.json"
-    LOG_CSV_PATH = "upload_log.csv"
-
-    # Define directory paths
-    ORIGINAL_IMAGE_DIR = 'original_data/images/'
-    ORIGINAL_LABEL_DIR = 'original_data/labels/'
-    PROCESSED_IMAGE_DIR = 'processed_data/images/'
-    PROCESSED_LABEL_DIR = 'processed_data/labels/'
-
-    # Define GCS directory paths
-    ORIGINAL_IMAGE_GCS_DIR = 'original_data/images'
-    ORIGINAL_LABEL_GCS_DIR = 'original_data/labels'
-    PROCESSED_IMAGE_GCS_DIR = 'processed_data/images'
-    PROCESSED_LABEL_GCS_DIR = 'processed_data/labels'
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Back up captured and processed data to Google Cloud Storage")
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--credentials', default=CREDENTIALS_FILE, help="Service account JSON (ignored with STORAGE_EMULATOR_HOST)")
+    parser.add_argument('--log', default=LOG_CSV_PATH, help="Upload log CSV")
+    parser.add_argument('--workers', type=int, default=GCS_UPLOAD_WORKERS, help="Concurrent uploads")
+    parser.add_argument('--filesystem', metavar='ROOT', help="Upload into ROOT/<bucket>/ on the local filesystem instead of GCS")
+    parser.add_argument('--journal', default=GCS_JOURNAL_PATH, help="SQLite journal of confirmed uploads")
+    parser.add_argument('--full', action='store_true', help="Upload every file, ignoring the journal and the bucket")
+    parser.add_argument('--verify-remote', action='store_true', help="List the bucket and re-upload journaled files missing from it")
+    parser.add_argument('--keep-local', action='store_true', help="Keep local files after their upload is confirmed")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    storage_client = FilesystemClient(args.filesystem) if args.filesystem else create_storage_client(args.credentials, args.workers)
+    bucket = storage_client.bucket(args.bucket)
+    journal = UploadJournal(args.journal, batch_size=GCS_JOURNAL_BATCH_SIZE)
 
     # Create or open the log CSV file
-    log_writer = create_or_update_log_csv(LOG_CSV_PATH)
-
-    # Upload files and check if all uploads are successful
-    all_files_uploaded = True
-    all_files_uploaded &= upload_files_in_directory(BUCKET_NAME, ORIGINAL_IMAGE_DIR, ORIGINAL_IMAGE_GCS_DIR, CREDENTIALS_FILE, log_writer)
-    all_files_uploaded &= upload_files_in_directory(BUCKET_NAME, ORIGINAL_LABEL_DIR, ORIGINAL_LABEL_GCS_DIR, CREDENTIALS_FILE, log_writer)
-    all_files_uploaded &= upload_files_in_directory(BUCKET_NAME, PROCESSED_IMAGE_DIR, PROCESSED_IMAGE_GCS_DIR, CREDENTIALS_FILE, log_writer)
-    all_files_uploaded &= upload_files_in_directory(BUCKET_NAME, PROCESSED_LABEL_DIR, PROCESSED_LABEL_GCS_DIR, CREDENTIALS_FILE, log_writer)
-
-    # Delete local files only if all uploads were successful
-    if all_files_uploaded:
-        delete_local_files(ORIGINAL_IMAGE_DIR)
-        delete_local_files(ORIGINAL_LABEL_DIR)
-        delete_local_files(PROCESSED_IMAGE_DIR)
-        delete_local_files(PROCESSED_LABEL_DIR)
-    else:
-        print("Some files failed to upload. Local files were not deleted.")
+    log_file, log_writer = create_or_update_log_csv(args.log)
+
+    # Sync every file of every directory on one worker pool
+    jobs = [job for local_dir, gcs_dir in UPLOAD_DIRECTORIES for job in list_upload_jobs(local_dir, gcs_dir)]
+    jobs += [job for shard_dir, gcs_dir in SHARD_UPLOAD_DIRECTORIES for job in list_shard_jobs(shard_dir, gcs_dir)]
+    keep_local = {source for source, _, _ in jobs if os.path.basename(source) == INDEX_NAME}
+    derived = {}
+    for source_file_path, _, _ in jobs:
+        outputs = derived_outputs(source_file_path)
+        if outputs:
+            derived[source_file_path] = outputs
+    originals = []
+
+    def delete_local(source_file_path):
+        os.remove(source_file_path)
+        journal.mark_deleted(source_file_path)
+        print(f"Deleted local file: {source_file_path}")
+
+    # Record every outcome; a local file is deleted as soon as its own upload is
+    # confirmed, except originals, which wait for their processed outputs
+    def on_result(result):
+        source_file_path = result['source']
+        journal.record(source_file_path, result['destination'], result['status'], result.get('size'), result.get('mtime_ns'),
+                       result.get('md5'), result.get('crc32c'), result['attempts'], result['error'])
+        if result['status'] == 'uploaded':
+            log_upload(log_writer, result)
+        if result['success'] and not args.keep_local and source_file_path not in keep_local:
+            if source_file_path in derived:
+                originals.append(source_file_path)
+            else:
+                delete_local(source_file_path)
+
+    try:
+        # Files the journal confirms are skipped without asking the bucket;
+        # --verify-remote lists it, --full ignores both
+        remote, journal_entries = None, {}
+        if args.verify_remote and not args.full:
+            remote = list_remote_objects(storage_client, bucket, [gcs_dir for _, gcs_dir in UPLOAD_DIRECTORIES + SHARD_UPLOAD_DIRECTORIES])
+        if not args.full:
+            journal_entries = journal.entries()
+        task = partial(sync_file, remote=remote, journal_entries=journal_entries)
+        report = upload_files(bucket, jobs, args.workers, on_result=on_result, task=task)
+
+        # An original goes once none of its processed outputs is left locally
+        # (they were uploaded and deleted above), so a failed processed upload
+        # keeps its source and post_processer never drops the retry copy
+        report['kept'] = 0
+        for source_file_path in originals:
+            if any(os.path.exists(path) for path in derived[source_file_path]):
+                report['kept'] += 1
+            else:
+                delete_local(source_file_path)
+    finally:
+        journal.close()
+        log_file.close()
+
+    print_upload_report(report)
+    if report['failed']:
+        print("Some files failed to upload. They were kept locally and will be retried on the next run.")
+    if report['kept']:
+        print(f"Kept {report['kept']} uploaded originals whose processed outputs are not uploaded yet.")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+# inference_backend.py
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import tempfile
+import time
+import cv2
+import numpy as np
+import yaml
+from config.configs import *
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+# Packages the export of each backend needs. ultralytics would pip-install
+# missing ones at runtime, so they are checked before exporting.
+BACKEND_PACKAGES = {'onnx': ('onnx', 'onnxruntime', 'onnxslim'), 'openvino': ('openvino',)}
+
+
+# Exported models have the classes baked in, so the artifact is keyed by the
+# class list and export settings and cached next to the weights, e.g.
+# model/yolov8s-worldv2_onnx_int8_640_<key>.onnx
+def artifact_path(model_path, classes, backend, int8=False, imgsz=640):
+    key = hashlib.sha256(json.dumps({'classes': list(classes), 'imgsz': imgsz, 'int8': int8}).encode('utf-8')).hexdigest()[:12]
+    stem = os.path.splitext(model_path)[0]
+    name = f"{stem}_{backend}{'_int8' if int8 else ''}_{imgsz}_{key}"
+    return name + '.onnx' if backend == 'onnx' else name + '_openvino_model'
+
+# Raise ImportError naming the packages a backend is missing
+def require_packages(backend):
+    missing = [name for name in BACKEND_PACKAGES.get(backend, ()) if importlib.util.find_spec(name) is None]
+    if missing:
+        raise ImportError(f"The {backend} inference backend needs {', '.join(missing)}, install with: pip install {' '.join(missing)}")
+
+# Capture images used for INT8 calibration and the benchmark, in name order
+def list_images(image_dir, limit=None):
+    if not os.path.isdir(image_dir):
+        return []
+    paths = sorted(os.path.join(image_dir, name) for name in os.listdir(image_dir) if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+    return paths[:limit] if limit else paths
+
+# Dataset YAML over a capture directory in the ultralytics layout (labels/
+# next to images/). The image list is written to a text file so it can be a
+# subset of the directory.
+def write_dataset_yaml(image_paths, classes, directory):
+    list_path = os.path.join(directory, 'images.txt')
+    with open(list_path, 'w') as f:
+        f.writelines(os.path.abspath(path) + '\n' for path in image_paths)
+    yaml_path = os.path.join(directory, 'data.yaml')
+    with open(yaml_path, 'w') as f:
+        yaml.safe_dump({'path': os.path.abspath(directory), 'train': list_path, 'val': list_path,
+                        'names': {i: name for i, name in enumerate(classes)}}, f)
+    return yaml_path
+
+# Letterboxed NCHW float input, the preprocessing ultralytics applies before the exported graph
+def letterbox(image, imgsz):
+    height, width = image.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    resized = cv2.resize(image, (round(width * ratio), round(height * ratio)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - resized.shape[0]) // 2, (imgsz - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+# Feeds our own captures to onnxruntime's static quantization, one image per call
+class CalibrationReader:
+
+    def __init__(self, input_name, image_paths, imgsz):
+        self.input_name = input_name
+        self.image_paths = image_paths
+        self.imgsz = imgsz
+        self.position = 0
+
+    def get_next(self):
+        while self.position < len(self.image_paths):
+            image = cv2.imread(self.image_paths[self.position])
+            self.position += 1
+            if image is not None:
+                return {self.input_name: letterbox(image, self.imgsz)}
+        return None
+
+    def rewind(self):
+        self.position = 0
+
+
+# Static INT8 quantization (QDQ, per-channel weights) of an exported ONNX model
+def quantize_onnx(fp32_path, int8_path, image_paths, imgsz):
+    require_packages('onnx')
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    quantize_static(fp32_path, int8_path, CalibrationReader(input_name, image_paths, imgsz), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+
+    # Keep the ultralytics metadata (names, stride, imgsz) the runtime loader reads
+    fp32_model, int8_model = onnx.load(fp32_path), onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+
+# Export the class-fixed model once and return the cached artifact path
+def export_model(model_path=MODEL_PATH, classes=MODEL_CLASSES, backend=INFERENCE_BACKEND, int8=INFERENCE_INT8, imgsz=INFERENCE_IMGSZ,
+                 calibration_dir=INFERENCE_CALIBRATION_DIR, calibration_images=INFERENCE_CALIBRATION_IMAGES):
+    path = artifact_path(model_path, classes, backend, int8, imgsz)
+    if os.path.exists(path):
+        return path
+
+    require_packages(backend)
+    image_paths = list_images(calibration_dir, calibration_images) if int8 else []
+    if int8 and not image_paths:
+        raise ValueError(f"INT8 calibration needs captured images in {calibration_dir}")
+
+    start_time = time.perf_counter()
+    model = load_torch_model(model_path, classes)
+
+    # Dynamic shapes so batched calls (multi-camera, motion regions) work too
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if backend == 'onnx':
+            exported = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True)
+            if int8:
+                quantize_onnx(exported, path, image_paths, imgsz)
+                os.remove(exported)
+            else:
+                os.replace(exported, path)
+        elif backend == 'openvino':
+            data = write_dataset_yaml(image_paths, classes, temp_dir) if int8 else None
+            exported = model.export(format='openvino', imgsz=imgsz, dynamic=True, int8=int8, data=data)
+            shutil.move(exported, path)
+        else:
+            raise ValueError(f"Unknown inference backend: {backend} (expected one of {BACKENDS})")
+
+    print(f"Exported {backend}{' INT8' if int8 else ''} model to {path} in {time.perf_counter() - start_time:.1f}s")
+    return path
+
+# YOLO model running the exported artifact; .track()/.predict() work as with the PyTorch model
+def load_backend_model(model_path=MODEL_PATH, classes=MODEL_CLASSES, backend=INFERENCE_BACKEND, int8=INFERENCE_INT8, imgsz=INFERENCE_IMGSZ):
+    from ultralytics import YOLO
+    return YOLO(export_model(model_path, classes, backend, int8, imgsz), task='detect')
+
+# PyTorch YOLO-World model with the classes set (from the embedding cache when enabled)
+def load_torch_model(model_path=MODEL_PATH, classes=MODEL_CLASSES):
+    from ultralytics import YOLOWorld
+    from embedding_cache import set_classes_cached
+
+    model = YOLOWorld(model_path)
+    if EMBEDDING_CACHE_DIR:
+        set_classes_cached(model, model_path, classes, EMBEDDING_CACHE_DIR)
+    else:
+        model.set_classes(list(classes))
+    return model
+
+# 'onnx-int8' -> ('onnx', True)
+def parse_variant(variant):
+    backend, _, suffix = variant.partition('-')
+    if backend not in BACKENDS or suffix not in ('', 'int8') or (backend == 'torch' and suffix):
+        raise ValueError(f"Unknown backend variant: {variant}")
+    return backend, suffix == 'int8'
+
+# Latency per image (same predict settings as the capture loop) and mAP on a
+# labelled capture set for every variant
+def benchmark(variants, image_dir, model_path=MODEL_PATH, classes=MODEL_CLASSES, imgsz=INFERENCE_IMGSZ, images=100, warmup=5):
+    image_paths = list_images(image_dir, images)
+    if not image_paths:
+        raise ValueError(f"No images to benchmark in {image_dir}")
+    frames = [cv2.imread(path) for path in image_paths]
+
+    report = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data = write_dataset_yaml(image_paths, classes, temp_dir)
+        for variant in variants:
+            backend, int8 = parse_variant(variant)
+            if backend == 'torch':
+                model = load_torch_model(model_path, classes)
+            else:
+                model = load_backend_model(model_path, classes, backend, int8, imgsz)
+
+            for frame in frames[:warmup]:
+                model.predict(source=frame, imgsz=imgsz, conf=0.5, iou=0.5, verbose=False)
+            latencies = []
+            for frame in frames:
+                start = time.perf_counter()
+                model.predict(source=frame, imgsz=imgsz, conf=0.5, iou=0.5, verbose=False)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            metrics = model.val(data=data, imgsz=imgsz, batch=1, plots=False, verbose=False)
+            latencies = np.array(latencies)
+            report.append({'variant': variant, 'mean_ms': float(latencies.mean()), 'p50_ms': float(np.percentile(latencies, 50)),
+                           'p95_ms': float(np.percentile(latencies, 95)), 'map50': float(metrics.box.map50), 'map50_95': float(metrics.box.map)})
+    return report
+
+def print_benchmark(report):
+    print(f"{'variant':<15} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'FPS':>7} {'mAP50':>7} {'mAP50-95':>9}")
+    for row in report:
+        fps = 1000.0 / row['mean_ms'] if row['mean_ms'] else 0.0
+        print(f"{row['variant']:<15} {row['mean_ms']:9.2f} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {fps:7.1f} {row['map50']:7.3f} {row['map50_95']:9.3f}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export YOLO-World to a CPU inference runtime and benchmark it")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export = subparsers.add_parser('export', help="Export (and optionally quantize) the class-fixed model")
+    export.add_argument('--backend', choices=BACKENDS[1:], default=INFERENCE_BACKEND if INFERENCE_BACKEND != 'torch' else 'onnx')
+    export.add_argument('--int8', action='store_true', default=INFERENCE_INT8, help="INT8 quantization calibrated on --calibration-dir")
+    export.add_argument('--calibration-dir', default=INFERENCE_CALIBRATION_DIR)
+    export.add_argument('--calibration-images', type=int, default=INFERENCE_CALIBRATION_IMAGES)
+    export.add_argument('--imgsz', type=int, default=INFERENCE_IMGSZ)
+    bench = subparsers.add_parser('bench', help="Compare latency and mAP of backend variants on labelled captures")
+    bench.add_argument('--variants', nargs='+', default=['torch', 'onnx', 'onnx-int8', 'openvino', 'openvino-int8'])
+    bench.add_argument('--images-dir', default=PROCESSED_IMAGE_DIR, help="Images with YOLO labels in a sibling labels/ directory")
+    bench.add_argument('--images', type=int, default=100, help="Number of images to benchmark")
+    bench.add_argument('--imgsz', type=int, default=INFERENCE_IMGSZ)
+    bench.add_argument('--output', help="Also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'export':
+        return export_model(MODEL_PATH, MODEL_CLASSES, args.backend, args.int8, args.imgsz, args.calibration_dir, args.calibration_images)
+
+    report = benchmark(args.variants, args.images_dir, imgsz=args.imgsz, images=args.images)
+    print_benchmark(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == "__main__":
+    main()
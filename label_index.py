@@ -0,0 +1,410 @@
+# label_index.py
+import argparse
+import json
+import os
+import shutil
+import struct
+import time
+import numpy as np
+from config.configs import *
+
+INDEX_VERSION = 1
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Label formats: raw capture labels written by app.py and YOLO labels written
+# by post_processer.py
+LABEL_FORMATS = {'raw': 7, 'yolo': 5}
+
+# Datasets the index covers: name -> (image dir, label dir, label format)
+DATASETS = {
+    'original': (ORIGINAL_IMAGE_DIR, ORIGINAL_LABEL_DIR, 'raw'),
+    'processed': (PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, 'yolo'),
+}
+
+# Label file status codes (files table)
+LABEL_OK, LABEL_MISSING, LABEL_EMPTY, LABEL_MALFORMED = 0, 1, 2, 3
+
+# YOLO labels carry 6 decimals, so boxes may overshoot the image by rounding
+BOUNDS_TOLERANCE = 1e-4
+
+# Column dtypes of the two tables. Boxes are normalised x1 y1 x2 y2 whatever
+# the label format; label_width/label_height are the image size a raw label
+# was written for (0 for YOLO labels).
+FILE_COLUMNS = {
+    'stem': 'S', 'image_name': 'S', 'label_name': 'S',
+    'width': np.int32, 'height': np.int32,
+    'image_size': np.int64, 'image_mtime_ns': np.int64,
+    'label_size': np.int64, 'label_mtime_ns': np.int64,
+    'label_status': np.int8,
+}
+BOX_COLUMNS = {
+    'file': np.int64, 'class_id': np.int32,
+    'x1': np.float32, 'y1': np.float32, 'x2': np.float32, 'y2': np.float32,
+    'label_width': np.int32, 'label_height': np.int32,
+}
+
+# SOF markers that carry the frame size (every 0xC0-0xCF but DHT, JPG and DAC)
+JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+# Image width and height read from the file header, without decoding pixels.
+# Returns None for unreadable or unsupported files.
+def image_dimensions(path):
+    with open(path, 'rb') as f:
+        head = f.read(24)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and len(head) == 24:
+            return struct.unpack('>II', head[16:24])
+        if head[:2] != b'\xff\xd8':
+            return None
+        f.seek(2)
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return None
+            code = marker[1]
+            while code == 0xFF:  # fill bytes
+                byte = f.read(1)
+                if not byte:
+                    return None
+                code = byte[0]
+            if code == 0x01 or 0xD0 <= code <= 0xD9:  # markers without a length
+                continue
+            length = f.read(2)
+            if len(length) < 2:
+                return None
+            if code in JPEG_SOF_MARKERS:
+                sof = f.read(5)
+                if len(sof) < 5:
+                    return None
+                height, width = struct.unpack('>xHH', sof)
+                return width, height
+            f.seek(struct.unpack('>H', length)[0] - 2, 1)
+
+# Boxes of one label file as normalised x1 y1 x2 y2, with their class ids and
+# the image size raw labels were written for. Returns (class ids, boxes, label
+# sizes, status).
+def parse_label(path, label_format):
+    with open(path, 'r') as f:
+        rows = [line.split() for line in f if line.strip()]
+    if not rows:
+        return np.empty(0, np.int32), np.empty((0, 4), np.float32), np.empty((0, 2), np.int32), LABEL_EMPTY
+
+    columns = LABEL_FORMATS[label_format]
+    status = LABEL_OK
+    if any(len(row) != columns for row in rows):
+        rows = [row for row in rows if len(row) == columns]
+        status = LABEL_MALFORMED
+    try:
+        values = np.array(rows, dtype=np.float64).reshape(-1, columns)
+    except ValueError:
+        return np.empty(0, np.int32), np.empty((0, 4), np.float32), np.empty((0, 2), np.int32), LABEL_MALFORMED
+
+    class_ids = values[:, 0].astype(np.int32)
+    if label_format == 'raw':
+        sizes = values[:, 1:3]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            boxes = values[:, 3:7] / np.tile(sizes, 2)
+    else:
+        sizes = np.zeros((len(values), 2))
+        centers, half = values[:, 1:3], values[:, 3:5] / 2
+        boxes = np.concatenate([centers - half, centers + half], axis=1)
+    return class_ids, boxes.astype(np.float32), sizes.astype(np.int32), status
+
+# name -> (file name, size, mtime_ns) of every image and label in the dataset dirs
+def scan_dataset(image_dir, label_dir):
+    images, labels = {}, {}
+    for directory, extensions, found in ((image_dir, IMAGE_EXTENSIONS, images), (label_dir, ('.txt',), labels)):
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() in extensions and entry.is_file():
+                    stat = entry.stat()
+                    found[stem] = (entry.name, stat.st_size, stat.st_mtime_ns)
+    return images, labels
+
+
+# Columnar index of one dataset: a files table (one row per image and/or
+# label, paired by name) and a boxes table (one row per label box, pointing at
+# its file row). Every column is a .npy file, memory-mapped on load, so queries
+# only page in the columns they touch.
+class LabelIndex:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = {}
+        self.files = {name: np.empty(0, dtype=dtype) for name, dtype in FILE_COLUMNS.items()}
+        self.boxes = {name: np.empty(0, dtype=dtype) for name, dtype in BOX_COLUMNS.items()}
+
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.isfile(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get('version') == INDEX_VERSION:
+                self.meta = meta
+                self.files = {name: np.load(os.path.join(directory, f"files.{name}.npy"), mmap_mode='r') for name in FILE_COLUMNS}
+                self.boxes = {name: np.load(os.path.join(directory, f"boxes.{name}.npy"), mmap_mode='r') for name in BOX_COLUMNS}
+
+    def __len__(self):
+        return len(self.files['stem'])
+
+    def path(self, row, column='image_name'):
+        directory = self.meta['image_dir'] if column == 'image_name' else self.meta['label_dir']
+        return os.path.join(directory, self.files[column][row].decode('utf-8'))
+
+    # Re-read only the images and labels whose size or mtime changed since the
+    # last update, reuse every other row, and drop rows whose files are gone
+    def update(self, image_dir, label_dir, label_format, full=False):
+        start_time = time.perf_counter()
+        images, labels = scan_dataset(image_dir, label_dir)
+        stems = sorted(set(images) | set(labels))
+        report = {'total': len(stems), 'unchanged': 0, 'indexed': 0, 'changed': 0, 'removed': 0}
+
+        same_source = (self.meta.get('image_dir'), self.meta.get('label_dir'), self.meta.get('label_format')) == (image_dir, label_dir, label_format)
+        previous = {}
+        if same_source and not full:
+            state = zip(self.files['image_name'].tolist(), self.files['image_size'].tolist(), self.files['image_mtime_ns'].tolist(),
+                        self.files['label_name'].tolist(), self.files['label_size'].tolist(), self.files['label_mtime_ns'].tolist())
+            previous = {stem: (row, entry) for row, (stem, entry) in enumerate(zip(self.files['stem'].tolist(), state))}
+
+        kept, new_files, new_boxes = [], [], []
+        for stem in stems:
+            image = images.get(stem, (b'', -1, -1))
+            label = labels.get(stem, (b'', -1, -1))
+            image = (image[0].encode('utf-8') if image[0] else b'',) + image[1:]
+            label = (label[0].encode('utf-8') if label[0] else b'',) + label[1:]
+            row, entry = previous.get(stem.encode('utf-8'), (None, None))
+            if entry == image + label:
+                kept.append(row)
+                continue
+            if row is not None:
+                report['changed'] += 1
+
+            width = height = -1
+            if image[0]:
+                dimensions = image_dimensions(os.path.join(image_dir, images[stem][0]))
+                if dimensions is not None:
+                    width, height = dimensions
+            status = LABEL_MISSING
+            if label[0]:
+                class_ids, boxes, sizes, status = parse_label(os.path.join(label_dir, labels[stem][0]), label_format)
+                if len(class_ids):
+                    new_boxes.append((len(new_files), class_ids, boxes, sizes))
+            new_files.append((stem.encode('utf-8'), image[0], label[0], width, height, image[1], image[2], label[1], label[2], status))
+
+        report['unchanged'] = len(kept)
+        report['indexed'] = len(new_files)
+        report['removed'] = len(self) - len(kept) - report['changed'] if same_source and not full else 0
+
+        # Reused rows first (their boxes remapped to the new row numbers), then the re-read ones
+        kept = np.array(kept, dtype=np.int64)
+        files = {name: np.asarray(column)[kept] for name, column in self.files.items()}
+        remap = np.full(len(self), -1, dtype=np.int64)
+        remap[kept] = np.arange(len(kept))
+        box_rows = remap[self.boxes['file']] if len(self.boxes['file']) else np.empty(0, dtype=np.int64)
+        boxes = {name: np.asarray(column)[box_rows >= 0] for name, column in self.boxes.items()}
+        boxes['file'] = box_rows[box_rows >= 0].astype(np.int64)
+
+        if new_files:
+            for name, values in zip(FILE_COLUMNS, zip(*new_files)):
+                files[name] = np.concatenate([files[name], np.array(values, dtype=FILE_COLUMNS[name])])
+        if new_boxes:
+            rows = np.concatenate([np.full(len(ids), len(kept) + row) for row, ids, _, _ in new_boxes])
+            class_ids = np.concatenate([ids for _, ids, _, _ in new_boxes])
+            coords = np.concatenate([b for _, _, b, _ in new_boxes])
+            sizes = np.concatenate([s for _, _, _, s in new_boxes])
+            added = {'file': rows, 'class_id': class_ids, 'x1': coords[:, 0], 'y1': coords[:, 1], 'x2': coords[:, 2], 'y2': coords[:, 3],
+                     'label_width': sizes[:, 0], 'label_height': sizes[:, 1]}
+            boxes = {name: np.concatenate([boxes[name], added[name].astype(dtype)]) for name, dtype in BOX_COLUMNS.items()}
+
+        self.files, self.boxes = files, boxes
+        self.meta = {'version': INDEX_VERSION, 'image_dir': image_dir, 'label_dir': label_dir, 'label_format': label_format,
+                     'classes': list(MODEL_CLASSES), 'updated': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        report['files'] = len(self)
+        report['boxes'] = len(self.boxes['file'])
+        report['elapsed'] = time.perf_counter() - start_time
+        report['files_per_second'] = report['indexed'] / report['elapsed'] if report['elapsed'] else 0.0
+        return report
+
+    # Write every column to a fresh directory and swap it in, so readers never
+    # see a half-written index
+    def save(self):
+        temp_dir = f"{self.directory.rstrip(os.sep)}.{os.getpid()}.tmp"
+        os.makedirs(temp_dir, exist_ok=True)
+        for table, columns in (('files', self.files), ('boxes', self.boxes)):
+            for name, column in columns.items():
+                np.save(os.path.join(temp_dir, f"{table}.{name}.npy"), column)
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+        old_dir = None
+        if os.path.isdir(self.directory):
+            old_dir = f"{self.directory.rstrip(os.sep)}.{os.getpid()}.old"
+            os.replace(self.directory, old_dir)
+        os.replace(temp_dir, self.directory)
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+
+# Box width and height in image pixels, using the header size of the image and
+# the raw label size when the image is missing
+def box_pixels(index):
+    boxes = index.boxes
+    width = np.asarray(index.files['width'])[boxes['file']].astype(np.float64)
+    height = np.asarray(index.files['height'])[boxes['file']].astype(np.float64)
+    width = np.where(width > 0, width, boxes['label_width'])
+    height = np.where(height > 0, height, boxes['label_height'])
+    return (boxes['x2'] - boxes['x1']) * width, (boxes['y2'] - boxes['y1']) * height
+
+def percentiles(values, points=(5, 25, 50, 75, 95)):
+    if not len(values):
+        return {}
+    return {f"p{point}": float(value) for point, value in zip(points, np.percentile(values, points))}
+
+# Class counts, box size distribution, image sizes and boxes per image
+def dataset_stats(index, bins=(0, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0)):
+    files, boxes = index.files, index.boxes
+    classes = index.meta.get('classes', MODEL_CLASSES)
+    has_image = files['image_name'] != b''
+    has_label = files['label_name'] != b''
+    num_classes = max(len(classes), int(boxes['class_id'].max()) + 1 if len(boxes['class_id']) else 0)
+    class_ids = np.clip(boxes['class_id'], 0, None)
+
+    # Images holding a class: a file x class presence table, filled by scatter (no sort)
+    present = np.zeros((len(index), num_classes), dtype=bool)
+    present[boxes['file'], class_ids] = True
+    box_counts = np.bincount(class_ids, minlength=num_classes)
+    image_counts = present.sum(axis=0)
+
+    widths, heights = box_pixels(index)
+    valid = (widths > 0) & (heights > 0)
+    image_area = (np.asarray(files['width'])[boxes['file']].astype(np.float64) * np.asarray(files['height'])[boxes['file']])
+    relative_area = np.divide(widths * heights, image_area, out=np.full(len(widths), np.nan), where=image_area > 0)
+    area_histogram, _ = np.histogram(relative_area[np.isfinite(relative_area)], bins=bins)
+
+    # One int64 key per image size, a 1-D unique is far cheaper than unique rows
+    size_keys = (np.asarray(files['width'], dtype=np.int64) << 32 | np.asarray(files['height'], dtype=np.int64) & 0xFFFFFFFF)[has_image]
+    unique_sizes, size_counts = np.unique(size_keys, return_counts=True)
+    per_image = np.bincount(boxes['file'], minlength=len(index))[has_label]
+
+    return {
+        'files': len(index),
+        'images': int(has_image.sum()),
+        'labels': int(has_label.sum()),
+        'boxes': len(boxes['file']),
+        'classes': {(classes[i] if i < len(classes) else f"class_{i}"): {'boxes': int(box_counts[i]), 'images': int(image_counts[i])}
+                    for i in range(num_classes) if i < len(classes) or box_counts[i]},
+        'box_width_px': percentiles(widths[valid]),
+        'box_height_px': percentiles(heights[valid]),
+        'box_area_fraction': {f"{low:g}-{high:g}": int(count) for low, high, count in zip(bins[:-1], bins[1:], area_histogram)},
+        'image_sizes': {f"{key >> 32}x{key & 0xFFFFFFFF}": count for key, count in zip(unique_sizes.tolist(), size_counts.tolist())},
+        'boxes_per_label': percentiles(per_image) if len(per_image) else {},
+    }
+
+# Row masks of every problem the index can find: files without an image or
+# label, empty/malformed labels and unreadable images, and boxes that are
+# degenerate, out of bounds, of an unknown class or labelled for another image size
+def validate_index(index, min_box_size=LABEL_MIN_BOX_SIZE):
+    files, boxes = index.files, index.boxes
+    classes = index.meta.get('classes', MODEL_CLASSES)
+    has_image = files['image_name'] != b''
+    has_label = files['label_name'] != b''
+    box_image_width = np.asarray(files['width'])[boxes['file']]
+    box_image_height = np.asarray(files['height'])[boxes['file']]
+    widths, heights = box_pixels(index)
+
+    file_checks = {
+        'missing_label': has_image & ~has_label,
+        'missing_image': has_label & ~has_image,
+        'empty_label': np.asarray(files['label_status']) == LABEL_EMPTY,
+        'malformed_label': np.asarray(files['label_status']) == LABEL_MALFORMED,
+        'unreadable_image': has_image & (np.asarray(files['width']) <= 0),
+    }
+    box_checks = {
+        'degenerate_box': ~((widths >= min_box_size) & (heights >= min_box_size)),
+        'out_of_bounds_box': ((boxes['x1'] < -BOUNDS_TOLERANCE) | (boxes['y1'] < -BOUNDS_TOLERANCE)
+                              | (boxes['x2'] > 1 + BOUNDS_TOLERANCE) | (boxes['y2'] > 1 + BOUNDS_TOLERANCE)),
+        'unknown_class': (boxes['class_id'] < 0) | (boxes['class_id'] >= len(classes)),
+        'size_mismatch': ((boxes['label_width'] > 0) & (box_image_width > 0)
+                          & ((boxes['label_width'] != box_image_width) | (boxes['label_height'] != box_image_height))),
+    }
+    return file_checks, box_checks
+
+# Issue counts and the first `limit` offending files of every check
+def validation_report(index, limit=20, min_box_size=LABEL_MIN_BOX_SIZE):
+    file_checks, box_checks = validate_index(index, min_box_size)
+    report = {}
+    for name, mask in file_checks.items():
+        rows = np.flatnonzero(mask)
+        column = 'label_name' if name in ('missing_image', 'empty_label', 'malformed_label') else 'image_name'
+        report[name] = {'count': len(rows), 'examples': [index.path(row, column) for row in rows[:limit].tolist()]}
+    for name, mask in box_checks.items():
+        rows = np.unique(np.asarray(index.boxes['file'])[mask])
+        report[name] = {'count': int(mask.sum()), 'files': len(rows),
+                        'examples': [index.path(row, 'label_name') for row in rows[:limit].tolist()]}
+    return report
+
+def print_stats(stats):
+    print(f"Files: {stats['files']}, Images: {stats['images']}, Labels: {stats['labels']}, Boxes: {stats['boxes']}")
+    for class_name, counts in stats['classes'].items():
+        print(f"  {class_name:<16} {counts['boxes']:>9} boxes in {counts['images']:>9} images")
+    for key in ('box_width_px', 'box_height_px', 'boxes_per_label'):
+        print(f"{key}: " + '  '.join(f"{point} {value:.1f}" for point, value in stats[key].items()))
+    print("box_area_fraction: " + '  '.join(f"{bin_range} {count}" for bin_range, count in stats['box_area_fraction'].items()))
+    print("image_sizes: " + '  '.join(f"{size} {count}" for size, count in stats['image_sizes'].items()))
+
+def print_validation(report):
+    for name, issue in report.items():
+        files = f" in {issue['files']} files" if 'files' in issue else ''
+        print(f"{name:<18} {issue['count']:>9}{files}")
+        for example in issue['examples']:
+            print(f"    {example}")
+
+def index_dir(index_root, dataset):
+    return os.path.join(index_root, dataset)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar label index with dataset statistics and validation")
+    parser.add_argument('command', choices=('update', 'stats', 'validate'))
+    parser.add_argument('--dataset', nargs='+', choices=sorted(DATASETS), default=sorted(DATASETS))
+    parser.add_argument('--index-dir', default=LABEL_INDEX_DIR)
+    parser.add_argument('--full', action='store_true', help="Re-read every file instead of only new or changed ones")
+    parser.add_argument('--limit', type=int, default=20, help="Offending files listed per validation check")
+    parser.add_argument('--min-box-size', type=float, default=LABEL_MIN_BOX_SIZE, help="Smallest valid box side in pixels")
+    parser.add_argument('--json', action='store_true', help="Print the result as JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {}
+    for dataset in args.dataset:
+        index = LabelIndex(index_dir(args.index_dir, dataset))
+        if args.command == 'update':
+            image_dir, label_dir, label_format = DATASETS[dataset]
+            result = index.update(image_dir, label_dir, label_format, full=args.full)
+            index.save()
+            if not args.json:
+                print(f"{dataset}: indexed {result['indexed']} ({result['changed']} changed), unchanged {result['unchanged']}, "
+                      f"removed {result['removed']} -> {result['files']} files, {result['boxes']} boxes in {result['elapsed']:.2f}s")
+        elif not index.meta:
+            print(f"{dataset}: no index in {index.directory}, run `label_index.py update` first")
+            continue
+        else:
+            start_time = time.perf_counter()
+            result = dataset_stats(index) if args.command == 'stats' else validation_report(index, args.limit, args.min_box_size)
+            elapsed = time.perf_counter() - start_time
+            if not args.json:
+                print(f"== {dataset} ({index.meta['updated']}, {elapsed * 1000:.1f} ms)")
+                if args.command == 'stats':
+                    print_stats(result)
+                else:
+                    print_validation(result)
+        results[dataset] = result
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# metrics.py
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+METRIC_PREFIX = 'vdb'
+
+
+# Latency histogram for one pipeline stage
+class StageHistogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.count += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    # Upper bound of the bucket containing the given quantile
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(float(bound), self.max)
+        return self.max
+
+
+# Per-stage timings, throughput and gate-open ratio for the capture pipeline.
+# Stages are keyed by (stage, stream) so several cameras can share one registry.
+class PipelineMetrics:
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.stages = {}
+        self.iterations = {}
+        self.gauges = {}
+        self.server = None
+        self.dump_thread = None
+        self.stopping = threading.Event()
+
+    @contextmanager
+    def time(self, stage, stream=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - start) * 1000, stream)
+
+    def observe(self, stage, ms, stream=None):
+        with self.lock:
+            histogram = self.stages.get((stage, stream))
+            if histogram is None:
+                histogram = self.stages[(stage, stream)] = StageHistogram(self.buckets)
+            histogram.observe(ms)
+
+    # Count one pass of the main loop, used for the gate-open ratio
+    def tick(self, stream=None):
+        with self.lock:
+            self.iterations[stream] = self.iterations.get(stream, 0) + 1
+
+    # Expose a stats() style callable as gauges, e.g. CaptureReader.stats
+    def register_gauges(self, prefix, stats_fn, stream=None):
+        self.gauges[(prefix, stream)] = stats_fn
+
+    def snapshot(self):
+        uptime = time.monotonic() - self.start_time
+        with self.lock:
+            stages = {}
+            for (stage, stream), histogram in self.stages.items():
+                iterations = self.iterations.get(stream, 0)
+                stages.setdefault(stream or 'default', {})[stage] = {
+                    'count': histogram.count,
+                    'mean_ms': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'p50_ms': histogram.quantile(0.5),
+                    'p95_ms': histogram.quantile(0.95),
+                    'max_ms': histogram.max,
+                    'throughput_per_second': histogram.count / uptime if uptime else 0.0,
+                    'gate_open_ratio': histogram.count / iterations if iterations else 0.0,
+                }
+            iterations = {stream or 'default': count for stream, count in self.iterations.items()}
+
+        gauges = {}
+        for (prefix, stream), stats_fn in list(self.gauges.items()):
+            gauges.setdefault(stream or 'default', {})[prefix] = _numeric(stats_fn())
+
+        return {'timestamp': time.time(), 'uptime_seconds': uptime, 'iterations': iterations, 'stages': stages, 'gauges': gauges}
+
+    # Render the registry in the Prometheus text exposition format
+    def prometheus(self):
+        uptime = time.monotonic() - self.start_time
+        lines = [
+            f'# TYPE {METRIC_PREFIX}_uptime_seconds gauge',
+            f'{METRIC_PREFIX}_uptime_seconds {uptime:.3f}',
+            f'# TYPE {METRIC_PREFIX}_iterations_total counter',
+        ]
+        with self.lock:
+            for stream, count in self.iterations.items():
+                lines.append(f'{METRIC_PREFIX}_iterations_total{_labels(stream=stream)} {count}')
+
+            latency = f'{METRIC_PREFIX}_stage_latency_ms'
+            lines.append(f'# TYPE {latency} histogram')
+            for (stage, stream), histogram in self.stages.items():
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{latency}_bucket{_labels(stage=stage, stream=stream, le=bound)} {cumulative}')
+                lines.append(f'{latency}_bucket{_labels(stage=stage, stream=stream, le="+Inf")} {histogram.count}')
+                lines.append(f'{latency}_sum{_labels(stage=stage, stream=stream)} {histogram.sum:.3f}')
+                lines.append(f'{latency}_count{_labels(stage=stage, stream=stream)} {histogram.count}')
+
+            lines.append(f'# TYPE {METRIC_PREFIX}_stage_throughput_per_second gauge')
+            for (stage, stream), histogram in self.stages.items():
+                lines.append(f'{METRIC_PREFIX}_stage_throughput_per_second{_labels(stage=stage, stream=stream)} {histogram.count / uptime if uptime else 0.0:.3f}')
+
+            lines.append(f'# TYPE {METRIC_PREFIX}_stage_gate_open_ratio gauge')
+            for (stage, stream), histogram in self.stages.items():
+                iterations = self.iterations.get(stream, 0)
+                lines.append(f'{METRIC_PREFIX}_stage_gate_open_ratio{_labels(stage=stage, stream=stream)} {histogram.count / iterations if iterations else 0.0:.4f}')
+
+        # Group gauge samples by name so each family gets a single TYPE line
+        gauge_samples = {}
+        for (prefix, stream), stats_fn in list(self.gauges.items()):
+            for key, value in _flatten(_numeric(stats_fn())):
+                gauge_samples.setdefault(f'{METRIC_PREFIX}_{prefix}_{key}', []).append((stream, value))
+        for name, samples in gauge_samples.items():
+            lines.append(f'# TYPE {name} gauge')
+            for stream, value in samples:
+                lines.append(f'{name}{_labels(stream=stream)} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    # Serve /metrics on a daemon thread
+    def start_http_server(self, port, host='127.0.0.1'):
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"Unable to start metrics endpoint on {host}:{port}: {e}")
+            return None
+        threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+        print(f"Metrics available at http://{host}:{port}/metrics")
+        return self.server
+
+    # Append a snapshot to a JSONL file every interval seconds until stop()
+    def start_jsonl_dump(self, path, interval=10.0):
+        stopping = self.stopping = threading.Event()
+
+        def dump():
+            while not stopping.wait(interval):
+                self.write_jsonl(path)
+
+        self.dump_thread = threading.Thread(target=dump, name='metrics-jsonl', daemon=True)
+        self.dump_thread.start()
+
+    def write_jsonl(self, path):
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot()) + '\n')
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.dump_thread is not None:
+            self.stopping.set()
+            self.dump_thread.join()
+            self.dump_thread = None
+
+
+def _labels(**labels):
+    parts = [f'{key}="{value}"' for key, value in labels.items() if value is not None]
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+# Keep only numeric values (recursively) from a stats dict
+def _numeric(stats):
+    numeric = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            numeric[key] = _numeric(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            numeric[key] = value
+    return numeric
+
+def _flatten(stats, prefix=''):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}_')
+        else:
+            yield f'{prefix}{key}', value
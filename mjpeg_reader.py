@@ -0,0 +1,421 @@
+# mjpeg_reader.py
+import argparse
+import http.client
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+from config.configs import *
+
+# cv2.imdecode flags that decode a JPEG at 1/n scale in the DCT domain
+REDUCED_DECODE_FLAGS = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                        4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+# Boundary the replay server separates its parts with
+REPLAY_BOUNDARY = 'mjpegreplayframe'
+
+
+# Largest JPEG reduction (1, 2, 4 or 8) that does not go below the scale the
+# pipeline resizes frames to, so the remaining resize never upscales
+def decode_reduction(scale_width, scale_height):
+    scale = max(scale_width, scale_height)
+    for reduction in (8, 4, 2):
+        if 1.0 / reduction >= scale - 1e-6:
+            return reduction
+    return 1
+
+# Boundary parameter of a multipart Content-Type header, without leading dashes
+def multipart_boundary(content_type):
+    media_type, _, params = content_type.partition(';')
+    if not media_type.strip().lower().startswith('multipart/'):
+        return None
+    for param in params.split(';'):
+        key, _, value = param.strip().partition('=')
+        if key.lower() == 'boundary':
+            return value.strip().strip('"').lstrip('-').encode('latin-1')
+    return None
+
+
+# Splits a multipart/x-mixed-replace body into its parts without looking
+# inside them. Parts with a Content-Length are read in one call, others up to
+# the next boundary line.
+class MultipartReader:
+
+    def __init__(self, stream, boundary):
+        self.stream = stream
+        self.boundary = boundary
+        self.at_part = False  # the boundary of the next part was already consumed
+
+    # A delimiter line is exactly the boundary (or the closing boundary), some
+    # cameras add extra leading dashes
+    def is_boundary(self, line):
+        if not line.startswith(b'--'):
+            return False
+        delimiter = line[2:].rstrip().lstrip(b'-')
+        return delimiter == self.boundary or delimiter == self.boundary + b'--'
+
+    # Return the next part body, or None at the end of the stream
+    def next_part(self):
+        while not self.at_part:
+            line = self.stream.readline()
+            if not line:
+                return None
+            if self.is_boundary(line):
+                if line.rstrip().endswith(self.boundary + b'--'):
+                    return None
+                self.at_part = True
+        self.at_part = False
+
+        length = None
+        while True:
+            line = self.stream.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value.strip())
+
+        if length is not None:
+            body = self.stream.read(length)
+            if len(body) < length:
+                return None
+            return body
+
+        lines = []
+        while True:
+            line = self.stream.readline()
+            if not line:
+                return None
+            if self.is_boundary(line):
+                self.at_part = True
+                break
+            lines.append(line)
+        body = b''.join(lines)
+        return body[:-2] if body.endswith(b'\r\n') else body.rstrip(b'\n')
+
+
+# MJPEG-over-HTTP source with the subset of the cv2.VideoCapture interface used
+# by the pipeline. grab() only splits the next JPEG off the stream, retrieve()
+# decodes it, at 1/reduction scale in the DCT domain. Stream errors reconnect
+# with exponential backoff instead of ending the capture. Opening the stream
+# is only retried startup_retries times, so an unreachable camera fails fast.
+class MJPEGCapture:
+
+    def __init__(self, url, reduction=1, timeout=MJPEG_TIMEOUT, reconnect_delay=MJPEG_RECONNECT_DELAY,
+                 reconnect_max_delay=MJPEG_RECONNECT_MAX_DELAY, reconnect_attempts=MJPEG_RECONNECT_ATTEMPTS,
+                 probe_frames=MJPEG_FPS_PROBE_FRAMES, startup_retries=MJPEG_STARTUP_RETRIES):
+        if reduction not in REDUCED_DECODE_FLAGS:
+            raise ValueError(f"Unsupported JPEG reduction: {reduction} (expected one of {tuple(REDUCED_DECODE_FLAGS)})")
+        self.url = url
+        self.reduction = reduction
+        self.decode_flag = REDUCED_DECODE_FLAGS[reduction]
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.reconnect_attempts = reconnect_attempts
+        self.response = None
+        self.parts = None
+        self.jpeg = None
+        self.shape = None
+        self.fps = 0.0
+        self.closed = False
+        self.lock = threading.Lock()
+
+        # Counters
+        self.frames_grabbed = 0
+        self.frames_decoded = 0
+        self.bytes_read = 0
+        self.reconnects = 0
+        self.last_error = None
+
+        if self.reconnect(startup_retries):
+            self.probe(probe_frames)
+
+    def connect(self):
+        response = urllib.request.urlopen(self.url, timeout=self.timeout)
+        boundary = multipart_boundary(response.headers.get('Content-Type', ''))
+        if boundary is None:
+            response.close()
+            raise ValueError(f"{self.url} is not a multipart MJPEG stream ({response.headers.get('Content-Type')})")
+        with self.lock:
+            if self.closed:
+                response.close()
+                return
+            self.response = response
+            self.parts = MultipartReader(response, boundary)
+
+    def disconnect(self):
+        with self.lock:
+            response, self.response, self.parts = self.response, None, None
+        if response is not None:
+            try:
+                response.close()
+            except OSError:
+                pass
+
+    # (Re)open the stream, retrying with exponential backoff. False once the
+    # retries (reconnect_attempts by default) are used up or the capture was released.
+    def reconnect(self, retries=None):
+        self.disconnect()
+        retries = self.reconnect_attempts if retries is None else retries
+        delay = self.reconnect_delay
+        attempt = 0
+        while not self.closed:
+            try:
+                self.connect()
+                return self.parts is not None
+            except (OSError, http.client.HTTPException) as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+            except ValueError as e:
+                self.last_error = str(e)
+                if self.shape is None:
+                    # Never streamed MJPEG, so it is another kind of source
+                    print(self.last_error)
+                    return False
+            attempt += 1
+            if retries is not None and attempt > retries:
+                print(f"Giving up on {self.url} after {attempt} attempts: {self.last_error}")
+                return False
+            print(f"Unable to open {self.url} ({self.last_error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max_delay)
+        return False
+
+    # Read a few frames to learn the frame shape and the rate the camera sends at
+    def probe(self, frames):
+        start = None
+        for index in range(max(frames, 1)):
+            if not self.grab():
+                return
+            if index == 0:
+                start = time.monotonic()
+                ret, frame = self.retrieve()
+                self.shape = frame.shape if ret else None
+        elapsed = time.monotonic() - start
+        if frames > 1 and elapsed > 0:
+            self.fps = (frames - 1) / elapsed
+
+    def isOpened(self):
+        return self.shape is not None and not self.closed
+
+    # Split the next JPEG off the stream without decoding it
+    def grab(self):
+        while not self.closed:
+            parts = self.parts
+            if parts is not None:
+                try:
+                    jpeg = parts.next_part()
+                    if jpeg:
+                        self.jpeg = jpeg
+                        self.frames_grabbed += 1
+                        self.bytes_read += len(jpeg)
+                        return True
+                    self.last_error = 'stream ended'
+                except (OSError, ValueError, http.client.HTTPException) as e:
+                    self.last_error = f"{type(e).__name__}: {e}"
+            if self.closed:
+                break
+            print(f"MJPEG stream error ({self.last_error}), reconnecting to {self.url}")
+            self.reconnects += 1
+            if not self.reconnect():
+                break
+        return False
+
+    # Encoded JPEG of the last grabbed frame, for decoding on another thread
+    def retrieve_encoded(self):
+        return self.jpeg is not None, self.jpeg
+
+    def decode(self, jpeg):
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), self.decode_flag)
+        if frame is None:
+            return False, None
+        self.frames_decoded += 1
+        return True, frame
+
+    def retrieve(self):
+        if self.jpeg is None:
+            return False, None
+        return self.decode(self.jpeg)
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return self.retrieve()
+
+    # Properties of the decoded (reduced) frames
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.shape[1] if self.shape else 0
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.shape[0] if self.shape else 0
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.frames_grabbed
+        return 0
+
+    def stats(self):
+        return {
+            'grabbed': self.frames_grabbed,
+            'decoded': self.frames_decoded,
+            'megabytes': self.bytes_read / 1e6,
+            'reconnects': self.reconnects,
+            'reduction': self.reduction,
+        }
+
+    def release(self):
+        self.closed = True
+        self.disconnect()
+
+
+# Serves a directory of JPEGs as an MJPEG stream at the given rate, the way an
+# IP Webcam /video endpoint does. Every client gets its own replay from the start.
+class MJPEGReplayServer:
+
+    def __init__(self, directory, host='127.0.0.1', port=0, fps=30, loop=True, content_length=True):
+        self.paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                            if name.lower().endswith(('.jpg', '.jpeg')))
+        if not self.paths:
+            raise ValueError(f"No JPEG files in {directory}")
+        self.fps = fps
+        self.loop = loop
+        self.content_length = content_length
+        self.frames = []
+        for path in self.paths:
+            with open(path, 'rb') as f:
+                self.frames.append(f.read())
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+        self.stopped = False
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/video"
+
+    def handler(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.rstrip('/') != '/video':
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', f"multipart/x-mixed-replace; boundary={REPLAY_BOUNDARY}")
+                self.send_header('Cache-Control', 'no-cache')
+                self.end_headers()
+                try:
+                    replay.stream(self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stream(self, wfile):
+        interval = 1.0 / self.fps if self.fps else 0.0
+        next_time = time.monotonic()
+        while True:
+            for jpeg in self.frames:
+                if self.stopped:
+                    return
+                headers = f"--{REPLAY_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                if self.content_length:
+                    headers += f"Content-Length: {len(jpeg)}\r\n"
+                wfile.write(headers.encode('latin-1') + b'\r\n' + jpeg + b'\r\n')
+                wfile.flush()
+                next_time += interval
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if not self.loop:
+                wfile.write(f"--{REPLAY_BOUNDARY}--\r\n".encode('latin-1'))
+                return
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mjpeg-replay', daemon=True)
+        self.thread.start()
+        return self
+
+    # Stop serving and end the open streams, clients see a dropped connection
+    def stop(self):
+        self.stopped = True
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Read a stream for a while and report the rate frames arrive and are decoded at
+def measure_stream(url, seconds=10.0, reduction=1, skip=0):
+    cap = MJPEGCapture(url, reduction=reduction, probe_frames=1)
+    if not cap.isOpened():
+        return None
+    decode_time = 0.0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        if not cap.grab():
+            break
+        if skip and cap.frames_grabbed % (skip + 1):
+            continue
+        decode_start = time.perf_counter()
+        cap.retrieve()
+        decode_time += time.perf_counter() - decode_start
+    elapsed = time.perf_counter() - start
+    report = dict(cap.stats(), elapsed=elapsed, shape=cap.shape,
+                  grabbed_per_second=cap.frames_grabbed / elapsed if elapsed else 0.0,
+                  decode_ms=decode_time * 1000 / cap.frames_decoded if cap.frames_decoded else 0.0)
+    cap.release()
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MJPEG-over-HTTP reader and replay server")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve = subparsers.add_parser('serve', help="Serve a directory of JPEGs as an MJPEG stream")
+    serve.add_argument('directory')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--fps', type=float, default=30)
+    serve.add_argument('--once', action='store_true', help="End the stream after one pass instead of looping")
+    serve.add_argument('--no-content-length', action='store_true', help="Omit Content-Length so parts are split on boundaries")
+    probe = subparsers.add_parser('probe', help="Measure the frame and decode rate of a stream")
+    probe.add_argument('url', nargs='?', default=VIDEO_SOURCE)
+    probe.add_argument('--seconds', type=float, default=10.0)
+    probe.add_argument('--reduction', type=int, choices=sorted(REDUCED_DECODE_FLAGS), default=1)
+    probe.add_argument('--skip', type=int, default=0, help="Frames grabbed without decoding after each decoded frame")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'probe':
+        report = measure_stream(args.url, args.seconds, args.reduction, args.skip)
+        if report is None:
+            print(f"Unable to open {args.url}")
+            return None
+        print(f"{report['grabbed']} frames ({report['megabytes']:.1f} MB) in {report['elapsed']:.2f}s "
+              f"({report['grabbed_per_second']:.1f} FPS), {report['decoded']} decoded at 1/{report['reduction']} "
+              f"to {report['shape']} in {report['decode_ms']:.2f} ms/frame, {report['reconnects']} reconnects")
+        return report
+
+    server = MJPEGReplayServer(args.directory, args.host, args.port, args.fps, not args.once,
+                               not args.no_content_length).start()
+    print(f"Serving {len(server.paths)} frames at {args.fps} FPS on {server.url}")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return server
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# motion_backends.py
+import time
+import cv2
+import numpy as np
+from config.configs import *
+
+
+# Common interface: foreground() builds the motion mask, threshold() keeps the
+# confident foreground pixels and detect() counts them in scaled-frame pixels so
+# MOTION_THRESHOLD / HYSTERESIS_DEADBAND mean the same thing for every backend
+class MotionBackend:
+    name = 'base'
+    pixel_scale = 1.0  # factor from mask pixels to scaled-frame pixels
+
+    def __init__(self):
+        self.frames = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+
+    def foreground(self, frame):
+        raise NotImplementedError
+
+    def threshold(self, fg_mask):
+        _, thresh = cv2.threshold(fg_mask, 244, 255, cv2.THRESH_BINARY)
+        return thresh
+
+    def detect(self, frame):
+        start = time.perf_counter()
+        fg_mask = self.foreground(frame)
+        motion_pixels = int(cv2.countNonZero(self.threshold(fg_mask)) * self.pixel_scale)
+        self._record(time.perf_counter() - start)
+        return motion_pixels, fg_mask
+
+    def _record(self, elapsed):
+        self.frames += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+
+    # Per-frame cost of this backend
+    def cost(self):
+        mean = self.total_time / self.frames if self.frames else 0.0
+        return {'backend': self.name, 'frames': self.frames, 'last_ms': self.last_time * 1000, 'mean_ms': mean * 1000}
+
+
+# Gaussian mixture background subtraction (the original detector)
+class MOG2Backend(MotionBackend):
+    name = 'mog2'
+
+    def __init__(self, history=BG_HISTORY, var_threshold=BG_THRESHOLD, detect_shadows=BG_SHADOWS):
+        super().__init__()
+        self.back_sub = cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=var_threshold, detectShadows=detect_shadows)
+
+    def foreground(self, frame):
+        gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        blurred_frame = cv2.GaussianBlur(gray_frame, (5, 5), 0)
+        return self.back_sub.apply(blurred_frame)
+
+
+# K-nearest-neighbours background subtraction
+class KNNBackend(MOG2Backend):
+    name = 'knn'
+
+    def __init__(self, history=BG_HISTORY, dist2_threshold=KNN_THRESHOLD, detect_shadows=BG_SHADOWS):
+        MotionBackend.__init__(self)
+        self.back_sub = cv2.createBackgroundSubtractorKNN(history=history, dist2Threshold=dist2_threshold, detectShadows=detect_shadows)
+
+
+# Difference against the previous frame on a further-downsampled grayscale image
+class FrameDiffBackend(MotionBackend):
+    name = 'framediff'
+
+    def __init__(self, downscale=MOTION_DOWNSCALE, diff_threshold=FRAME_DIFF_THRESHOLD):
+        super().__init__()
+        self.downscale = downscale
+        self.diff_threshold = diff_threshold
+        self.pixel_scale = 1.0 / (downscale * downscale)
+        self.previous = None
+
+    def foreground(self, frame):
+        small = cv2.resize(frame, (0, 0), fx=self.downscale, fy=self.downscale, interpolation=cv2.INTER_AREA)
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (3, 3), 0)
+        previous, self.previous = self.previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return np.zeros_like(gray)
+        _, fg_mask = cv2.threshold(cv2.absdiff(gray, previous), self.diff_threshold, 255, cv2.THRESH_BINARY)
+        return fg_mask
+
+
+# Only evaluates the configured regions of interest: the wrapped backend sees
+# the bounding rectangle of the ROIs and pixels outside the mask are ignored
+class ROIBackend(MotionBackend):
+    name = 'roi'
+
+    def __init__(self, inner, rois=MOTION_ROIS, mask_path=MOTION_MASK_PATH):
+        super().__init__()
+        if not rois and not mask_path:
+            raise ValueError("The roi motion backend needs MOTION_ROIS or MOTION_MASK_PATH")
+        self.inner = inner
+        self.name = f'roi+{inner.name}'
+        self.rois = rois
+        self.mask_image = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE) if mask_path else None
+        if mask_path and self.mask_image is None:
+            raise ValueError(f"Unable to read motion mask: {mask_path}")
+        self.frame_shape = None
+        self.rect = None
+        self.roi_mask = None
+        self.scaled_mask = None
+
+    # Build the ROI mask and its bounding rectangle for this frame size
+    def _prepare(self, frame_shape):
+        height, width = frame_shape
+        mask = np.zeros((height, width), dtype=np.uint8)
+        for x, y, w, h in self.rois:
+            mask[max(0, y):min(height, y + h), max(0, x):min(width, x + w)] = 255
+        if self.mask_image is not None:
+            image_mask = cv2.resize(self.mask_image, (width, height), interpolation=cv2.INTER_NEAREST)
+            mask = image_mask if not self.rois else cv2.bitwise_and(mask, image_mask)
+        mask[mask > 0] = 255
+
+        x, y, w, h = cv2.boundingRect(mask)
+        if w == 0 or h == 0:
+            raise ValueError("Motion ROIs do not overlap the frame")
+        self.frame_shape = frame_shape
+        self.rect = (x, y, w, h)
+        self.roi_mask = mask[y:y + h, x:x + w]
+        self.scaled_mask = None
+
+    def detect(self, frame):
+        start = time.perf_counter()
+        if self.frame_shape != frame.shape[:2]:
+            self._prepare(frame.shape[:2])
+        x, y, w, h = self.rect
+
+        roi_fg = self.inner.foreground(frame[y:y + h, x:x + w])
+        if self.scaled_mask is None or self.scaled_mask.shape != roi_fg.shape:
+            self.scaled_mask = cv2.resize(self.roi_mask, (roi_fg.shape[1], roi_fg.shape[0]), interpolation=cv2.INTER_NEAREST)
+        roi_fg = cv2.bitwise_and(roi_fg, self.scaled_mask)
+        motion_pixels = int(cv2.countNonZero(self.inner.threshold(roi_fg)) * self.inner.pixel_scale)
+
+        # Full-size mask so callers can still map motion back to frame coordinates
+        fg_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+        if roi_fg.shape != (h, w):
+            roi_fg = cv2.resize(roi_fg, (w, h), interpolation=cv2.INTER_NEAREST)
+        fg_mask[y:y + h, x:x + w] = roi_fg
+
+        self._record(time.perf_counter() - start)
+        return motion_pixels, fg_mask
+
+
+MOTION_BACKENDS = {
+    'mog2': MOG2Backend,
+    'knn': KNNBackend,
+    'framediff': FrameDiffBackend,
+}
+
+# Create a motion backend by name ('mog2', 'knn', 'framediff' or 'roi')
+def create_motion_backend(name=MOTION_BACKEND):
+    if name == 'roi':
+        return ROIBackend(create_motion_backend(MOTION_ROI_BACKEND))
+    if name not in MOTION_BACKENDS:
+        raise ValueError(f"Unknown motion backend: {name} (expected one of {sorted(MOTION_BACKENDS) + ['roi']})")
+    return MOTION_BACKENDS[name]()
@@ -0,0 +1,87 @@
+# motion_regions.py
+import cv2
+import numpy as np
+from config.configs import *
+
+
+# Bounding boxes (x1, y1, x2, y2) of the moving blobs of a binary motion mask,
+# in the pixel coordinates of a frame of frame_shape. The mask is dilated first
+# so an object the background model splits into pieces stays one region.
+def mask_regions(motion_mask, frame_shape, min_area=REGION_MIN_AREA, dilate=REGION_DILATE):
+    if dilate:
+        motion_mask = cv2.dilate(motion_mask, cv2.getStructuringElement(cv2.MORPH_RECT, (dilate, dilate)))
+    _, _, stats, _ = cv2.connectedComponentsWithStats(motion_mask, connectivity=8)
+    stats = stats[1:]  # label 0 is the background
+
+    scale_x = frame_shape[1] / motion_mask.shape[1]
+    scale_y = frame_shape[0] / motion_mask.shape[0]
+    stats = stats[stats[:, cv2.CC_STAT_AREA] * scale_x * scale_y >= min_area]
+    x, y = stats[:, cv2.CC_STAT_LEFT], stats[:, cv2.CC_STAT_TOP]
+    w, h = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT]
+    return np.stack([x * scale_x, y * scale_y, (x + w) * scale_x, (y + h) * scale_y], axis=1).astype(np.float64)
+
+# Grow every region by a fraction of its size and up to min_size pixels per
+# side (centered), so objects cut by the motion mask are still seen whole
+def pad_regions(boxes, frame_shape, padding=REGION_PADDING, min_size=REGION_MIN_SIZE):
+    height, width = frame_shape[:2]
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    sizes = np.maximum((boxes[:, 2:] - boxes[:, :2]) * (1 + 2 * padding), min_size)
+    sizes = np.minimum(sizes, [width, height])
+
+    # Shift regions that stick out of the frame back inside instead of shrinking them
+    top_left = np.clip(centers - sizes / 2, 0, [width, height] - sizes)
+    return np.concatenate([top_left, top_left + sizes], axis=1)
+
+# Replace overlapping regions by their union until no two regions overlap
+def merge_regions(boxes):
+    boxes = boxes.copy()
+    while len(boxes) > 1:
+        overlap = ((boxes[:, None, 0] < boxes[None, :, 2]) & (boxes[None, :, 0] < boxes[:, None, 2]) &
+                   (boxes[:, None, 1] < boxes[None, :, 3]) & (boxes[None, :, 1] < boxes[:, None, 3]))
+        np.fill_diagonal(overlap, False)
+        if not overlap.any():
+            break
+        i = int(np.flatnonzero(overlap.any(axis=1))[0])
+        group = overlap[i].copy()
+        group[i] = True
+        merged = np.concatenate([boxes[group, :2].min(axis=0), boxes[group, 2:].max(axis=0)])
+        boxes = np.vstack([boxes[~group], merged])
+    return boxes
+
+# Integer crop rectangles for the moving parts of the frame, or None when
+# detection should run on the whole frame: no motion left (static objects),
+# too many regions, or regions covering most of the frame anyway
+def plan_regions(motion_mask, frame_shape, max_regions=REGION_MAX_COUNT, max_coverage=REGION_MAX_COVERAGE):
+    boxes = mask_regions(motion_mask, frame_shape)
+    if not len(boxes):
+        return None
+    boxes = merge_regions(pad_regions(boxes, frame_shape))
+    if len(boxes) > max_regions:
+        return None
+    area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1).sum()
+    if area > max_coverage * frame_shape[0] * frame_shape[1]:
+        return None
+    return np.round(boxes).astype(int)
+
+# Run the model on full-resolution crops of the regions in one batched call and
+# map the boxes back to frame coordinates scaled by scale (the scaled frame the
+# tracker and label writer work on). Boxes found twice where crops overlap
+# are removed with per-class NMS. Returns the detections and raw results.
+def detect_regions(model, frame, regions, scale, conf=0.5, iou=0.5):
+    import supervision as sv
+
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in regions.tolist()]
+    results = model.predict(source=crops, conf=conf, iou=iou, classes=None, verbose=False)
+
+    parts = []
+    for (x1, y1, _, _), result in zip(regions.tolist(), results):
+        detections = sv.Detections.from_ultralytics(result)
+        if len(detections):
+            detections.xyxy = (detections.xyxy + [x1, y1, x1, y1]) * [scale[0], scale[1], scale[0], scale[1]]
+            parts.append(detections)
+    if not parts:
+        return sv.Detections.empty(), results
+    detections = sv.Detections.merge(parts)
+    if len(parts) > 1:
+        detections = detections.with_nms(threshold=iou, class_agnostic=False)
+    return detections, results
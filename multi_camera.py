@@ -0,0 +1,147 @@
+# multi_camera.py
+import argparse
+import cv2
+import signal
+import sys
+from app import (DetectionState, consecutive_seconds, create_directories, create_tracker, detect_motion, initialize_model, initialize_video_capture,
+                 pipeline_metrics, process_detections, scale_frame, record_inference_speed, signal_handler, start_metrics,
+                 start_writer_pool, stop_writer_pool, update_frame_interval, update_motion_gate)
+from capture_reader import CaptureReader
+from motion_backends import create_motion_backend
+from config.configs import *
+
+
+# One camera: its own capture thread, motion backend, tracker and counters
+class CameraStream:
+
+    def __init__(self, index, source):
+        self.name = f"cam{index}"
+        self.source = source
+        self.cap = initialize_video_capture(source)
+        fps = self.fps = int(self.cap.get(cv2.CAP_PROP_FPS))
+        self.reader = CaptureReader(self.cap, policy=CAPTURE_DROP_POLICY, buffer_size=CAPTURE_BUFFER_SIZE,
+                                    skip=FRAMES_TO_SKIP, max_frame_age=CAPTURE_MAX_FRAME_AGE,
+                                    metrics=pipeline_metrics, stream=self.name).start()
+        self.motion_backend = create_motion_backend(MOTION_BACKEND)
+        pipeline_metrics.register_gauges('capture', self.reader.stats, self.name)
+        pipeline_metrics.register_gauges('motion_backend', self.motion_backend.cost, self.name)
+        self.tracker = create_tracker(fps)
+        self.state = DetectionState(self.name, consecutive_seconds(fps))
+        pipeline_metrics.register_gauges('tracks', self.state.tracks.stats, self.name)
+        if self.state.duplicates is not None:
+            pipeline_metrics.register_gauges('dedup', self.state.duplicates.stats, self.name)
+        print(f"{self.name}: {source} opened at {fps} FPS")
+
+    def close(self):
+        print(f"{self.name} capture stats: {self.reader.stats()}")
+        print(f"{self.name} motion backend cost: {self.motion_backend.cost()}")
+        self.reader.stop()
+        self.cap.release()
+
+
+# Open every source, skipping (and reporting) the ones that fail
+def open_streams(sources):
+    streams = []
+    for i, source in enumerate(sources):
+        try:
+            streams.append(CameraStream(i, source))
+        except IOError as e:
+            print(f"cam{i}: {e}, skipped")
+    return streams
+
+# Poll every stream without waiting. Only when none has a frame ready, wait on
+# one of them (in turn), so a tick blocks for at most one read timeout.
+def read_frames(streams, tick):
+    frames = [(stream,) + stream.reader.read(timeout=0) for stream in streams]
+    if streams and not any(ret for _, ret, _ in frames):
+        waiting = streams[tick % len(streams)]
+        frames = [(waiting,) + waiting.reader.read(timeout=MULTI_CAMERA_READ_TIMEOUT)]
+    return frames
+
+# Run every gate-open frame of this tick through the shared model in one batched call
+def perform_batched_detection(model, frames):
+    return model.predict(
+        source=frames,
+        conf=0.5,
+        iou=0.5,
+        classes=None,
+        verbose=False
+    )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Motion-gated YOLO-World capture from several cameras with one shared model")
+    parser.add_argument('--sources', nargs='+', default=VIDEO_SOURCES, metavar='SOURCE',
+                        help="Video source URLs, files or image directories (default: VIDEO_SOURCES)")
+    parser.add_argument('--headless', action='store_true', help="Do not display the foreground masks")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    import supervision as sv
+
+    display = MULTI_CAMERA_DISPLAY and not args.headless
+    model = initialize_model()
+    streams = open_streams(args.sources)
+    if not streams:
+        print("Error: Unable to open any video stream")
+        sys.exit(1)
+
+    # Register the signal handler
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+
+    create_directories()
+    start_writer_pool()
+    start_metrics()
+
+    tick = 0
+    while streams:
+        batch_streams = []
+        batch_frames = []
+
+        for stream, ret, frame in read_frames(streams, tick):
+            if not ret:
+                if not stream.reader.running:
+                    print(f"{stream.name}: stream ended")
+                    stream.close()
+                    streams.remove(stream)
+                continue
+            pipeline_metrics.tick(stream.name)
+            update_frame_interval(stream.state, stream.reader, stream.fps)
+
+            with pipeline_metrics.time('resize', stream.name):
+                scaled_frame = scale_frame(frame, stream.cap)
+            with pipeline_metrics.time('motion', stream.name):
+                motion_pixels, fg_mask = detect_motion(scaled_frame, stream.motion_backend)
+
+            if stream.state.object_detection_active:
+                batch_streams.append(stream)
+                batch_frames.append(scaled_frame)
+            else:
+                update_motion_gate(stream.state, motion_pixels)
+
+            if display:
+                cv2.imshow(f'Foreground Mask {stream.name}', fg_mask)
+
+        if batch_frames:
+            with pipeline_metrics.time('batched_inference'):
+                results = perform_batched_detection(model, batch_frames)
+            for stream, scaled_frame, result in zip(batch_streams, batch_frames, results):
+                record_inference_speed(result, stream.name)
+                original_height, original_width = result.orig_shape
+                with pipeline_metrics.time('detections', stream.name):
+                    detections = stream.tracker.update_with_detections(sv.Detections.from_ultralytics(result))
+                    process_detections(stream.state, detections, scaled_frame, original_width, original_height)
+
+        tick += 1
+        if display and cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    for stream in streams:
+        stream.close()
+    stop_writer_pool()
+    pipeline_metrics.stop()
+    cv2.destroyAllWindows()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# phash_index.py
+import argparse
+import csv
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from shard_store import parse_capture_name
+from config.configs import *
+
+HASH_BITS = 64
+
+# Set bits of every byte value, used to popcount uint64 hashes
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+# 64-bit difference hash: one bit per horizontally adjacent pixel pair of a
+# 9x8 greyscale thumbnail. Robust to rescaling, recompression and small shifts.
+def dhash(image):
+    if image is None or image.size == 0:
+        return None
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+# Hamming distance between h and every hash of a uint64 array
+def hamming_distances(hashes, h):
+    diff = np.bitwise_xor(hashes, np.uint64(h))
+    return POPCOUNT_TABLE[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+# Multi-index Hamming lookup over 64-bit hashes. Hashes are split into
+# max_distance + 1 chunks, so by the pigeonhole principle any hash within
+# max_distance bits matches at least one chunk exactly and only the entries
+# sharing a chunk are compared. With a capacity, the oldest entries are evicted.
+# Entries can carry a group (the track that captured them): a query for a group
+# never matches the group's own entries.
+class MultiIndexHash:
+
+    def __init__(self, max_distance=4, capacity=None):
+        self.max_distance = max_distance
+        self.capacity = capacity
+        bounds = np.linspace(0, HASH_BITS, min(max_distance + 1, HASH_BITS) + 1).astype(int).tolist()
+        self.chunks = [(low, (1 << (high - low)) - 1) for low, high in zip(bounds[:-1], bounds[1:])]
+        self.tables = [{} for _ in self.chunks]
+        self.hashes = np.zeros(capacity or 1024, dtype=np.uint64)
+        self.items = [None] * len(self.hashes)
+        self.groups = [None] * len(self.hashes)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity) if self.capacity else self.count
+
+    def _keys(self, h):
+        return [(h >> shift) & mask for shift, mask in self.chunks]
+
+    # Entries within max_distance bits of h as (item, distance), nearest first,
+    # leaving out entries of the same group
+    def query(self, h, group=None):
+        candidates = set()
+        for table, key in zip(self.tables, self._keys(h)):
+            candidates.update(table.get(key, ()))
+        if not candidates:
+            return []
+        slots = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        distances = hamming_distances(self.hashes[slots], h)
+        close = np.flatnonzero(distances <= self.max_distance)
+        close = close[np.argsort(distances[close], kind='stable')]
+        return [(self.items[slots[i]], int(distances[i])) for i in close.tolist()
+                if group is None or self.groups[slots[i]] != group]
+
+    def add(self, h, item=None, group=None):
+        if self.capacity:
+            slot = self.count % self.capacity
+            if self.count >= self.capacity:
+                self._remove(slot)
+        else:
+            slot = self.count
+            if slot == len(self.hashes):
+                self.hashes = np.concatenate([self.hashes, np.zeros_like(self.hashes)])
+                self.items.extend([None] * slot)
+                self.groups.extend([None] * slot)
+
+        self.hashes[slot] = h
+        self.items[slot] = item
+        self.groups[slot] = group
+        for table, key in zip(self.tables, self._keys(h)):
+            table.setdefault(key, []).append(slot)
+        self.count += 1
+
+    def _remove(self, slot):
+        for table, key in zip(self.tables, self._keys(int(self.hashes[slot]))):
+            bucket = table[key]
+            bucket.remove(slot)
+            if not bucket:
+                del table[key]
+        self.items[slot] = None
+        self.groups[slot] = None
+
+
+# Per-class recency window of capture hashes, consulted before a capture is saved
+class NearDuplicateFilter:
+
+    def __init__(self, max_distance=4, window=256):
+        self.max_distance = max_distance
+        self.window = window
+        self.indexes = {}
+        self.checked = 0
+        self.suppressed = 0
+
+    # Return (item, distance) of the closest recent capture of the same class if
+    # the image is a near duplicate of it, otherwise remember the image and return
+    # None. Earlier captures of the same item (track) never count as duplicates.
+    def check(self, key, image, item=None):
+        h = dhash(image)
+        if h is None:
+            return None
+        self.checked += 1
+        index = self.indexes.get(key)
+        if index is None:
+            index = self.indexes[key] = MultiIndexHash(self.max_distance, capacity=self.window)
+
+        # The item (track) is also the group, see MultiIndexHash
+        matches = index.query(h, item)
+        if matches:
+            self.suppressed += 1
+            return matches[0]
+        index.add(h, item, item)
+        return None
+
+    def stats(self):
+        return {'checked': self.checked, 'suppressed': self.suppressed,
+                'indexed': sum(len(index) for index in self.indexes.values())}
+
+
+# Hash the object region of a capture: the union of its label boxes (keyed by
+# the classes in the label), or the whole image when there is no label
+def capture_hash(image_path, label_path):
+    image = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        return None, None
+
+    rows = []
+    if os.path.isfile(label_path):
+        with open(label_path, 'r') as f:
+            rows = [line.split() for line in f if line.strip()]
+    rows = [row for row in rows if len(row) == 7]
+    if not rows:
+        return dhash(image), None
+
+    try:
+        labels = np.array(rows, dtype=np.int64)
+    except ValueError:
+        labels = None
+    if labels is None or labels[0, 1] <= 0:
+        print(f"Malformed label {label_path}, hashing the whole image")
+        return dhash(image), None
+    scale = image.shape[1] / labels[0, 1]
+    x_tl, y_tl = (labels[:, 3:5].min(axis=0) * scale).astype(int)
+    x_br, y_br = np.ceil(labels[:, 5:7].max(axis=0) * scale).astype(int)
+    key = ' '.join(sorted(set(row[0] for row in rows)))
+    return dhash(image[max(0, y_tl):y_br, max(0, x_tl):x_br]), key
+
+# Track that took a capture, (stream, track id) from its file name, or None for
+# untracked and per-frame captures
+def capture_track(image_path):
+    metadata = parse_capture_name(os.path.splitext(os.path.basename(image_path))[0])
+    track_id = metadata.get('track_id')
+    if track_id in (None, 'None'):
+        return None
+    return metadata.get('stream'), track_id
+
+def hash_chunk(tasks):
+    return [capture_hash(image_path, label_path) for image_path, label_path in tasks]
+
+# Images of a capture directory in capture order (oldest first), with their label paths
+def list_captures(image_dir, label_dir):
+    entries = [entry for entry in os.scandir(image_dir)
+               if entry.is_file() and entry.name.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    entries.sort(key=lambda entry: (entry.stat().st_mtime_ns, entry.name))
+    return [(entry.path, os.path.join(label_dir, os.path.splitext(entry.name)[0] + '.txt')) for entry in entries]
+
+# Find near-duplicate captures. Hashing runs on a process pool; every capture is
+# compared against the captures of the same classes kept before it, except
+# those of its own track, like the check app.py runs before saving.
+def find_duplicates(image_dir, label_dir, max_distance=DEDUP_MAX_DISTANCE, workers=None, chunksize=256):
+    start_time = time.perf_counter()
+    tasks = list_captures(image_dir, label_dir)
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        hashes = [result for chunk in chunks for result in hash_chunk(chunk)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            hashes = [result for results in executor.map(hash_chunk, chunks) for result in results]
+    hash_time = time.perf_counter() - start_time
+
+    report = {'total': len(tasks), 'unique': 0, 'unreadable': [], 'duplicates': []}
+    indexes = {}
+    for (image_path, label_path), (h, key) in zip(tasks, hashes):
+        if h is None:
+            report['unreadable'].append(image_path)
+            continue
+        index = indexes.get(key)
+        if index is None:
+            index = indexes[key] = MultiIndexHash(max_distance)
+        track = capture_track(image_path)
+        matches = index.query(h, track)
+        if matches:
+            kept_path, distance = matches[0]
+            report['duplicates'].append((image_path, label_path, kept_path, distance))
+            continue
+        index.add(h, image_path, track)
+        report['unique'] += 1
+
+    report['hash_seconds'] = hash_time
+    report['elapsed'] = time.perf_counter() - start_time
+    report['files_per_second'] = report['total'] / report['elapsed'] if report['elapsed'] else 0.0
+    return report
+
+# Move (or delete, when move_dir is None) duplicate images together with their labels
+def remove_duplicates(duplicates, move_dir=None):
+    for image_path, label_path, kept_path, distance in duplicates:
+        for path, subdir in ((image_path, 'images'), (label_path, 'labels')):
+            if not os.path.isfile(path):
+                continue
+            if move_dir is None:
+                os.remove(path)
+            else:
+                os.makedirs(os.path.join(move_dir, subdir), exist_ok=True)
+                shutil.move(path, os.path.join(move_dir, subdir, os.path.basename(path)))
+
+def write_report(duplicates, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['duplicate', 'label', 'kept', 'distance'])
+        writer.writerows(duplicates)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Find near-duplicate captures with a perceptual hash index")
+    parser.add_argument('--images', default=ORIGINAL_IMAGE_DIR, help="Directory of captured images")
+    parser.add_argument('--labels', default=ORIGINAL_LABEL_DIR, help="Directory of raw capture labels")
+    parser.add_argument('--max-distance', type=int, default=DEDUP_MAX_DISTANCE, help="Largest Hamming distance (of 64 bits) that counts as a duplicate")
+    parser.add_argument('--workers', type=int, default=POSTPROCESS_WORKERS, help="Hashing processes (default: all CPU cores)")
+    parser.add_argument('--report', help="Write the duplicates found to this CSV file")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument('--move', metavar='DIR', help="Move duplicates and their labels into DIR/images and DIR/labels")
+    action.add_argument('--delete', action='store_true', help="Delete duplicates and their labels")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = find_duplicates(args.images, args.labels, args.max_distance, args.workers)
+
+    print(f"Unique: {report['unique']}, Duplicates: {len(report['duplicates'])}, Unreadable: {len(report['unreadable'])} "
+          f"of {report['total']} images in {report['elapsed']:.2f}s ({report['files_per_second']:.1f} files/sec, hashing {report['hash_seconds']:.2f}s)")
+    if args.report:
+        write_report(report['duplicates'], args.report)
+        print(f"Duplicate report saved to {args.report}")
+    if args.move or args.delete:
+        remove_duplicates(report['duplicates'], args.move)
+        print(f"{'Moved' if args.move else 'Deleted'} {len(report['duplicates'])} duplicates")
+    return report
+
+if __name__ == "__main__":
+    main()
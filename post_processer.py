@@ -1,9 +1,13 @@
 # post_processer.py
-from pybboxes import BoundingBox
+import argparse
 import cv2
 import os
-import roboflow
-import uuid
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from bbox_ops import apply_crop, convert_raw_labels, valid_voc, validate_roundtrip, voc_to_yolo
+from processing_manifest import ProcessingManifest
+from shard_store import ShardReader, ShardWriter, encode_sample_files, image_member
 from config.configs import *
 from dotenv import load_dotenv
 
@@ -19,10 +23,11 @@ def create_directories():
 def load_image(image_path):
     return cv2.imread(image_path)
 
+# Read every box of a raw label (one line per object, per-frame captures hold several)
 def read_bbox_coordinates(bbox_txt_path):
     try:
         with open(bbox_txt_path, 'r') as file:
-            return file.readline().strip().split()
+            return [line.split() for line in file if line.strip()]
     except FileNotFoundError:
         print(f"Text file not found: {bbox_txt_path}")
         return None
@@ -58,22 +63,88 @@ def draw_bounding_box(image, x_tl, y_tl, x_br, y_br):
     cv2.rectangle(image, (x_tl, y_tl), (x_br, y_br), (0, 255, 0), 2)
     return image
 
-def save_yolo_labels(class_id, yolo_bbox, label_filepath):
+def format_yolo_label(class_id, yolo_bbox):
+    return f'{class_id} {yolo_bbox[0]} {yolo_bbox[1]} {yolo_bbox[2]} {yolo_bbox[3]}'
+
+# One YOLO label line per box
+def format_yolo_labels(class_ids, yolo_bboxes):
+    return '\n'.join(format_yolo_label(class_id, yolo_bbox) for class_id, yolo_bbox in zip(class_ids, yolo_bboxes))
+
+def save_yolo_labels(class_ids, yolo_bboxes, label_filepath):
     os.makedirs(os.path.dirname(label_filepath), exist_ok=True)
     with open(label_filepath, 'w') as f:
-        f.write(f'{class_id} {yolo_bbox[0]} {yolo_bbox[1]} {yolo_bbox[2]} {yolo_bbox[3]}')
+        f.write(format_yolo_labels(class_ids, yolo_bboxes))
     print(f'YOLO results saved to {label_filepath}')
 
-def convert_bbox_to_yolo(my_voc_box, new_width, new_height):
-    voc_bbox = BoundingBox.from_voc(*my_voc_box, image_size=(new_width, new_height))
-    return voc_bbox.to_yolo()
-
-def confirm_yolo_conversion(yolo_bbox, my_voc_box):
-    voc_bbox = BoundingBox.from_yolo(*yolo_bbox.raw_values, image_size=yolo_bbox.image_size).to_voc()
-    if voc_bbox.raw_values == tuple(my_voc_box):
-        print("YOLO conversion is successful!")
-    else:
-        print("YOLO conversion failed!")
+# Mask of boxes that are valid and survive the YOLO -> VOC round trip
+def confirm_yolo_conversion(yolo_bboxes, voc_boxes, new_width, new_height):
+    return valid_voc(voc_boxes, new_width, new_height) & validate_roundtrip(voc_boxes, yolo_bboxes, new_width, new_height)
+
+# Square-crop an in-memory frame so it covers all boxes (as far as the crop
+# width allows) and convert every box to YOLO at once
+def crop_and_convert_boxes(image, original_width, original_height, boxes):
+    boxes = np.asarray(boxes, dtype=np.int64).reshape(-1, 4)
+    cropped_image, crop_x = crop_image(image, original_width, original_height, int(boxes[:, 0].min()), int(boxes[:, 2].max()))
+
+    voc_boxes = apply_crop(boxes, crop_x, 0, cropped_image.shape[1], cropped_image.shape[0])
+    yolo_bboxes = voc_to_yolo(voc_boxes, cropped_image.shape[1], cropped_image.shape[0])
+    return cropped_image, voc_boxes, yolo_bboxes
+
+# Square-crop an in-memory frame around its box and convert the box to YOLO
+def crop_and_convert(image, original_width, original_height, x_tl, y_tl, x_br, y_br):
+    cropped_image, voc_boxes, yolo_bboxes = crop_and_convert_boxes(image, original_width, original_height, [x_tl, y_tl, x_br, y_br])
+    return cropped_image, voc_boxes[0].tolist(), yolo_bboxes[0].tolist()
+
+# Files written by process_image for one input image
+def output_paths(filename, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR):
+    return [
+        os.path.join(PROCESSED_IMAGE_DIR, filename),
+        os.path.join(PROCESSED_LABEL_DIR, os.path.splitext(filename)[0] + '.txt'),
+        os.path.join(PLOT_IMAGE_DIR, filename),
+    ]
+
+def remove_outputs(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+            print(f"Removed stale output {path}")
+
+# Settings that determine the processed outputs; changing any of them reprocesses everything
+def processing_params(PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR):
+    return {
+        'version': POSTPROCESS_VERSION,
+        'crop': 'square',
+        'label_format': 'yolo',
+        'outputs': [PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR],
+    }
+
+# Settings of a --labels-only run, which only writes labels
+def label_export_params(PROCESSED_LABEL_DIR):
+    return {
+        'version': POSTPROCESS_VERSION,
+        'crop': 'square',
+        'label_format': 'yolo',
+        'outputs': [PROCESSED_LABEL_DIR],
+    }
+
+# Crop one capture and build its outputs: cropped image, plot, YOLO class ids and boxes, and an error message
+def process_capture(image, bbox_data):
+    # Per-frame captures list several boxes; the crop covers all of them
+    labels = [extract_bbox_data(row) for row in bbox_data]
+    class_ids = [label[0] for label in labels]
+    original_width, original_height = labels[0][1], labels[0][2]
+    cropped_image, voc_boxes, yolo_bboxes = crop_and_convert_boxes(image, original_width, original_height, [label[3:] for label in labels])
+
+    img_to_plot = cropped_image.copy()
+    for voc_box in voc_boxes.tolist():
+        draw_bounding_box(img_to_plot, *voc_box)
+
+    # Boxes pushed outside the crop are dropped rather than written as garbage
+    valid = confirm_yolo_conversion(yolo_bboxes, voc_boxes, cropped_image.shape[1], cropped_image.shape[0])
+    message = None
+    if not valid.all():
+        message = f"YOLO conversion failed for boxes {voc_boxes[~valid].tolist()}"
+    return cropped_image, img_to_plot, np.asarray(class_ids)[valid].tolist(), yolo_bboxes[valid].tolist(), message
 
 def process_image(input_image_dir, input_label_dir, filename, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR):
     # Construct file paths
@@ -82,56 +153,304 @@ def process_image(input_image_dir, input_label_dir, filename, PROCESSED_IMAGE_DI
     
     # Check if image and label files exist
     if not os.path.isfile(image_path):
-        print(f"Error: Image file {image_path} does not exist.")
-        return
+        return 'skipped', f"Image file {image_path} does not exist."
 
     if not os.path.isfile(bbox_txt_path):
-        print(f"Error: Label file {bbox_txt_path} does not exist.")
-        return
+        return 'skipped', f"Label file {bbox_txt_path} does not exist."
 
     # Load image and label data
     try:
         image = load_image(image_path)
         bbox_data = read_bbox_coordinates(bbox_txt_path)
     except Exception as e:
-        print(f"Error loading files: {e}")
-        return
+        return 'failed', f"Error loading files: {e}"
 
-    if bbox_data is None:
-        print(f"No bounding box data found in {bbox_txt_path}.")
-        return
-    
-    class_id, original_width, original_height, x_tl, y_tl, x_br, y_br = extract_bbox_data(bbox_data)
-    cropped_image, crop_x = crop_image(image, original_width, original_height, x_tl, x_br)
-    
-    save_image(cropped_image, os.path.join(PROCESSED_IMAGE_DIR, filename))
-    
-    voc_x_tl = max(0, x_tl - crop_x)
-    voc_y_tl = y_tl
-    voc_x_br = min(cropped_image.shape[1], x_br - crop_x)
-    voc_y_br = y_br
+    if image is None:
+        return 'failed', f"Unable to decode image {image_path}."
+
+    if not bbox_data:
+        return 'skipped', f"No bounding box data found in {bbox_txt_path}."
     
-    img_to_plot = draw_bounding_box(cropped_image.copy(), voc_x_tl, voc_y_tl, voc_x_br, voc_y_br)
+    cropped_image, img_to_plot, class_ids, yolo_bboxes, message = process_capture(image, bbox_data)
+    processed_image_path, processed_label_path, plot_image_path = output_paths(filename, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR)
     
-    save_image(img_to_plot, os.path.join(PLOT_IMAGE_DIR, filename))
+    save_image(cropped_image, processed_image_path)
     
-    my_voc_box = [voc_x_tl, voc_y_tl, voc_x_br, voc_y_br]
-    yolo_bbox = convert_bbox_to_yolo(my_voc_box, cropped_image.shape[1], cropped_image.shape[0])
+    save_image(img_to_plot, plot_image_path)
     
-    save_yolo_labels(class_id, yolo_bbox.raw_values, os.path.join(PROCESSED_LABEL_DIR, os.path.splitext(filename)[0] + '.txt'))
+    save_yolo_labels(class_ids, yolo_bboxes, processed_label_path)
     
-    confirm_yolo_conversion(yolo_bbox, my_voc_box)
-
-
-# Main function to process all images in the folders
-def process_folders(image_dirs, label_dirs, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR):
+    return 'processed', message
+
+
+# Process a chunk of files in a worker, collecting per-file errors instead of printing them
+def process_chunk(tasks, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR):
+    results = []
+    for input_image_dir, input_label_dir, filename in tasks:
+        try:
+            status, message = process_image(input_image_dir, input_label_dir, filename, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR)
+        except Exception as e:
+            status, message = 'failed', f"{type(e).__name__}: {e}"
+        results.append((os.path.join(input_image_dir, filename), status, message))
+    return results
+
+# List the images to process in every input folder
+def list_tasks(image_dirs, label_dirs):
+    tasks = []
     for input_image_dir, input_label_dir in zip(image_dirs, label_dirs):
-        for filename in os.listdir(input_image_dir):
+        for filename in sorted(os.listdir(input_image_dir)):
             if filename.endswith(".jpg") or filename.endswith(".png"):
-                process_image(input_image_dir, input_label_dir, filename, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR)
+                tasks.append((input_image_dir, input_label_dir, filename))
+    return tasks
+
+# Main function to process all images in the folders
+def process_folders(image_dirs, label_dirs, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR, workers=1, chunksize=POSTPROCESS_CHUNKSIZE, manifest=None):
+    start_time = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    tasks = list_tasks(image_dirs, label_dirs)
+
+    report = {'total': len(tasks), 'processed': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0, 'removed': 0, 'errors': []}
+
+    # Only new or changed captures are processed; outputs of deleted captures are removed
+    states = {}
+    if manifest is not None:
+        pending = []
+        present = set()
+        for task in tasks:
+            input_image_dir, input_label_dir, filename = task
+            image_path = os.path.join(input_image_dir, filename)
+            label_path = os.path.join(input_label_dir, os.path.splitext(filename)[0] + '.txt')
+            present.add(image_path)
+            state = manifest.check(image_path, image_path, label_path) if os.path.isfile(label_path) else {}
+            if state is None:
+                report['unchanged'] += 1
+                continue
+            states[image_path] = state
+            pending.append(task)
+
+        for key in manifest.keys():
+            if key not in present:
+                remove_outputs(manifest.remove(key))
+                report['removed'] += 1
+        tasks = pending
+
+    chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+
+    def collect(results):
+        for path, status, message in results:
+            report[status] += 1
+            if message:
+                report['errors'].append((path, status, message))
+            if manifest is not None:
+                if status == 'processed':
+                    manifest.record(path, states[path], output_paths(os.path.basename(path), PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR))
+                else:
+                    remove_outputs(manifest.remove(path))
+
+    if workers <= 1:
+        for chunk in chunks:
+            collect(process_chunk(chunk, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_chunk, chunk, PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR) for chunk in chunks]
+            for future in as_completed(futures):
+                collect(future.result())
+
+    if manifest is not None:
+        manifest.save()
+
+    report['elapsed'] = time.perf_counter() - start_time
+    report['files_per_second'] = report['total'] / report['elapsed'] if report['elapsed'] else 0.0
+    return report
+
+# Process (key, index record) pairs of an original shard store in a worker,
+# returning the encoded processed samples for the parent to append
+def process_shard_chunk(shard_dir, records):
+    reader = ShardReader(shard_dir, dict(records))
+    results = []
+    for key, record in records:
+        try:
+            image_ext = image_member(record)
+            if image_ext is None or 'txt' not in record['members']:
+                results.append((key, 'skipped', "Sample has no image or label.", None, None))
+                continue
+            image = cv2.imdecode(np.frombuffer(reader.read(key, image_ext), np.uint8), cv2.IMREAD_COLOR)
+            bbox_data = [line.split() for line in reader.read(key, 'txt').decode('utf-8').splitlines() if line.strip()]
+            if image is None:
+                results.append((key, 'failed', "Unable to decode image.", None, None))
+                continue
+            if not bbox_data:
+                results.append((key, 'skipped', "No bounding box data found.", None, None))
+                continue
+
+            cropped_image, img_to_plot, class_ids, yolo_bboxes, message = process_capture(image, bbox_data)
+            files = encode_sample_files({'jpg': cropped_image, 'plot.jpg': img_to_plot}, {'txt': format_yolo_labels(class_ids, yolo_bboxes)})
+            results.append((key, 'processed', message, files, record['meta']))
+        except Exception as e:
+            results.append((key, 'failed', f"{type(e).__name__}: {e}", None, None))
+    reader.close()
+    return results
+
+# Shard storage variant of process_folders. Samples already in the processed
+# store are skipped unless full is set; reprocessed samples supersede older records.
+def process_shards(original_shard_dir, processed_shard_dir, workers=1, chunksize=POSTPROCESS_CHUNKSIZE, full=False):
+    start_time = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    reader = ShardReader(original_shard_dir)
+    done = set() if full else set(ShardReader(processed_shard_dir).keys())
+
+    records = [(key, reader.entries[key]) for key in reader.keys()]
+    report = {'total': len(records), 'processed': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0, 'removed': 0, 'errors': []}
+    pending = [(key, record) for key, record in records if key not in done]
+    report['unchanged'] = len(records) - len(pending)
+    chunks = [pending[i:i + chunksize] for i in range(0, len(pending), chunksize)]
+
+    writer = ShardWriter(processed_shard_dir)
+
+    def collect(results):
+        for key, status, message, files, metadata in results:
+            report[status] += 1
+            if message:
+                report['errors'].append((key, status, message))
+            if files is not None:
+                writer.write(key, files, metadata)
+                print(f"Processed sample saved: {processed_shard_dir}{key}")
+
+    if workers <= 1:
+        for chunk in chunks:
+            collect(process_shard_chunk(original_shard_dir, chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_shard_chunk, original_shard_dir, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                collect(future.result())
+    writer.close()
+
+    report['elapsed'] = time.perf_counter() - start_time
+    report['files_per_second'] = report['total'] / report['elapsed'] if report['elapsed'] else 0.0
+    return report
+
+# Re-export YOLO labels for every raw capture label in one vectorised batch,
+# without decoding any images. With a manifest, only new or changed labels
+# are converted and the outputs of deleted labels are removed.
+def export_labels(label_dirs, PROCESSED_LABEL_DIR, manifest=None):
+    start_time = time.perf_counter()
+    paths, rows, groups = [], [], []
+    states = {}
+    report = {'total': 0, 'processed': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0, 'removed': 0, 'errors': []}
+
+    def reject(path, status, message):
+        report[status] += 1
+        report['errors'].append((path, status, message))
+        if manifest is not None:
+            remove_outputs(manifest.remove(path))
+
+    present = set()
+    for input_label_dir in label_dirs:
+        for filename in sorted(os.listdir(input_label_dir)):
+            if not filename.endswith(".txt"):
+                continue
+            report['total'] += 1
+            path = os.path.join(input_label_dir, filename)
+            present.add(path)
+            if manifest is not None:
+                state = manifest.check(path, None, path)
+                if state is None:
+                    report['unchanged'] += 1
+                    continue
+                states[path] = state
+            bbox_data = read_bbox_coordinates(path)
+            if not bbox_data or any(len(row) != 7 for row in bbox_data):
+                reject(path, 'skipped', "Label is not in the raw capture format")
+                continue
+            # Parsed per file so one bad value only skips its own file
+            try:
+                file_rows = np.array(bbox_data, dtype=np.int64)
+            except ValueError as e:
+                reject(path, 'skipped', f"Label has a non-integer value: {e}")
+                continue
+            # Every box of one file shares a group, and therefore a crop
+            groups.extend([len(paths)] * len(file_rows))
+            paths.append(path)
+            rows.append(file_rows)
+
+    if manifest is not None:
+        for key in manifest.keys():
+            if key not in present:
+                remove_outputs(manifest.remove(key))
+                report['removed'] += 1
+
+    if rows:
+        groups = np.array(groups)
+        class_ids, _, yolo, failed = convert_raw_labels(np.concatenate(rows), groups=groups)
+        os.makedirs(PROCESSED_LABEL_DIR, exist_ok=True)
+        bounds = np.flatnonzero(np.diff(groups)) + 1
+        for path, file_ids, file_yolo, file_failed in zip(paths, np.split(class_ids, bounds), np.split(yolo, bounds), np.split(failed, bounds)):
+            if file_failed.all():
+                reject(path, 'failed', "YOLO conversion failed")
+                continue
+            if file_failed.any():
+                report['errors'].append((path, 'processed', f"YOLO conversion failed for {int(file_failed.sum())} of {len(file_failed)} boxes"))
+            output_path = os.path.join(PROCESSED_LABEL_DIR, os.path.basename(path))
+            with open(output_path, 'w') as f:
+                f.write(format_yolo_labels(file_ids[~file_failed].tolist(), file_yolo[~file_failed].tolist()))
+            report['processed'] += 1
+            if manifest is not None:
+                manifest.record(path, states[path], [output_path])
+
+    if manifest is not None:
+        manifest.save()
+
+    report['elapsed'] = time.perf_counter() - start_time
+    report['files_per_second'] = report['total'] / report['elapsed'] if report['elapsed'] else 0.0
+    return report
+
+def print_report(report):
+    for path, status, message in report['errors']:
+        print(f"[{status}] {path}: {message}")
+    print(f"Processed: {report['processed']}, Unchanged: {report['unchanged']}, Skipped: {report['skipped']}, "
+          f"Failed: {report['failed']}, Removed: {report['removed']} "
+          f"of {report['total']} files in {report['elapsed']:.2f}s ({report['files_per_second']:.1f} files/sec)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Crop captured images and convert their labels to YOLO format")
+    parser.add_argument('--workers', type=int, default=POSTPROCESS_WORKERS, help="Number of worker processes (1 runs serially, default: all cores)")
+    parser.add_argument('--chunksize', type=int, default=POSTPROCESS_CHUNKSIZE, help="Files dispatched to a worker at a time")
+    parser.add_argument('--full', action='store_true', help="Reprocess every capture even if the manifest says it is unchanged")
+    parser.add_argument('--manifest', help="Manifest used for incremental runs (default: POSTPROCESS_MANIFEST_PATH, "
+                                           "or POSTPROCESS_LABELS_MANIFEST_PATH with --labels-only; '' disables it)")
+    parser.add_argument('--labels-only', action='store_true', help="Only re-export YOLO labels from the raw labels, without touching images")
+    parser.add_argument('--storage', choices=('files', 'shards'), default=STORAGE_BACKEND, help="Read and write captures as files or shard stores")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.storage == 'shards':
+        report = process_shards(ORIGINAL_SHARD_DIR, PROCESSED_SHARD_DIR, workers=args.workers, chunksize=args.chunksize, full=args.full)
+        print_report(report)
+        return report
+    create_directories()
+    if args.manifest is None:
+        args.manifest = POSTPROCESS_LABELS_MANIFEST_PATH if args.labels_only else POSTPROCESS_MANIFEST_PATH
+    manifest = None
+    if args.labels_only:
+        if args.manifest:
+            manifest = ProcessingManifest(args.manifest, label_export_params(PROCESSED_LABEL_DIR), force=args.full,
+                                          save_interval=POSTPROCESS_MANIFEST_SAVE_INTERVAL)
+        report = export_labels([ORIGINAL_LABEL_DIR], PROCESSED_LABEL_DIR, manifest)
+        print_report(report)
+        return report
+    if args.manifest:
+        manifest = ProcessingManifest(args.manifest, processing_params(PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR), force=args.full,
+                                      save_interval=POSTPROCESS_MANIFEST_SAVE_INTERVAL)
+    report = process_folders([ORIGINAL_IMAGE_DIR], [ORIGINAL_LABEL_DIR], PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR,
+                             workers=args.workers, chunksize=args.chunksize, manifest=manifest)
+    print_report(report)
+    return report
 
 # Run the main function
-process_folders([ORIGINAL_IMAGE_DIR], [ORIGINAL_LABEL_DIR], PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, PLOT_IMAGE_DIR)
+if __name__ == "__main__":
+    main()
 
 
 
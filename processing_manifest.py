@@ -0,0 +1,105 @@
+# processing_manifest.py
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_VERSION = 1
+
+
+# Content hash of one or more files
+def file_digest(*paths):
+    digest = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+def file_state(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# Records the size, mtime and content hash of every processed input together
+# with the parameters that produced its outputs, so reruns only touch new or
+# changed captures (or those with a missing output). Any change to the
+# parameters invalidates every entry. Changes are saved at least every
+# save_interval seconds, so an interrupted run keeps most of its progress.
+class ProcessingManifest:
+
+    def __init__(self, path, params, force=False, save_interval=30.0):
+        self.path = path
+        self.params = params
+        self.entries = {}
+        self.params_changed = False
+        self.save_interval = save_interval
+        self.last_save = time.monotonic()
+
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            self.entries = data.get('entries', {})
+            self.params_changed = data.get('version') != MANIFEST_VERSION or data.get('params') != params
+        self.params_changed = self.params_changed or force
+        self.dirty = self.params_changed
+
+    # Return the current source state if the input must be (re)processed, else
+    # None. Inputs without an image (label-only runs) pass image_path=None.
+    def check(self, key, image_path, label_path):
+        paths = [path for path in (image_path, label_path) if path]
+        state = {'image': file_state(image_path) if image_path else None, 'label': file_state(label_path)}
+        entry = self.entries.get(key)
+        if entry is None or self.params_changed:
+            state['hash'] = file_digest(*paths)
+            return state
+
+        if entry['image'] == state['image'] and entry['label'] == state['label']:
+            state['hash'] = entry.get('hash')
+        else:
+            # Touched but identical content: refresh the stat info only
+            state['hash'] = file_digest(*paths)
+            if state['hash'] != entry.get('hash'):
+                return state
+            entry['image'], entry['label'] = state['image'], state['label']
+            self.dirty = True
+
+        # Unchanged, but an output was deleted since
+        if not all(os.path.isfile(path) for path in entry.get('outputs', [])):
+            return state
+        return None
+
+    def record(self, key, state, outputs):
+        self.entries[key] = dict(state, outputs=outputs)
+        self.dirty = True
+        self.checkpoint()
+
+    # Forget an input, returning the outputs it produced
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return []
+        self.dirty = True
+        self.checkpoint()
+        return entry.get('outputs', [])
+
+    def keys(self):
+        return list(self.entries)
+
+    # Save when the last save is more than save_interval seconds old
+    def checkpoint(self):
+        if time.monotonic() - self.last_save >= self.save_interval:
+            self.save()
+
+    def save(self):
+        if not self.dirty:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'params': self.params, 'entries': self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        self.last_save = time.monotonic()
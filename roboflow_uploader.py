@@ -1,43 +1,492 @@
 # roboflow_uploader.py
+import argparse
+import base64
+import email.parser
+import email.policy
+import hashlib
+import json
 import os
-import roboflow
+import random
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from google_upload import TRANSIENT_STATUS_CODES
+from shard_store import ShardReader, image_member
+from upload_journal import CONFIRMED_STATUSES, UploadJournal
 from config.configs import *
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def upload_dataset_to_roboflow(api_key, workspace_url, project_name, num_retries=3):
+
+# Token bucket shared by every upload thread: on average at most rate uploads
+# per second, with bursts of up to burst uploads
+class RateLimiter:
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Take a token if one is available (returns 0), otherwise return the
+    # seconds until the next one
+    def try_acquire(self):
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return
+            time.sleep(delay)
+
+
+# Multipart form body with plain fields and (filename, data, content type) files
+def encode_multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = []
+    for name, value in fields.items():
+        body.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8'))
+    for name, (filename, data, content_type) in files.items():
+        body.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                    f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + data + b'\r\n')
+    body.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(body), f"multipart/form-data; boundary={boundary}"
+
+# Field name -> bytes of a multipart form body
+def decode_multipart(content_type, body):
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    if not message.is_multipart():
+        return {}
+    return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True) for part in message.iter_parts()}
+
+
+# Roboflow project behind the REST upload API, spoken over plain HTTP: the
+# image goes up first, then its annotation. Used for the local mock server or
+# any other Roboflow-compatible endpoint. Network errors and 408/429/5xx
+# responses are retried with exponential backoff; a Retry-After holds back
+# every worker of the project, so fresh requests don't starve the retries.
+# Other error responses are returned as rejections.
+class HTTPProject:
+
+    def __init__(self, api_url, api_key, project_name, timeout=30.0, backoff=0.5):
+        self.api_url = api_url.rstrip('/')
+        self.api_key = api_key
+        self.project_name = project_name
+        self.timeout = timeout
+        self.backoff = backoff
+        self.retries = 0
+        self.resume_at = 0.0  # monotonic time no request is sent before
+        self.lock = threading.Lock()
+
+    def post(self, path, params, body, content_type, num_retries):
+        query = urllib.parse.urlencode(dict(params, api_key=self.api_key or ''))
+        url = f"{self.api_url}/dataset/{self.project_name}/{path}?{query}"
+        for attempt in range(num_retries + 1):
+            delay = self.resume_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    return json.loads(response.read() or b'{}')
+            except urllib.error.HTTPError as e:
+                payload = e.read()
+                if e.code not in TRANSIENT_STATUS_CODES:
+                    try:
+                        rejection = json.loads(payload)
+                    except ValueError:
+                        rejection = {'error': f"HTTP {e.code}: {e.reason}"}
+                    return dict(rejection, success=False)
+                if attempt == num_retries:
+                    raise
+                retry_after = e.headers.get('Retry-After')
+            except (urllib.error.URLError, OSError):
+                if attempt == num_retries:
+                    raise
+                retry_after = None
+            try:
+                retry_after = float(retry_after)
+            except (TypeError, ValueError):
+                retry_after = None
+            with self.lock:
+                self.retries += 1
+                if retry_after is not None:
+                    self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+            if retry_after is None:
+                time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def single_upload(self, image_path=None, annotation_path=None, annotation_labelmap=None, batch_name=None, num_retry_uploads=0, **kwargs):
+        name = os.path.basename(image_path)
+        with open(image_path, 'rb') as f:
+            body, content_type = encode_multipart({'name': name}, {'file': (name, f.read(), 'image/jpeg')})
+        image = self.post('upload', {'name': name, 'batch': batch_name or ''}, body, content_type, num_retry_uploads)
+        if not image.get('id') or annotation_path is None:
+            return {'image': image, 'annotation': None}
+
+        with open(annotation_path, 'r') as f:
+            annotation_body = json.dumps({'annotationFile': f.read(), 'labelmap': annotation_labelmap}).encode('utf-8')
+        annotation = self.post(f"annotate/{image['id']}", {'name': os.path.basename(annotation_path)},
+                               annotation_body, 'application/json', num_retry_uploads)
+        return {'image': image, 'annotation': annotation}
+
+
+# Local stand-in for the Roboflow upload API, so the upload flow can run
+# offline over real HTTP. Images are deduplicated by content, annotations are
+# checked against the labelmap, and it can add latency, fail a fraction of
+# requests with 503 and throttle above a request rate (with bursts of up to
+# burst requests) with 429 + Retry-After.
+class MockRoboflowServer:
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, rate_limit=0.0, burst=1, api_key=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.limiter = RateLimiter(rate_limit, burst)
+        self.api_key = api_key
+        self.images = {}
+        self.digests = {}
+        self.counts = {'requests': 0, 'throttled': 0, 'failed': 0}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # Uploaded images with their annotations, in upload order
+    @property
+    def uploads(self):
+        with self.lock:
+            return list(self.images.values())
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                url = urllib.parse.urlsplit(self.path)
+                query = dict(urllib.parse.parse_qsl(url.query))
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                status, payload, headers = mock.respond(url.path.strip('/').split('/'), query, self.headers.get('Content-Type', ''), body)
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    # (status, JSON payload, extra headers) for one request
+    def respond(self, parts, query, content_type, body):
+        time.sleep(self.latency)
+        with self.lock:
+            self.counts['requests'] += 1
+        if self.api_key is not None and query.get('api_key') != self.api_key:
+            return 401, {'error': "Invalid API key"}, {}
+        delay = self.limiter.try_acquire()
+        if delay:
+            with self.lock:
+                self.counts['throttled'] += 1
+            return 429, {'error': "Rate limit exceeded"}, {'Retry-After': f"{delay:.3f}"}
+        if random.random() < self.failure_rate:
+            with self.lock:
+                self.counts['failed'] += 1
+            return 503, {'error': "Service unavailable"}, {}
+
+        if len(parts) == 3 and parts[0] == 'dataset' and parts[2] == 'upload':
+            return self.upload_image(parts[1], query, content_type, body)
+        if len(parts) == 4 and parts[0] == 'dataset' and parts[2] == 'annotate':
+            return self.annotate(parts[3], body)
+        return 404, {'error': "Not found"}, {}
+
+    def upload_image(self, project_name, query, content_type, body):
+        image = decode_multipart(content_type, body).get('file')
+        if not image:
+            return 400, {'error': "No image in the request"}, {}
+        digest = hashlib.md5(image).hexdigest()
+        with self.lock:
+            image_id = self.digests.get((project_name, digest))
+            if image_id is not None:
+                return 200, {'duplicate': True, 'id': image_id}, {}
+            image_id = self.digests[(project_name, digest)] = uuid.uuid4().hex[:20]
+            self.images[image_id] = {'id': image_id, 'project': project_name, 'name': query.get('name'),
+                                     'batch': query.get('batch'), 'bytes': len(image), 'annotation': None}
+        return 200, {'success': True, 'id': image_id}, {}
+
+    # YOLO annotations: five numbers per line and a class id from the labelmap
+    def annotate(self, image_id, body):
+        with self.lock:
+            record = self.images.get(image_id)
+        if record is None:
+            return 404, {'error': f"Unknown image {image_id}"}, {}
+        try:
+            request = json.loads(body)
+            labelmap = request.get('labelmap') or {}
+            for line in request['annotationFile'].splitlines():
+                if not line.strip():
+                    continue
+                values = line.split()
+                if len(values) != 5:
+                    raise ValueError(f"Expected 5 values, got {len(values)}")
+                [float(value) for value in values]
+                if labelmap and values[0] not in labelmap:
+                    raise ValueError(f"Class {values[0]} is not in the labelmap")
+        except (KeyError, ValueError) as e:
+            return 400, {'error': f"Invalid annotation: {e}"}, {}
+        with self.lock:
+            record['annotation'] = request['annotationFile']
+        return 200, {'success': True}, {}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='roboflow-mock', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Open the Roboflow project, creating it on first use
+def connect_project(api_key, workspace_url, project_name):
+    # Imported here so mock runs work offline without the Roboflow SDK
+    import roboflow
+
+    # Initialize Roboflow API with the provided API key
+    rf = roboflow.Roboflow(api_key=api_key)
+
+    # Get the workspace using the workspace URL
+    workspace = rf.workspace(workspace_url)
+    try:
+        return workspace.project(project_name)
+    except Exception:
+        print(f"Creating Roboflow project {project_name}")
+        return workspace.create_project(project_name, PROJECT_TYPE, PROJECT_LICENSE, project_name)
+
+def sample_digest(*parts):
+    md5 = hashlib.md5()
+    for part in parts:
+        md5.update(part)
+    return base64.b64encode(md5.digest()).decode('ascii')
+
+def file_digest(*paths):
+    md5 = hashlib.md5()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                md5.update(block)
+    return base64.b64encode(md5.digest()).decode('ascii')
+
+def is_uploaded(entry, digest):
+    return entry is not None and entry['status'] in CONFIRMED_STATUSES and entry['md5'] == digest
+
+# Processed image/label pairs not uploaded yet (or changed since their upload)
+def list_file_samples(image_dir, label_dir, journal_entries):
+    samples, unchanged = [], 0
+    for filename in sorted(os.listdir(image_dir)) if os.path.isdir(image_dir) else []:
+        if not filename.endswith(('.jpg', '.png')):
+            continue
+        image_path = os.path.join(image_dir, filename)
+        label_path = os.path.join(label_dir, os.path.splitext(filename)[0] + '.txt')
+        if not os.path.isfile(label_path):
+            continue
+        image_stat, label_stat = os.stat(image_path), os.stat(label_path)
+        size = image_stat.st_size + label_stat.st_size
+        mtime_ns = max(image_stat.st_mtime_ns, label_stat.st_mtime_ns)
+
+        # Unchanged since its confirmed upload: skip without hashing
+        entry = journal_entries.get(image_path)
+        if entry is not None and entry['status'] in CONFIRMED_STATUSES and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+            unchanged += 1
+            continue
+        digest = file_digest(image_path, label_path)
+        if is_uploaded(entry, digest):
+            unchanged += 1
+            continue
+        samples.append({'source': image_path, 'image': image_path, 'label': label_path, 'size': size, 'mtime_ns': mtime_ns, 'md5': digest})
+    return samples, unchanged
+
+# Samples of a processed shard store not uploaded yet. Stores are append-only,
+# so a sample's shard and member offsets identify its content.
+def list_shard_samples(shard_dir, journal_entries):
+    reader = ShardReader(shard_dir)
+    samples, unchanged = [], 0
+    for key in reader.keys():
+        record = reader.entries[key]
+        image_ext = image_member(record)
+        if image_ext is None or 'txt' not in record['members']:
+            continue
+        source = os.path.join(shard_dir, key)
+        digest = sample_digest(json.dumps([record['shard'], record['members']], sort_keys=True).encode('utf-8'))
+        if is_uploaded(journal_entries.get(source), digest):
+            unchanged += 1
+            continue
+        size = sum(size for _, size in record['members'].values())
+        samples.append({'source': source, 'shard_dir': shard_dir, 'key': key, 'image_ext': image_ext, 'size': size, 'mtime_ns': None, 'md5': digest})
+    return samples, unchanged
+
+# Write the shard samples of one batch to image/label files for the SDK
+def materialize_shard_samples(samples, directory):
+    readers = {}
+    for sample in samples:
+        reader = readers.get(sample['shard_dir'])
+        if reader is None:
+            reader = readers[sample['shard_dir']] = ShardReader(sample['shard_dir'])
+        sample['image'] = os.path.join(directory, f"{sample['key']}.{sample['image_ext']}")
+        sample['label'] = os.path.join(directory, f"{sample['key']}.txt")
+        with open(sample['image'], 'wb') as f:
+            f.write(reader.read(sample['key'], sample['image_ext']))
+        with open(sample['label'], 'wb') as f:
+            f.write(reader.read(sample['key'], 'txt'))
+    for reader in readers.values():
+        reader.close()
+
+def upload_sample(project, limiter, sample, batch_name, labelmap, num_retries):
+    limiter.acquire()
+    start = time.perf_counter()
+    outcome = {'status': 'failed', 'error': None, 'image_id': None}
     try:
-        # Initialize Roboflow API with the provided API key
-        rf = roboflow.Roboflow(api_key=api_key)
-        
-        # Get the workspace using the workspace URL
-        workspace = rf.workspace(workspace_url)
-        
-        # Generate a unique batch name using a UUID
-        roboflow_batch_name = f"sdk_batch_{str(uuid.uuid4())[:8]}"
-        
-        # Upload the dataset to the Roboflow project
-        workspace.upload_dataset(
-            dataset_path=PROCESSED_DIR, # (str): path to the dataset
-            project_name=project_name, # (str): name of the project
-            num_workers=NUM_WORKERS, # (int): number of workers to use for parallel uploads
-            dataset_format=DATASET_FORMAT, # (str): format of the dataset (`voc`, `yolov8`, `yolov5`)
-            project_license=PROJECT_LICENSE, # (str): license of the project (set to `private` for private projects, only available for paid customers)
-            project_type=PROJECT_TYPE, # (str): type of the project (only `object-detection` is supported)
-            batch_name=roboflow_batch_name, # (str): name of the batch (optional, default is None)
-            num_retries=num_retries # (int): number of retries (optional, default is 0)
+        response = project.single_upload(
+            image_path=sample['image'],
+            annotation_path=sample['label'],
+            annotation_labelmap=labelmap,
+            batch_name=batch_name,
+            num_retry_uploads=num_retries
         )
-        
-        print(f"Dataset uploaded with batch name: {roboflow_batch_name}")
-    
+        image = response.get('image') or {}
+        annotation = response.get('annotation') or {}
+        outcome['image_id'] = image.get('id')
+        if image.get('duplicate'):
+            outcome['status'] = 'present'
+        elif not (image.get('success') or image.get('id')):
+            outcome['error'] = f"Image rejected: {image.get('error') or response}"
+        elif annotation and not annotation.get('success', True):
+            outcome['error'] = f"Annotation rejected: {annotation.get('error') or annotation}"
+        else:
+            outcome['status'] = 'uploaded'
     except Exception as e:
-        print(f"An error occurred: {str(e)}")
+        outcome['error'] = f"{type(e).__name__}: {e}"
+    outcome['seconds'] = time.perf_counter() - start
+    return outcome
+
+# Upload only the samples missing from the journal, in size-bounded batches
+def upload_new_samples(project, journal, storage=STORAGE_BACKEND, batch_size=ROBOFLOW_BATCH_SIZE, rate=ROBOFLOW_RATE_LIMIT,
+                       concurrency=NUM_WORKERS, num_retries=ROBOFLOW_RETRIES, full=False):
+    start_time = time.perf_counter()
+    journal_entries = {} if full else journal.entries()
+    if storage == 'shards':
+        samples, unchanged = list_shard_samples(PROCESSED_SHARD_DIR, journal_entries)
+    else:
+        samples, unchanged = list_file_samples(PROCESSED_IMAGE_DIR, PROCESSED_LABEL_DIR, journal_entries)
+
+    report = {'total': len(samples) + unchanged, 'unchanged': unchanged, 'uploaded': 0, 'present': 0, 'failed': 0, 'batches': 0, 'errors': []}
+    labelmap = {class_id: class_name for class_id, class_name in enumerate(MODEL_CLASSES)}
+    limiter = RateLimiter(rate, burst=concurrency)
+
+    for i in range(0, len(samples), batch_size):
+        batch = samples[i:i + batch_size]
+        # Generate a unique batch name
+        batch_name = f"sdk_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8]}"
+        batch_dir = None
+        if storage == 'shards':
+            batch_dir = tempfile.mkdtemp(prefix='roboflow_batch_')
+            materialize_shard_samples(batch, batch_dir)
+
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = {executor.submit(upload_sample, project, limiter, sample, batch_name, labelmap, num_retries): sample for sample in batch}
+                for future in as_completed(futures):
+                    sample, outcome = futures[future], future.result()
+                    journal.record(sample['source'], batch_name, outcome['status'], sample['size'], sample['mtime_ns'],
+                                   sample['md5'], None, 1, outcome['error'])
+                    report[outcome['status']] += 1
+                    if outcome['error']:
+                        report['errors'].append((sample['source'], outcome['error']))
+                    print(f"[{outcome['status']}] {sample['source']} ({outcome['seconds']:.2f}s)")
+        finally:
+            journal.commit()
+            if batch_dir is not None:
+                shutil.rmtree(batch_dir, ignore_errors=True)
 
+        report['batches'] += 1
+        print(f"Batch {batch_name}: {len(batch)} samples")
+
+    report['elapsed'] = time.perf_counter() - start_time
+    sent = report['uploaded'] + report['present'] + report['failed']
+    report['samples_per_second'] = sent / report['elapsed'] if report['elapsed'] else 0.0
+    return report
+
+def print_report(report):
+    for source, error in report['errors']:
+        print(f"[failed] {source}: {error}")
+    print(f"Uploaded: {report['uploaded']}, Duplicates: {report['present']}, Failed: {report['failed']}, Unchanged: {report['unchanged']} "
+          f"of {report['total']} samples in {report['batches']} batches, {report['elapsed']:.2f}s ({report['samples_per_second']:.1f} samples/sec)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload new processed samples to Roboflow")
+    parser.add_argument('--batch-size', type=int, default=ROBOFLOW_BATCH_SIZE, help="Samples per Roboflow batch")
+    parser.add_argument('--rate', type=float, default=ROBOFLOW_RATE_LIMIT, help="Uploads per second across all workers (0 disables the limit)")
+    parser.add_argument('--concurrency', type=int, default=NUM_WORKERS, help="Concurrent uploads")
+    parser.add_argument('--journal', default=ROBOFLOW_JOURNAL_PATH, help="SQLite journal of uploaded samples")
+    parser.add_argument('--full', action='store_true', help="Upload every sample, ignoring the journal")
+    parser.add_argument('--storage', choices=('files', 'shards'), default=STORAGE_BACKEND, help="Read processed samples from files or a shard store")
+    parser.add_argument('--api-url', help="Upload over HTTP to this Roboflow-compatible API instead of through the SDK")
+    parser.add_argument('--mock', action='store_true', help="Upload over HTTP to a local mock server instead of Roboflow")
+    parser.add_argument('--mock-latency', type=float, default=0.05, help="Seconds per mock request")
+    parser.add_argument('--mock-failure-rate', type=float, default=0.0, help="Fraction of mock requests that fail with 503")
+    parser.add_argument('--mock-rate-limit', type=float, default=0.0, help="Mock requests per second before it answers 429 (0 disables)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    mock = None
+    if args.mock:
+        mock = MockRoboflowServer(latency=args.mock_latency, failure_rate=args.mock_failure_rate, rate_limit=args.mock_rate_limit).start()
+        project = HTTPProject(mock.url, 'mock', 'mock-project')
+    elif args.api_url:
+        project = HTTPProject(args.api_url, os.getenv('ROBOFLOW_API_KEY'), os.getenv('PROJECT_NAME'))
+    else:
+        project = connect_project(os.getenv('ROBOFLOW_API_KEY'), os.getenv('WORKSPACE_URL'), os.getenv('PROJECT_NAME'))
+
+    journal = UploadJournal(args.journal, batch_size=ROBOFLOW_JOURNAL_BATCH_SIZE)
+    try:
+        report = upload_new_samples(project, journal, args.storage, args.batch_size, args.rate, args.concurrency, full=args.full)
+    finally:
+        journal.close()
+        if mock is not None:
+            mock.stop()
+    print_report(report)
+    return report
 
-upload_dataset_to_roboflow(
-    api_key=os.getenv('ROBOFLOW_API_KEY'),
-    workspace_url=os.getenv('WORKSPACE_URL'),
-    project_name=os.getenv('PROJECT_NAME')
-)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+# shard_store.py
+import argparse
+import io
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+import uuid
+import cv2
+from config.configs import *
+
+try:
+    import fcntl
+except ImportError:  # Windows: a writer's lock file counts as held while it exists
+    fcntl = None
+
+# Every store directory holds shard-<session>-NNNNNN.tar files plus an append-only JSONL
+# index with one record per sample: its shard, the byte offset and size of
+# each member (so a sample is read with one seek) and its metadata. A
+# {"sealed": shard} record marks a shard that will never be written again.
+# Every open writer holds writer-<session>.lock, so others can tell its
+# shards are still being written.
+INDEX_NAME = 'index.jsonl'
+SHARD_PATTERN = re.compile(r'^shard-(?:(?P<session>\d{14}-[0-9a-f]{8})-)?\d{6}\.tar$')
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png')
+
+# Metadata app.py encodes in capture file names
+CAPTURE_NAME = re.compile(r'^(?:(?P<stream>cam\d+)_)?(?P<class_name>.+)_(?P<class_id>\d+)_(?P<confidence>[\d.]+)_(?P<track_id>[^_]+)_SSC_(?P<screenshot>\d+)$')
+FRAME_NAME = re.compile(r'^(?:(?P<stream>cam\d+)_)?frame_(?P<frame>\d+)_(?P<objects>\d+)obj$')
+
+
+# Recover the metadata of a capture from its file name (empty if unknown)
+def parse_capture_name(key):
+    match = CAPTURE_NAME.match(key) or FRAME_NAME.match(key)
+    if match is None:
+        return {}
+    metadata = {name: value for name, value in match.groupdict().items() if value is not None}
+    for name in ('class_id', 'screenshot', 'frame', 'objects'):
+        if name in metadata:
+            metadata[name] = int(metadata[name])
+    if 'confidence' in metadata:
+        metadata['confidence'] = float(metadata['confidence'])
+    return metadata
+
+# Encode the images and texts of one sample into member bytes keyed by extension
+def encode_sample_files(images, texts, jpeg_quality=95):
+    files = {}
+    for ext, image in images.items():
+        if image is None:
+            continue
+        ok, encoded = cv2.imencode('.' + ext.split('.')[-1], image, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+        if not ok:
+            raise ValueError(f"image encoding failed for .{ext}")
+        files[ext] = encoded.tobytes()
+    for ext, text in texts.items():
+        files[ext] = text.encode('utf-8')
+    return files
+
+# Extension of the image member of an index record
+def image_member(record):
+    for ext in IMAGE_EXTENSIONS:
+        if ext in record['members']:
+            return ext
+    return None
+
+def list_shards(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if SHARD_PATTERN.match(name))
+
+# Names of the shards the index marks as sealed (closed for good), whether or
+# not they are still in the directory
+def sealed_shards(directory):
+    sealed = set()
+    index_path = os.path.join(directory, INDEX_NAME)
+    if not os.path.isfile(index_path):
+        return sealed
+    with open(index_path, 'r') as f:
+        for line in f:
+            if '"sealed"' not in line:
+                continue
+            try:
+                sealed.add(json.loads(line)['sealed'])
+            except (ValueError, KeyError):
+                continue
+    return sealed
+
+def lock_path(directory, session):
+    return os.path.join(directory, f"writer-{session}.lock")
+
+# Open and exclusively lock a writer lock file. Returns the open file, or None
+# if another writer (in this or another process) holds the lock.
+def acquire_lock(path):
+    lock_file = open(path, 'a+')
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+# Lock of a writer session that closed or died, so its open shards can be
+# sealed; None while that writer is still running
+def claim_stale_session(directory, session):
+    path = lock_path(directory, session)
+    if fcntl is None:
+        return None if os.path.exists(path) else open(path, 'a+')
+    return acquire_lock(path)
+
+
+# Appends samples to size-bounded tar shards. A full shard is closed, sealed in
+# the index and never touched again; a new writer always starts a new shard.
+# Thread safe; writers in other threads or processes may share the directory,
+# each one only seals its own shards and those of writers that died.
+# Writers of the same process should share one instance through get_writer.
+class ShardWriter:
+
+    def __init__(self, directory, max_bytes=SHARD_MAX_BYTES, max_samples=SHARD_MAX_SAMPLES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+
+        # Shard names start with the writer's start time and a random suffix, so
+        # they stay unique after earlier shards were uploaded or moved away
+        self.session = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.next_shard = 0
+        self.lock_file = acquire_lock(lock_path(directory, self.session))
+        self.index = open(os.path.join(directory, INDEX_NAME), 'a')
+        self._seal_abandoned()
+        self.shard_name = None
+        self.shard_file = None
+        self.tar = None
+        self.shard_samples = 0
+
+        # Counters
+        self.samples_written = 0
+        self.bytes_written = 0
+        self.shards_written = 0
+
+    def _open_shard(self):
+        self.shard_name = f"shard-{self.session}-{self.next_shard:06d}.tar"
+        self.next_shard += 1
+        self.shard_file = open(os.path.join(self.directory, self.shard_name), 'xb')
+        self.tar = tarfile.open(fileobj=self.shard_file, mode='w')
+        self.shard_samples = 0
+        self.shards_written += 1
+
+    # Seal the shards writers that crashed left open, they are complete up to
+    # their last indexed sample. Shards of running writers are left alone;
+    # shards named before sessions existed have no owner and are sealed.
+    def _seal_abandoned(self):
+        unsealed = {}
+        for shard_name in sorted(set(list_shards(self.directory)) - sealed_shards(self.directory)):
+            unsealed.setdefault(SHARD_PATTERN.match(shard_name).group('session'), []).append(shard_name)
+        for session, shard_names in unsealed.items():
+            stale_lock = None
+            if session is not None:
+                stale_lock = claim_stale_session(self.directory, session)
+                if stale_lock is None:
+                    continue
+            for shard_name in shard_names:
+                self._seal(shard_name)
+            if stale_lock is not None:
+                self._release(stale_lock, lock_path(self.directory, session))
+
+    @staticmethod
+    def _release(lock_file, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        lock_file.close()
+
+    def _seal(self, shard_name):
+        self.index.write(json.dumps({'sealed': shard_name, 'time': time.time()}) + '\n')
+        self.index.flush()
+
+    def _close_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+            self.shard_file.close()
+            self.tar = None
+            self.shard_file = None
+            self._seal(self.shard_name)
+
+    # Append one sample; files maps extension -> bytes, metadata is any JSON dict
+    def write(self, key, files, metadata=None):
+        with self.lock:
+            if self.tar is None or self.tar.offset >= self.max_bytes or self.shard_samples >= self.max_samples:
+                self._close_shard()
+                self._open_shard()
+
+            members = {}
+            for ext, data in files.items():
+                info = tarfile.TarInfo(f"{key}.{ext}")
+                info.size = len(data)
+                info.mtime = int(time.time())
+                self.tar.addfile(info, io.BytesIO(data))
+                # Data ends at the current offset minus the block padding
+                members[ext] = [self.tar.offset - (len(data) + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE * tarfile.BLOCKSIZE, len(data)]
+                self.bytes_written += len(data)
+            self.shard_file.flush()
+
+            # The index line goes last, so a crash never indexes a partial sample
+            record = {'key': key, 'shard': self.shard_name, 'members': members, 'time': time.time(), 'meta': metadata or {}}
+            self.index.write(json.dumps(record) + '\n')
+            self.index.flush()
+            self.shard_samples += 1
+            self.samples_written += 1
+
+    def close(self):
+        with self.lock:
+            self._close_shard()
+            self.index.close()
+            if self.lock_file is not None:
+                self._release(self.lock_file, lock_path(self.directory, self.session))
+                self.lock_file = None
+
+    def stats(self):
+        return {'samples': self.samples_written, 'bytes': self.bytes_written, 'shards': self.shards_written}
+
+
+# Random and sequential access to a shard store through its index. Later
+# records of the same key win, so reprocessed samples replace older ones.
+# Samples whose shard is no longer in the directory (uploaded and removed)
+# are left out.
+class ShardReader:
+
+    def __init__(self, directory, entries=None):
+        self.directory = directory
+        self.entries = entries if entries is not None else self._load_index()
+        self.files = {}
+        self.lock = threading.Lock()
+
+    def _load_index(self):
+        entries = {}
+        index_path = os.path.join(self.directory, INDEX_NAME)
+        if not os.path.isfile(index_path):
+            return entries
+        with open(index_path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line after a crash
+                if 'key' not in record:
+                    continue  # seal record
+                entries.pop(record['key'], None)
+                entries[record['key']] = record
+        present = set(list_shards(self.directory))
+        return {key: record for key, record in entries.items() if record['shard'] in present}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def keys(self):
+        return list(self.entries)
+
+    def metadata(self, key):
+        return self.entries[key]['meta']
+
+    def read(self, key, ext):
+        record = self.entries[key]
+        offset, size = record['members'][ext]
+        with self.lock:
+            shard_file = self.files.get(record['shard'])
+            if shard_file is None:
+                shard_file = self.files[record['shard']] = open(os.path.join(self.directory, record['shard']), 'rb')
+            shard_file.seek(offset)
+            return shard_file.read(size)
+
+    # Yield (key, {ext: bytes}, metadata) in shard order for sequential reads
+    def samples(self, keys=None):
+        keys = self.keys() if keys is None else keys
+        ordered = sorted(keys, key=lambda key: (self.entries[key]['shard'], min(offset for offset, _ in self.entries[key]['members'].values())))
+        for key in ordered:
+            yield key, {ext: self.read(key, ext) for ext in self.entries[key]['members']}, self.metadata(key)
+
+    def close(self):
+        with self.lock:
+            for shard_file in self.files.values():
+                shard_file.close()
+            self.files = {}
+
+
+# One writer per store directory, shared by every thread of the process
+_writers = {}
+_writers_lock = threading.Lock()
+
+def get_writer(directory):
+    with _writers_lock:
+        writer = _writers.get(directory)
+        if writer is None:
+            writer = _writers[directory] = ShardWriter(directory)
+        return writer
+
+def close_writers():
+    with _writers_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+
+
+# Convert a file layout (images, labels and optional plots directories) into a shard store
+def pack_directory(image_dir, label_dir, shard_dir, plot_dir=None):
+    writer = ShardWriter(shard_dir)
+    packed = 0
+    for filename in sorted(os.listdir(image_dir)):
+        key, ext = os.path.splitext(filename)
+        ext = ext[1:].lower()
+        if ext not in IMAGE_EXTENSIONS:
+            continue
+        files = {}
+        with open(os.path.join(image_dir, filename), 'rb') as f:
+            files[ext] = f.read()
+        label_path = os.path.join(label_dir, key + '.txt')
+        if os.path.isfile(label_path):
+            with open(label_path, 'rb') as f:
+                files['txt'] = f.read()
+        if plot_dir and os.path.isfile(os.path.join(plot_dir, filename)):
+            with open(os.path.join(plot_dir, filename), 'rb') as f:
+                files['plot.' + ext] = f.read()
+        writer.write(key, files, parse_capture_name(key))
+        packed += 1
+    writer.close()
+    return packed
+
+# Convert a shard store back into the file layout, byte for byte
+def unpack_shards(shard_dir, image_dir, label_dir, plot_dir=None):
+    reader = ShardReader(shard_dir)
+    for directory in (image_dir, label_dir, plot_dir):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    unpacked = 0
+    for key, files, _ in reader.samples():
+        for ext, data in files.items():
+            if ext == 'txt':
+                path = os.path.join(label_dir, f"{key}.txt")
+            elif ext.startswith('plot.'):
+                if not plot_dir:
+                    continue
+                path = os.path.join(plot_dir, f"{key}.{ext[5:]}")
+            else:
+                path = os.path.join(image_dir, f"{key}.{ext}")
+            with open(path, 'wb') as f:
+                f.write(data)
+        unpacked += 1
+    reader.close()
+    return unpacked
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert captures between the file layout and shard stores")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('pack', "Pack image/label files into a shard store"), ('unpack', "Unpack a shard store into image/label files")):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument('--images', default=ORIGINAL_IMAGE_DIR)
+        subparser.add_argument('--labels', default=ORIGINAL_LABEL_DIR)
+        subparser.add_argument('--plots', help="Optional plot image directory")
+        subparser.add_argument('--shards', default=ORIGINAL_SHARD_DIR)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    start_time = time.perf_counter()
+    if args.command == 'pack':
+        count = pack_directory(args.images, args.labels, args.shards, args.plots)
+        print(f"Packed {count} samples into {args.shards} in {time.perf_counter() - start_time:.2f}s")
+    else:
+        count = unpack_shards(args.shards, args.images, args.labels, args.plots)
+        print(f"Unpacked {count} samples from {args.shards} in {time.perf_counter() - start_time:.2f}s")
+    return count
+
+if __name__ == "__main__":
+    main()
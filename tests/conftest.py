@@ -0,0 +1,6 @@
+# conftest.py
+import os
+import sys
+
+# The modules live at the repository root and import config.configs from there
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
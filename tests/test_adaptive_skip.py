@@ -0,0 +1,83 @@
+# test_adaptive_skip.py
+import pytest
+
+import app
+from adaptive_skip import AdaptiveSkipController
+
+FPS = 30
+
+
+# Replay-style loop: every processed frame costs `cost` seconds and advances
+# the stream by (skip + 1) frames. Returns the skips chosen.
+def run(controller, cost, frames, active=False):
+    skips = []
+    for _ in range(frames):
+        skips.append(controller.update(cost, active, (controller.skip + 1) / FPS))
+    return skips
+
+
+def test_cheap_frames_are_never_skipped():
+    controller = AdaptiveSkipController(FPS, initial_skip=3)
+
+    assert controller.skip == 3
+    assert run(controller, 0.005, 20) == [0] * 20
+    assert controller.lag == 0.0
+
+def test_skip_settles_where_the_stream_keeps_up_with_the_cost():
+    controller = AdaptiveSkipController(FPS, motion_budget=0.1)
+
+    skips = run(controller, 0.1, 50)
+
+    # 0.1 s per frame at 30 FPS: three stream frames per processed frame
+    assert skips[-10:] == [2] * 10
+    assert controller.stats()['max_lag_seconds'] <= 0.1 + 1e-9
+
+def test_skip_never_exceeds_max_skip():
+    controller = AdaptiveSkipController(FPS, max_skip=5)
+
+    assert set(run(controller, 2.0, 20)) == {5}
+    # The lag keeps growing, but the skip stays bounded
+    assert controller.lag > 1.0
+
+def test_active_frames_use_their_own_budget_and_cost():
+    controller = AdaptiveSkipController(FPS, motion_budget=0.1, active_budget=0.5)
+    run(controller, 0.01, 10)
+    motion_skip = controller.update(0.01, False, 1 / FPS, lag=0.45)
+
+    # The same lag is within the active budget; the first active frame uses
+    # its own cost instead of ramping up from the motion cost
+    active_skip = controller.update(0.2, True, 1 / FPS, lag=0.45)
+
+    assert motion_skip == 10
+    assert active_skip == 4
+    assert controller.stats()['motion_cost_ms'] == pytest.approx(10.0)
+    assert controller.stats()['active_cost_ms'] == pytest.approx(200.0)
+
+def test_measured_lag_overrides_the_model():
+    controller = AdaptiveSkipController(FPS, motion_budget=0.1)
+
+    assert controller.update(0.01, False, 1 / FPS, lag=0.5) > 0
+    assert controller.update(0.01, False, 1 / FPS, lag=0.0) == 0
+    assert controller.stats()['changes'] == 2
+
+class FakeReader:
+
+    def __init__(self):
+        self.skip = None
+        self.last_frame_time = 0.0
+
+    def set_skip(self, skip):
+        self.skip = skip
+
+    def capture_fps(self):
+        return FPS
+
+def test_app_applies_the_chosen_skip_to_the_reader():
+    controller = AdaptiveSkipController(FPS, max_skip=4)
+    reader = FakeReader()
+    state = app.DetectionState()
+    state.frame_interval = 1 / FPS
+
+    app.adapt_skip(controller, reader, state, 1.0, False, 0, replay=True)
+
+    assert reader.skip == 4 and controller.fps == FPS
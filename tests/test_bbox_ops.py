@@ -0,0 +1,56 @@
+# test_bbox_ops.py
+import numpy as np
+import pytest
+
+from bbox_ops import convert_raw_labels, voc_to_yolo, yolo_to_voc
+from post_processer import export_labels
+
+# (VOC box, image width, image height, YOLO box) as produced by pybboxes 0.2.0
+# BoundingBox.from_voc(...).to_yolo(); from_yolo(...).to_voc() returns the VOC box
+PYBBOXES_CASES = [
+    ((10, 20, 110, 70), 640, 480, (0.09375, 0.09375, 0.15625, 0.10416666666666667)),
+    ((0, 0, 320, 240), 320, 240, (0.5, 0.5, 1.0, 1.0)),
+    ((37, 101, 250, 333), 480, 480, (0.2989583333333333, 0.45208333333333334, 0.44375, 0.48333333333333334)),
+    ((1, 1, 2, 2), 3, 7, (0.5, 0.21428571428571427, 0.3333333333333333, 0.14285714285714285)),
+    ((123, 45, 387, 211), 400, 240, (0.6375, 0.5333333333333333, 0.66, 0.6916666666666667)),
+]
+
+# Raw capture label, crop offset and YOLO box of the square crop, as produced by
+# post_processer.crop_image and pybboxes before the conversion was vectorised
+RAW_CASES = [
+    ((0, 640, 480, 10, 20, 110, 70), 10, (0.10416666666666667, 0.09375, 0.20833333333333334, 0.10416666666666667)),
+    ((2, 640, 480, 500, 100, 620, 400), 140, (0.875, 0.5208333333333334, 0.25, 0.625)),
+    ((1, 640, 360, 200, 50, 300, 300), 140, (0.3055555555555556, 0.4861111111111111, 0.2777777777777778, 0.6944444444444444)),
+    ((5, 1280, 720, 0, 0, 1280, 720), 0, (0.5, 0.5, 1.0, 1.0)),
+]
+
+
+@pytest.mark.parametrize('voc, width, height, yolo', PYBBOXES_CASES)
+def test_voc_to_yolo_matches_pybboxes(voc, width, height, yolo):
+    assert voc_to_yolo(voc, width, height)[0].tolist() == list(yolo)
+
+@pytest.mark.parametrize('voc, width, height, yolo', PYBBOXES_CASES)
+def test_yolo_to_voc_matches_pybboxes(voc, width, height, yolo):
+    assert yolo_to_voc(yolo, width, height)[0].tolist() == list(voc)
+
+def test_raw_labels_convert_like_the_per_file_crop():
+    class_ids, crop_x, yolo, failed = convert_raw_labels(np.array([raw for raw, _, _ in RAW_CASES]))
+
+    assert class_ids.tolist() == [raw[0] for raw, _, _ in RAW_CASES]
+    assert crop_x.tolist() == [offset for _, offset, _ in RAW_CASES]
+    assert yolo.tolist() == [list(box) for _, _, box in RAW_CASES]
+    assert not failed.any()
+
+def test_export_labels_skips_only_the_files_it_cannot_parse(tmp_path):
+    label_dir, output_dir = tmp_path / 'labels', tmp_path / 'processed'
+    label_dir.mkdir()
+    (label_dir / 'good.txt').write_text('0 640 480 10 20 110 70\n')
+    (label_dir / 'float.txt').write_text('0 640 480 10.5 20 110 70\n')
+    (label_dir / 'text.txt').write_text('0 640 480 x 20 110 70\n')
+    (label_dir / 'short.txt').write_text('0 640 480 10 20\n')
+
+    report = export_labels([str(label_dir)], str(output_dir))
+
+    assert (report['total'], report['processed'], report['skipped']) == (4, 1, 3)
+    assert sorted(path.name for path in output_dir.iterdir()) == ['good.txt']
+    assert (output_dir / 'good.txt').read_text().split() == ['0'] + [str(value) for value in RAW_CASES[0][2]]
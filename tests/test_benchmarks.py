@@ -0,0 +1,70 @@
+# test_benchmarks.py
+import json
+
+import pytest
+
+from benchmarks.run import DEFAULT_BASELINE, REGRESSION_TOLERANCE, compare, main, metric_direction, parse_args
+
+# Fast stage, so the quick suite only pays for generating its data
+ONLY = ['--quick', '--only', 'stage.track_update', '--no-memory']
+
+
+def results(**metrics):
+    return {'meta': {'size': 'quick'}, 'results': {'stage.track_update': metrics}}
+
+
+def test_defaults_run_every_suite_at_full_size():
+    args = parse_args([])
+
+    assert (args.quick, args.suite, args.only, args.no_memory) == (False, 'all', None, False)
+    assert args.baseline == DEFAULT_BASELINE and not args.update_baseline and not args.fail_on_regression
+    assert parse_args(['--only', 'stage.motion', 'e2e.postprocess']).only == ['stage.motion', 'e2e.postprocess']
+    with pytest.raises(SystemExit):
+        parse_args(['--suite', 'micro'])
+
+def test_metric_direction():
+    assert metric_direction('frames_per_second') == 1
+    assert metric_direction('peak_memory_mb') == -1
+    assert metric_direction('p50_ms') == -1
+    # Wall time grows with the workload size and is not compared
+    assert metric_direction('seconds') == 0
+
+def test_only_regressions_beyond_the_tolerance_are_flagged():
+    baseline = results(frames_per_second=1000.0, peak_memory_mb=10.0, seconds=1.0)
+    current = results(frames_per_second=1000.0 * (1 - REGRESSION_TOLERANCE - 0.05), peak_memory_mb=10.5, seconds=9.0)
+
+    rows = {row['metric']: row for row in compare(current, baseline)}
+
+    assert set(rows) == {'frames_per_second', 'peak_memory_mb'}
+    assert rows['frames_per_second']['regression'] and not rows['peak_memory_mb']['regression']
+    assert compare(results(peak_memory_mb=12.0), baseline)[0]['regression']
+    # Faster or new benchmarks are never regressions
+    assert not compare(results(frames_per_second=5000.0), baseline)[0]['regression']
+    assert compare({'meta': {}, 'results': {'stage.new': {'frames_per_second': 1.0}}}, baseline) == []
+
+def test_only_runs_the_selected_benchmarks_and_records_a_baseline(tmp_path):
+    baseline_path, output_path = str(tmp_path / 'baseline.json'), str(tmp_path / 'results.json')
+
+    report = main(ONLY + ['--baseline', baseline_path, '--update-baseline', '--output', output_path])
+
+    assert list(report['results']) == ['stage.track_update']
+    assert 'peak_memory_mb' not in report['results']['stage.track_update']
+    with open(baseline_path) as f:
+        assert json.load(f)['results'] == report['results']
+    with open(output_path) as f:
+        assert json.load(f)['meta']['size'] == 'quick'
+
+def test_fail_on_regression_exits_with_status_1(tmp_path, capsys):
+    baseline_path = tmp_path / 'baseline.json'
+    baseline_path.write_text(json.dumps({'meta': {'size': 'quick', 'commit': 'abc1234'},
+                                         'results': {'stage.track_update': {'frames_per_second': 1e12}}}))
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(ONLY + ['--baseline', str(baseline_path), '--fail-on-regression'])
+
+    assert exit_info.value.code == 1
+    assert 'REGRESSION' in capsys.readouterr().out
+    # A baseline of another size is not compared
+    baseline_path.write_text(json.dumps({'meta': {'size': 'full'}, 'results': {'stage.track_update': {'frames_per_second': 1e12}}}))
+    main(ONLY + ['--baseline', str(baseline_path), '--fail-on-regression'])
+    assert 'not comparing' in capsys.readouterr().out
@@ -0,0 +1,118 @@
+# test_capture_reader.py
+import time
+
+import numpy as np
+import pytest
+
+from capture_reader import DROP_FIFO, DROP_LATEST, DROP_NTH, DROP_POLICIES, CaptureReader
+
+
+# Source of numbered frames: frame i is filled with i. Endless without a frame count.
+class FakeCapture:
+
+    def __init__(self, frames=None):
+        self.frames = frames
+        self.position = -1
+        self.retrieved = 0
+
+    def grab(self):
+        if self.frames is not None and self.position + 1 >= self.frames:
+            return False
+        self.position += 1
+        return True
+
+    def retrieve(self):
+        self.retrieved += 1
+        return True, np.full((4, 4), self.position, dtype=np.int32)
+
+def read_all(reader):
+    values = []
+    while True:
+        ret, frame = reader.read(timeout=5.0)
+        if not ret:
+            return values
+        values.append(int(frame[0, 0]))
+
+# Let the reader run to the end of the source before anything is read
+def finished(reader):
+    reader.thread.join(5.0)
+    assert not reader.thread.is_alive()
+    return reader
+
+
+@pytest.mark.parametrize('policy', DROP_POLICIES)
+def test_every_policy_keeps_one_frame_in_skip_plus_one(policy):
+    cap = FakeCapture(10)
+    reader = CaptureReader(cap, policy=policy, skip=2, buffer_size=16, block=True, live=False).start()
+
+    assert read_all(reader) == [0, 3, 6, 9]
+    assert cap.retrieved == 4
+    assert reader.stats()['dropped'] == 6
+
+def test_latest_keeps_only_the_newest_frame():
+    reader = finished(CaptureReader(FakeCapture(10), policy=DROP_LATEST, live=False).start())
+
+    assert read_all(reader) == [9]
+    assert reader.stats()['dropped'] == 9
+
+@pytest.mark.parametrize('policy', [DROP_FIFO, DROP_NTH])
+def test_fifo_keeps_the_newest_frames_in_order(policy):
+    reader = finished(CaptureReader(FakeCapture(10), policy=policy, buffer_size=3, live=False).start())
+
+    assert read_all(reader) == [7, 8, 9]
+    assert reader.stats()['dropped'] == 7
+
+def test_frames_older_than_max_frame_age_are_counted_stale():
+    reader = finished(CaptureReader(FakeCapture(2), policy=DROP_FIFO, max_frame_age=0.2, live=False).start())
+    reader.read()
+    assert reader.stats()['stale'] == 0
+    time.sleep(0.3)
+    reader.read()
+
+    assert reader.stats()['delivered'] == 2
+    assert reader.stats()['stale'] == 1
+    assert reader.last_frame_index == 1
+
+def test_fresh_frames_are_not_stale():
+    reader = CaptureReader(FakeCapture(3), policy=DROP_FIFO, max_frame_age=5.0, block=True, live=False).start()
+
+    assert read_all(reader) == [0, 1, 2]
+    assert reader.stats()['stale'] == 0
+
+def test_end_of_a_recording_is_not_reported_as_an_error(capsys):
+    finished(CaptureReader(FakeCapture(2), live=False).start())
+
+    assert "Unable to grab frame" not in capsys.readouterr().out
+
+def test_a_live_source_that_stops_delivering_is_reported(capsys):
+    finished(CaptureReader(FakeCapture(2)).start())
+
+    assert "Error: Unable to grab frame" in capsys.readouterr().out
+
+def test_read_after_the_end_returns_false_once_the_buffer_is_drained():
+    reader = finished(CaptureReader(FakeCapture(3), policy=DROP_FIFO, buffer_size=8, live=False).start())
+
+    assert read_all(reader) == [0, 1, 2]
+    assert reader.read(timeout=0) == (False, None)
+
+def test_stop_ends_an_endless_source_and_unblocks_readers():
+    reader = CaptureReader(FakeCapture(), policy=DROP_FIFO, buffer_size=2, block=True).start()
+    assert reader.read(timeout=5.0)[0]
+
+    reader.stop()
+
+    assert not reader.thread.is_alive()
+    read_all(reader)
+    assert reader.read(timeout=0) == (False, None)
+
+def test_set_skip_changes_the_skip_while_running():
+    cap = FakeCapture(20)
+    reader = CaptureReader(cap, policy=DROP_FIFO, skip=0, buffer_size=1, block=True, live=False).start()
+    first = [int(reader.read(timeout=5.0)[1][0, 0]) for _ in range(2)]
+    reader.set_skip(4)
+
+    rest = read_all(reader)
+
+    assert first == [0, 1]
+    # Frames already kept before the change come first, then one in five
+    assert np.diff(rest[-3:]).tolist() == [5, 5]
@@ -0,0 +1,85 @@
+# test_cli.py
+import ast
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+import cli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Stand-in subcommand module that returns the arguments it was given
+@pytest.fixture
+def echo_command(monkeypatch):
+    module = types.ModuleType('echo_command')
+    module.main = lambda argv=None: argv
+    monkeypatch.setitem(sys.modules, 'echo_command', module)
+    monkeypatch.setitem(cli.COMMANDS, 'echo', ('echo_command', "Echo the arguments"))
+
+def run_cli(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, 'cli.py'), *args], cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+
+def test_every_subcommand_module_defines_main():
+    for name, (module_name, _) in cli.COMMANDS.items():
+        path = os.path.join(ROOT, *module_name.split('.')) + '.py'
+        with open(path) as f:
+            tree = ast.parse(f.read())
+        assert any(isinstance(node, ast.FunctionDef) and node.name == 'main' for node in tree.body), name
+
+def test_module_arguments_are_passed_through(echo_command):
+    assert cli.main(['echo', '--workers', '4', '--labels-only', 'in/']) == ['--workers', '4', '--labels-only', 'in/']
+    # --help belongs to the subcommand, not to cli.py
+    assert cli.main(['echo', '--help']) == ['--help']
+    assert cli.main(['echo']) == []
+
+def test_unknown_subcommands_are_rejected():
+    with pytest.raises(SystemExit):
+        cli.parse_args(['calibrate'])
+    with pytest.raises(SystemExit):
+        cli.parse_args([])
+
+def test_bench_only_accepts_known_subcommands():
+    args, module_argv = cli.parse_args(['bench', 'labels', 'dedup', '--repeats', '2'])
+
+    assert (args.commands, args.repeats, module_argv) == (['labels', 'dedup'], 2, [])
+    assert cli.parse_args(['bench'])[0].commands == list(cli.COMMANDS)
+    with pytest.raises(SystemExit):
+        cli.parse_args(['bench', 'calibrate'])
+    with pytest.raises(SystemExit):
+        cli.parse_args(['bench', '--quick'])
+
+def test_importing_cli_loads_no_subcommand_dependencies():
+    heavy = ('cv2', 'numpy', 'supervision', 'torch', 'ultralytics', 'google.cloud', 'roboflow')
+    result = subprocess.run([sys.executable, '-c', f"import sys, cli; print([m for m in {heavy!r} if m in sys.modules])"],
+                            cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+    assert result.stdout.strip() == '[]'
+
+def test_subcommand_help_is_the_module_help():
+    result = run_cli('labels', '--help')
+
+    assert result.returncode == 0
+    assert '--min-box-size' in result.stdout
+
+def test_bench_reports_every_command_against_the_interpreter():
+    report = cli.benchmark_startup(['labels'], repeats=1)
+
+    assert [row['command'] for row in report] == ['python', 'labels']
+    assert all(row['error'] is None and row['min_seconds'] <= row['median_seconds'] for row in report)
+
+def test_startup_report_flags_slow_and_failing_commands(capsys):
+    cli.print_startup_report([
+        {'command': 'labels', 'median_seconds': 0.2, 'min_seconds': 0.1, 'error': None},
+        {'command': 'capture', 'median_seconds': 3.0, 'min_seconds': 2.5, 'error': None},
+        {'command': 'upload-gcs', 'median_seconds': 0.1, 'min_seconds': 0.1, 'error': "ModuleNotFoundError: No module named 'google'"},
+    ], target=1.0)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[1].endswith('ok')
+    assert lines[2].endswith('over 1.0s')
+    assert lines[3].endswith("error: ModuleNotFoundError: No module named 'google'")
@@ -0,0 +1,86 @@
+# test_embedding_cache.py
+import os
+
+import pytest
+
+from embedding_cache import cache_path, load_embeddings, read_vocabularies, set_classes_cached
+
+CLASSES = ['chair', 'table', 'sofa']
+
+
+@pytest.fixture
+def weights(tmp_path):
+    path = tmp_path / 'yolov8s-world.pt'
+    path.write_bytes(b'weights v1')
+    return str(path)
+
+# Stand-in for YOLOWorld: set_classes runs the "text encoder" and counts the calls
+class FakeWorldModel:
+
+    def __init__(self, torch):
+        self.torch = torch
+        self.encoded = 0
+        self.predictor = None
+        self.model = type('Model', (), {})()
+        self.model.model = [type('Head', (), {'nc': 80})()]
+
+    def set_classes(self, classes):
+        self.encoded += 1
+        self.model.clip_model = object()
+        self.model.txt_feats = self.torch.arange(len(classes) * 4, dtype=self.torch.float32).reshape(1, len(classes), 4)
+        self.model.model[-1].nc = len(classes)
+        self.model.names = classes
+
+
+def test_cache_key_covers_weights_and_ordered_classes(tmp_path):
+    path = cache_path(str(tmp_path), 'digest-a', CLASSES)
+
+    assert path == cache_path(str(tmp_path), 'digest-a', list(CLASSES))
+    assert path != cache_path(str(tmp_path), 'digest-b', CLASSES)
+    assert path != cache_path(str(tmp_path), 'digest-a', CLASSES[::-1])
+    assert path != cache_path(str(tmp_path), 'digest-a', CLASSES[:2])
+
+def test_a_missing_cache_is_a_miss(tmp_path):
+    assert load_embeddings(str(tmp_path / 'missing.pt'), CLASSES) is None
+
+def test_vocabularies_from_arguments_and_file(tmp_path):
+    vocab_file = tmp_path / 'vocab.txt'
+    vocab_file.write_text('# office\nchair, desk\n\nlamp,\n')
+
+    assert read_vocabularies(['person, dog'], str(vocab_file)) == [['person', 'dog'], ['chair', 'desk'], ['lamp']]
+    assert read_vocabularies(None) == []
+
+def test_the_encoder_only_runs_on_a_miss(tmp_path, weights):
+    torch = pytest.importorskip('torch')
+    cache_dir = str(tmp_path / 'embeddings')
+    first, second = FakeWorldModel(torch), FakeWorldModel(torch)
+
+    assert set_classes_cached(first, weights, CLASSES, cache_dir) is False
+    assert set_classes_cached(second, weights, CLASSES, cache_dir) is True
+
+    assert (first.encoded, second.encoded) == (1, 0)
+    assert not hasattr(first.model, 'clip_model')
+    assert torch.equal(second.model.txt_feats, first.model.txt_feats)
+    assert second.model.model[-1].nc == 3 and second.model.names == CLASSES
+
+def test_other_classes_or_weights_miss(tmp_path, weights):
+    torch = pytest.importorskip('torch')
+    cache_dir = str(tmp_path / 'embeddings')
+    set_classes_cached(FakeWorldModel(torch), weights, CLASSES, cache_dir)
+
+    assert set_classes_cached(FakeWorldModel(torch), weights, CLASSES[:2], cache_dir) is False
+    with open(weights, 'wb') as f:
+        f.write(b'weights v2')
+    assert set_classes_cached(FakeWorldModel(torch), weights, CLASSES, cache_dir) is False
+    assert len(os.listdir(cache_dir)) == 3
+
+def test_an_unreadable_cache_is_rebuilt(tmp_path, weights):
+    torch = pytest.importorskip('torch')
+    cache_dir = str(tmp_path / 'embeddings')
+    set_classes_cached(FakeWorldModel(torch), weights, CLASSES, cache_dir)
+    path = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+    with open(path, 'wb') as f:
+        f.write(b'truncated')
+
+    assert set_classes_cached(FakeWorldModel(torch), weights, CLASSES, cache_dir) is False
+    assert set_classes_cached(FakeWorldModel(torch), weights, CLASSES, cache_dir) is True
@@ -0,0 +1,90 @@
+# test_frame_capture.py
+import os
+
+import cv2
+import numpy as np
+import pytest
+import supervision as sv
+
+import app
+from post_processer import process_folders
+
+WIDTH, HEIGHT = 160, 120
+
+
+# Original and processed folders, with app.py's outputs pointed at them
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    paths = {name: str(tmp_path / name) for name in ('images', 'labels', 'inline_images', 'inline_labels',
+                                                     'processed_images', 'processed_labels', 'plots')}
+    for path in paths.values():
+        os.makedirs(path)
+    monkeypatch.setattr(app, 'writer_pool', None)
+    monkeypatch.setattr(app, 'STORAGE_BACKEND', 'files')
+    monkeypatch.setattr(app, 'STREAMING_SAVE_PLOTS', False)
+    monkeypatch.setattr(app, 'ORIGINAL_IMAGE_DIR', paths['images'])
+    monkeypatch.setattr(app, 'ORIGINAL_LABEL_DIR', paths['labels'])
+    monkeypatch.setattr(app, 'PROCESSED_IMAGE_DIR', paths['inline_images'])
+    monkeypatch.setattr(app, 'PROCESSED_LABEL_DIR', paths['inline_labels'])
+    return paths
+
+def read_lines(path):
+    with open(path) as f:
+        return f.read().splitlines()
+
+def detections(xyxy, class_ids, confidences, track_ids, class_names):
+    return sv.Detections(xyxy=np.array(xyxy, dtype=np.float32), class_id=np.array(class_ids), confidence=np.array(confidences),
+                         tracker_id=np.array(track_ids), data={'class_name': np.array(class_names)})
+
+
+def test_frame_basename():
+    assert app.frame_basename(42, 3) == 'frame_000042_3obj'
+    assert app.frame_basename(42, 3, 'cam1') == 'cam1_frame_000042_3obj'
+
+def test_one_image_and_one_label_line_per_object(dirs):
+    frame = np.full((HEIGHT, WIDTH, 3), 90, dtype=np.uint8)
+
+    app.save_frame_capture(dirs['images'], dirs['labels'], 7, [56, 60], [(30, 10, 70, 60), (80, 40, 120, 110)], frame, WIDTH, HEIGHT)
+
+    assert os.listdir(dirs['images']) == ['frame_000007_2obj.jpg']
+    assert read_lines(os.path.join(dirs['labels'], 'frame_000007_2obj.txt')) == ['56 160 120 30 10 70 60', '60 160 120 80 40 120 110']
+
+def test_inline_frame_crop_matches_the_post_processing_pass(dirs):
+    frame = np.full((HEIGHT, WIDTH, 3), 90, dtype=np.uint8)
+    capture = (7, [56, 60], np.array([(30, 10, 70, 60), (80, 40, 120, 110)], dtype=np.float32), frame, WIDTH, HEIGHT)
+
+    app.save_processed_frame(*capture)
+    app.save_frame_capture(dirs['images'], dirs['labels'], *capture)
+    process_folders([dirs['images']], [dirs['labels']], dirs['processed_images'], dirs['processed_labels'], dirs['plots'])
+
+    inline_label = read_lines(os.path.join(dirs['inline_labels'], 'frame_000007_2obj.txt'))
+    assert inline_label == read_lines(os.path.join(dirs['processed_labels'], 'frame_000007_2obj.txt'))
+    assert [line.split()[0] for line in inline_label] == ['56', '60']
+    # One square crop covering both boxes
+    assert cv2.imread(os.path.join(dirs['inline_images'], 'frame_000007_2obj.jpg')).shape == (HEIGHT, HEIGHT, 3)
+
+def test_boxes_the_crop_cannot_cover_are_dropped(dirs):
+    frame = np.full((HEIGHT, WIDTH, 3), 90, dtype=np.uint8)
+
+    # Boxes spanning 150 pixels do not fit one 120 pixel crop, which keeps the leftmost
+    app.save_processed_frame(7, [56, 60], [(0, 10, 20, 60), (130, 40, 150, 110)], frame, WIDTH, HEIGHT)
+
+    label = read_lines(os.path.join(dirs['inline_labels'], 'frame_000007_2obj.txt'))
+    assert [line.split()[0] for line in label] == ['56']
+
+def test_objects_ready_in_the_same_frame_share_one_capture(dirs, monkeypatch):
+    monkeypatch.setattr(app, 'CAPTURE_PER_FRAME', True)
+    monkeypatch.setattr(app, 'STREAMING_POSTPROCESS', False)
+    state = app.DetectionState()
+    state.duplicates = None
+    # Two confident tracked objects and a low-confidence one, which is not labelled
+    frame_detections = detections([(30, 10, 70, 60), (80, 40, 120, 110), (5, 5, 25, 25)], [56, 60, 56],
+                                  [0.9, 0.85, 0.3], [1, 2, 3], ['chair', 'table', 'chair'])
+    frame = np.full((HEIGHT, WIDTH, 3), 90, dtype=np.uint8)
+
+    for _ in range(app.CONSECUTIVE_FRAMES):
+        app.process_detections(state, frame_detections, frame, WIDTH, HEIGHT)
+
+    name = app.frame_basename(app.CONSECUTIVE_FRAMES, 2)
+    assert os.listdir(dirs['images']) == [name + '.jpg']
+    assert read_lines(os.path.join(dirs['labels'], name + '.txt')) == ['56 160 120 30 10 70 60', '60 160 120 80 40 120 110']
@@ -0,0 +1,222 @@
+# test_google_upload.py
+import os
+
+import pytest
+
+import google_upload
+from google_upload import FilesystemBucket, FilesystemClient, upload_to_gcs
+from upload_journal import UploadJournal
+
+
+# Write a file of the given size below the current directory
+def write_file(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    return path
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+# A bucket whose first `failures` uploads raise the given error
+class FlakyBucket(FilesystemBucket):
+
+    def __init__(self, path, name, failures, error):
+        super().__init__(path, name)
+        self.failures = failures
+        self.error = error
+        self.chunk_sizes = []
+
+    def blob(self, blob_name, chunk_size=None):
+        self.chunk_sizes.append(chunk_size)
+        blob = super().blob(blob_name, chunk_size)
+        if self.failures:
+            self.failures -= 1
+
+            def fail(filename, checksum=None):
+                raise self.error
+            blob.upload_from_filename = fail
+        return blob
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(google_upload.time, 'sleep', delays.append)
+    monkeypatch.setattr(google_upload.random, 'uniform', lambda a, b: 1.0)
+    return delays
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_transient_errors_are_retried_with_exponential_backoff(workdir, sleeps):
+    source = write_file('original_data/images/a.jpg', 100)
+    bucket = FlakyBucket(str(workdir / 'gcs' / 'bucket'), 'bucket', failures=3, error=ConnectionResetError("reset"))
+
+    result = upload_to_gcs(bucket, source, 'original_data/images/a.jpg', retries=5, backoff=0.5)
+
+    assert result['success'] and result['attempts'] == 4
+    assert sleeps == [0.5, 1.0, 2.0]
+    assert read_file(workdir / 'gcs' / 'bucket' / 'original_data' / 'images' / 'a.jpg') == read_file(source)
+
+def test_retries_give_up_after_the_limit(workdir, sleeps):
+    source = write_file('original_data/images/a.jpg', 100)
+    bucket = FlakyBucket(str(workdir / 'gcs' / 'bucket'), 'bucket', failures=10, error=TimeoutError("timed out"))
+
+    result = upload_to_gcs(bucket, source, 'original_data/images/a.jpg', retries=2, backoff=1.0)
+
+    assert not result['success'] and result['status'] == 'failed'
+    assert result['attempts'] == 3 and len(sleeps) == 2
+    assert result['error'].startswith('TimeoutError')
+
+def test_permanent_errors_are_not_retried(workdir, sleeps):
+    bucket = FilesystemClient(str(workdir / 'gcs')).bucket('bucket')
+
+    result = upload_to_gcs(bucket, 'original_data/images/missing.jpg', 'original_data/images/missing.jpg', retries=5)
+
+    assert not result['success'] and result['attempts'] == 1 and sleeps == []
+
+def test_large_files_use_chunked_uploads(workdir, sleeps):
+    small = write_file('original_data/images/small.jpg', 1000)
+    large = write_file('original_data/images/large.jpg', 5000)
+    bucket = FlakyBucket(str(workdir / 'gcs' / 'bucket'), 'bucket', failures=0, error=None)
+
+    assert upload_to_gcs(bucket, small, 'images/small.jpg', resumable_threshold=2048, chunk_size=256)['success']
+    assert upload_to_gcs(bucket, large, 'images/large.jpg', resumable_threshold=2048, chunk_size=256)['success']
+
+    assert bucket.chunk_sizes == [None, 256]
+    assert read_file(workdir / 'gcs' / 'bucket' / 'images' / 'large.jpg') == read_file(large)
+
+def test_interrupted_chunked_upload_is_resent_without_partial_objects(workdir, sleeps, monkeypatch):
+    source = write_file('original_data/images/large.jpg', 5000)
+    client = FilesystemClient(str(workdir / 'gcs'))
+    bucket = client.bucket('bucket')
+    copy = google_upload.shutil.copyfileobj
+    calls = []
+
+    # The connection drops after the first chunk of the first attempt
+    def drop_first(src, dst, length):
+        calls.append(length)
+        if len(calls) == 1:
+            dst.write(src.read(length))
+            raise ConnectionAbortedError("connection dropped")
+        copy(src, dst, length)
+    monkeypatch.setattr(google_upload.shutil, 'copyfileobj', drop_first)
+
+    result = upload_to_gcs(bucket, source, 'images/large.jpg', resumable_threshold=1024, chunk_size=512, backoff=0.1)
+
+    assert result['success'] and result['attempts'] == 2 and calls == [512, 512]
+    assert read_file(workdir / 'gcs' / 'bucket' / 'images' / 'large.jpg') == read_file(source)
+    assert [blob.name for blob in client.list_blobs(bucket)] == ['images/large.jpg']
+
+
+# Run google_upload.main against a filesystem bucket below workdir
+def run_sync(workdir, *extra):
+    return google_upload.main(['--filesystem', str(workdir / 'gcs'), '--bucket', 'bucket', '--workers', '2',
+                               '--journal', str(workdir / 'journal.sqlite3'), '--log', str(workdir / 'log.csv'), *extra])
+
+def test_rerun_skips_journaled_files_without_hashing(workdir, sleeps, monkeypatch):
+    for name in ('a', 'b', 'c'):
+        write_file(f'original_data/images/{name}.jpg', 300)
+        write_file(f'original_data/labels/{name}.txt', 20)
+
+    first = run_sync(workdir, '--keep-local')
+    assert first['uploaded'] == 6 and first['failed'] == 0
+
+    hashed = []
+    checksums = google_upload.file_checksums
+    monkeypatch.setattr(google_upload, 'file_checksums', lambda path: hashed.append(path) or checksums(path))
+    second = run_sync(workdir, '--keep-local')
+
+    # Only the bucket listing hashes (the filesystem stand-in computes remote checksums)
+    assert second['uploaded'] == 0 and second['present'] == 6
+    assert not [path for path in hashed if not os.path.abspath(path).startswith(str(workdir / 'gcs'))]
+
+def test_rerun_uploads_files_changed_since_the_journal(workdir, sleeps):
+    write_file('original_data/images/a.jpg', 300)
+    run_sync(workdir, '--keep-local')
+
+    changed = write_file('original_data/images/a.jpg', 400)
+    report = run_sync(workdir, '--keep-local')
+
+    assert report['uploaded'] == 1
+    assert read_file(workdir / 'gcs' / 'bucket' / 'original_data' / 'images' / 'a.jpg') == read_file(changed)
+
+def test_each_file_is_deleted_once_its_own_upload_is_confirmed(workdir, sleeps, monkeypatch):
+    kept = write_file('original_data/images/bad.jpg', 300)
+    uploaded = [write_file('original_data/images/good.jpg', 300), write_file('original_data/labels/good.txt', 20)]
+    upload = google_upload.upload_to_gcs
+
+    def fail_bad(bucket, source, destination):
+        if source == kept:
+            return upload(bucket, source + '.missing', destination)
+        return upload(bucket, source, destination)
+    monkeypatch.setattr(google_upload, 'upload_to_gcs', fail_bad)
+
+    report = run_sync(workdir)
+
+    assert report['uploaded'] == 2 and report['failed'] == 1
+    assert os.path.exists(kept)
+    assert not any(os.path.exists(path) for path in uploaded)
+
+    journal = UploadJournal(str(workdir / 'journal.sqlite3'))
+    entries = journal.entries()
+    journal.close()
+    assert [entries[path]['status'] for path in uploaded] == ['deleted', 'deleted']
+    assert entries[kept]['status'] == 'failed'
+
+def test_reruns_trust_the_journal_without_listing_the_bucket(workdir, sleeps, monkeypatch):
+    write_file('original_data/images/a.jpg', 300)
+    run_sync(workdir, '--keep-local')
+
+    def no_listing(*args):
+        raise AssertionError("the bucket was listed")
+    monkeypatch.setattr(google_upload, 'list_remote_objects', no_listing)
+    report = run_sync(workdir, '--keep-local')
+
+    assert report['present'] == 1 and report['uploaded'] == 0
+
+def test_verify_remote_reuploads_objects_missing_from_the_bucket(workdir, sleeps):
+    write_file('original_data/images/a.jpg', 300)
+    run_sync(workdir, '--keep-local')
+    os.remove(workdir / 'gcs' / 'bucket' / 'original_data' / 'images' / 'a.jpg')
+
+    assert run_sync(workdir, '--keep-local')['present'] == 1
+    assert run_sync(workdir, '--keep-local', '--verify-remote')['uploaded'] == 1
+
+def test_identical_objects_outside_the_journal_are_not_uploaded_again(workdir, sleeps):
+    source = write_file('original_data/images/a.jpg', 300)
+    remote = workdir / 'gcs' / 'bucket' / 'original_data' / 'images' / 'a.jpg'
+    os.makedirs(remote.parent)
+    remote.write_bytes(read_file(source))
+
+    report = run_sync(workdir, '--keep-local')
+
+    assert report['present'] == 1 and report['uploaded'] == 0
+
+def test_originals_wait_for_their_processed_outputs(workdir, sleeps, monkeypatch):
+    originals = [write_file('original_data/images/a.jpg', 300), write_file('original_data/labels/a.txt', 20)]
+    processed_image = write_file('processed_data/images/a.jpg', 200)
+    processed_label = write_file('processed_data/labels/a.txt', 20)
+    upload = google_upload.upload_to_gcs
+
+    def fail_processed_label(bucket, source, destination):
+        if source == processed_label:
+            return upload(bucket, source + '.missing', destination)
+        return upload(bucket, source, destination)
+    monkeypatch.setattr(google_upload, 'upload_to_gcs', fail_processed_label)
+    report = run_sync(workdir)
+
+    # The processed label failed: it stays, and so do the originals it is derived from
+    assert report['failed'] == 1 and report['kept'] == 2
+    assert all(os.path.exists(path) for path in originals + [processed_label])
+    assert not os.path.exists(processed_image)
+
+    monkeypatch.setattr(google_upload, 'upload_to_gcs', upload)
+    report = run_sync(workdir)
+
+    assert report['uploaded'] == 1 and report['kept'] == 0
+    assert not any(os.path.exists(path) for path in originals + [processed_label])
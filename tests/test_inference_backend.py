@@ -0,0 +1,42 @@
+# test_inference_backend.py
+import importlib.util
+
+import pytest
+
+import inference_backend
+from inference_backend import artifact_path, export_model
+
+
+@pytest.fixture
+def no_export(monkeypatch):
+    def load_torch_model(*args, **kwargs):
+        raise AssertionError("the model must not be loaded")
+    monkeypatch.setattr(inference_backend, 'load_torch_model', load_torch_model)
+
+def hide_packages(monkeypatch, *names):
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name, *args: None if name in names else find_spec(name, *args))
+
+
+@pytest.mark.parametrize('backend, package', [('onnx', 'onnxruntime'), ('openvino', 'openvino')])
+def test_missing_packages_raise_before_exporting(tmp_path, monkeypatch, no_export, backend, package):
+    hide_packages(monkeypatch, package)
+
+    with pytest.raises(ImportError, match=f"pip install .*{package}"):
+        export_model(str(tmp_path / 'yolo.pt'), ['chair'], backend)
+
+def test_a_cached_artifact_needs_no_export(tmp_path, monkeypatch, no_export):
+    hide_packages(monkeypatch, 'onnx', 'onnxruntime', 'onnxslim')
+    path = artifact_path(str(tmp_path / 'yolo.pt'), ['chair'], 'onnx')
+    open(path, 'wb').close()
+
+    assert export_model(str(tmp_path / 'yolo.pt'), ['chair'], 'onnx') == path
+
+def test_artifacts_are_keyed_by_classes_and_settings(tmp_path):
+    model_path = str(tmp_path / 'yolo.pt')
+    paths = {artifact_path(model_path, ['chair'], 'onnx'), artifact_path(model_path, ['table'], 'onnx'),
+             artifact_path(model_path, ['chair'], 'onnx', int8=True), artifact_path(model_path, ['chair'], 'onnx', imgsz=320),
+             artifact_path(model_path, ['chair'], 'openvino')}
+
+    assert len(paths) == 5
+    assert artifact_path(model_path, ['chair'], 'onnx') == artifact_path(model_path, ['chair'], 'onnx')
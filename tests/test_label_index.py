@@ -0,0 +1,133 @@
+# test_label_index.py
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import label_index
+from label_index import LABEL_EMPTY, LABEL_MALFORMED, LABEL_MISSING, LABEL_OK, LabelIndex, parse_label, validation_report
+
+IMAGE_DIR, LABEL_DIR, LABEL_FORMAT = label_index.DATASETS['processed']
+
+
+def write_image(stem, width=64, height=48):
+    os.makedirs(IMAGE_DIR, exist_ok=True)
+    cv2.imwrite(os.path.join(IMAGE_DIR, f'{stem}.jpg'), np.zeros((height, width, 3), dtype=np.uint8))
+
+def write_label(stem, text, mtime_offset=0):
+    os.makedirs(LABEL_DIR, exist_ok=True)
+    path = os.path.join(LABEL_DIR, f'{stem}.txt')
+    with open(path, 'w') as f:
+        f.write(text)
+    if mtime_offset:
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset))
+
+def write_sample(stem, text="0 0.5 0.5 0.25 0.25\n"):
+    write_image(stem)
+    write_label(stem, text)
+
+def update(directory, full=False):
+    index = LabelIndex(str(directory))
+    report = index.update(IMAGE_DIR, LABEL_DIR, LABEL_FORMAT, full=full)
+    index.save()
+    return index, report
+
+# Files and boxes of an index as comparable rows, independent of row order
+def contents(index):
+    stems = index.files['stem']
+    files = sorted(tuple(np.asarray(index.files[name])[row] for name in label_index.FILE_COLUMNS) for row in range(len(index)))
+    boxes = sorted((stems[file],) + tuple(np.asarray(index.boxes[name])[box] for name in label_index.BOX_COLUMNS if name != 'file')
+                   for box, file in enumerate(np.asarray(index.boxes['file']).tolist()))
+    return files, boxes
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_incremental_update_matches_a_full_rebuild(workdir):
+    for i in range(5):
+        write_sample(f'sample_{i}', f"{i % 2} 0.5 0.5 0.25 0.25\n" * (i + 1))
+    _, first = update(workdir / 'index')
+    assert first['indexed'] == 5 and first['changed'] == 0 and first['removed'] == 0
+
+    write_label('sample_1', "1 0.4 0.4 0.1 0.1\n", mtime_offset=10 ** 9)  # edited
+    os.remove(os.path.join(IMAGE_DIR, 'sample_2.jpg'))                   # image gone, label kept
+    os.remove(os.path.join(IMAGE_DIR, 'sample_3.jpg'))                   # both gone
+    os.remove(os.path.join(LABEL_DIR, 'sample_3.txt'))
+    write_sample('sample_5')                                             # new
+    incremental, report = update(workdir / 'index')
+
+    assert report['total'] == 5 and report['unchanged'] == 2
+    assert report['indexed'] == 3 and report['changed'] == 2 and report['removed'] == 1
+    full, _ = update(workdir / 'rebuilt', full=True)
+    assert contents(incremental) == contents(full)
+    assert contents(LabelIndex(str(workdir / 'index'))) == contents(full)
+
+def test_rerun_without_changes_reads_nothing(workdir):
+    for i in range(3):
+        write_sample(f'sample_{i}')
+    update(workdir / 'index')
+
+    _, report = update(workdir / 'index')
+
+    assert report['unchanged'] == 3 and report['indexed'] == 0 and report['removed'] == 0
+
+def test_removed_files_drop_their_rows_and_boxes(workdir):
+    write_sample('keep', "0 0.5 0.5 0.2 0.2\n")
+    write_sample('gone', "1 0.5 0.5 0.2 0.2\n1 0.2 0.2 0.1 0.1\n")
+    update(workdir / 'index')
+
+    os.remove(os.path.join(IMAGE_DIR, 'gone.jpg'))
+    os.remove(os.path.join(LABEL_DIR, 'gone.txt'))
+    index, report = update(workdir / 'index')
+
+    assert report['removed'] == 1 and report['changed'] == 0
+    assert index.files['stem'].tolist() == [b'keep']
+    assert np.asarray(index.boxes['file']).tolist() == [0] and np.asarray(index.boxes['class_id']).tolist() == [0]
+
+def test_malformed_and_empty_labels(workdir):
+    write_label('good', "0 0.5 0.5 0.2 0.2\n")
+    write_label('short', "0 0.5 0.5 0.2 0.2\n1 0.5 0.5\n")
+    write_label('text', "chair 0.5 0.5 0.2 0.2\n")
+    write_label('empty', "\n")
+
+    assert parse_label(os.path.join(LABEL_DIR, 'good.txt'), 'yolo')[3] == LABEL_OK
+    class_ids, boxes, _, status = parse_label(os.path.join(LABEL_DIR, 'short.txt'), 'yolo')
+    assert status == LABEL_MALFORMED and class_ids.tolist() == [0]
+    np.testing.assert_allclose(boxes, [[0.4, 0.4, 0.6, 0.6]], atol=1e-6)
+    class_ids, _, _, status = parse_label(os.path.join(LABEL_DIR, 'text.txt'), 'yolo')
+    assert status == LABEL_MALFORMED and len(class_ids) == 0
+    assert parse_label(os.path.join(LABEL_DIR, 'empty.txt'), 'yolo')[3] == LABEL_EMPTY
+
+def test_validation_reports_label_problems(workdir):
+    write_sample('good', "0 0.5 0.5 0.2 0.2\n")
+    write_sample('short', "0 0.5 0.5 0.2 0.2\n1 0.5 0.5\n")
+    write_sample('empty', "")
+    write_sample('outside', "1 0.95 0.5 0.2 0.2\n")
+    write_sample('unknown', "9 0.5 0.5 0.2 0.2\n")
+    write_image('unlabelled')
+    index, _ = update(workdir / 'index')
+
+    report = validation_report(index)
+
+    assert report['malformed_label']['count'] == 1 and report['malformed_label']['examples'][0].endswith('short.txt')
+    assert report['empty_label']['count'] == 1
+    assert report['missing_label']['count'] == 1
+    assert report['out_of_bounds_box']['count'] == 1 and report['unknown_class']['count'] == 1
+    statuses = dict(zip(index.files['stem'].tolist(), np.asarray(index.files['label_status']).tolist()))
+    assert statuses[b'unlabelled'] == LABEL_MISSING and statuses[b'short'] == LABEL_MALFORMED
+
+def test_main_reports_changed_files(workdir, capsys):
+    write_sample('a')
+    write_sample('b')
+    label_index.main(['update', '--dataset', 'processed', '--index-dir', str(workdir / 'index')])
+    write_label('a', "1 0.5 0.5 0.3 0.3\n", mtime_offset=10 ** 9)
+
+    results = label_index.main(['update', '--dataset', 'processed', '--index-dir', str(workdir / 'index')])
+
+    assert results['processed']['changed'] == 1
+    assert "indexed 1 (1 changed), unchanged 1, removed 0" in capsys.readouterr().out
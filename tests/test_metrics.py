@@ -0,0 +1,44 @@
+# test_metrics.py
+import json
+import time
+import urllib.request
+
+import app
+from metrics import PipelineMetrics
+
+
+def test_no_listener_is_opened_by_default(monkeypatch):
+    metrics = PipelineMetrics()
+    monkeypatch.setattr(app, 'pipeline_metrics', metrics)
+
+    app.start_metrics()
+
+    assert metrics.server is None and metrics.dump_thread is None
+
+def test_stop_joins_the_jsonl_dump_thread(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    metrics = PipelineMetrics()
+    metrics.observe('motion', 2.5)
+    metrics.start_jsonl_dump(str(path), interval=0.02)
+    time.sleep(0.1)
+    thread = metrics.dump_thread
+
+    metrics.stop()
+    lines = path.read_text().splitlines()
+    time.sleep(0.1)
+
+    assert not thread.is_alive()
+    assert len(lines) >= 1 and path.read_text().splitlines() == lines
+    assert json.loads(lines[-1])['stages']['default']['motion']['count'] == 1
+
+def test_prometheus_endpoint_serves_until_stopped():
+    metrics = PipelineMetrics()
+    metrics.observe('motion', 2.5)
+    server = metrics.start_http_server(0)
+    url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+
+    with urllib.request.urlopen(url, timeout=5) as response:
+        assert 'stage="motion"' in response.read().decode('utf-8')
+    metrics.stop()
+
+    assert metrics.server is None
@@ -0,0 +1,183 @@
+# test_mjpeg_reader.py
+import io
+import socket
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from capture_reader import DROP_NTH, CaptureReader
+from mjpeg_reader import MJPEGCapture, MJPEGReplayServer, MultipartReader, decode_reduction, multipart_boundary
+
+FRAME_COUNT = 10
+FRAME_WIDTH, FRAME_HEIGHT = 320, 240
+
+
+# Frame i is a flat image of brightness 25 * i, so a decoded frame tells which one it was
+def frame_value(frame):
+    return int(round(frame.mean() / 25))
+
+@pytest.fixture
+def frame_dir(tmp_path):
+    for i in range(FRAME_COUNT):
+        image = np.full((FRAME_HEIGHT, FRAME_WIDTH, 3), 25 * i, dtype=np.uint8)
+        cv2.imwrite(str(tmp_path / f'frame_{i:03d}.jpg'), image)
+    return tmp_path
+
+@pytest.fixture
+def serve(frame_dir):
+    servers = []
+
+    def start(**kwargs):
+        server = MJPEGReplayServer(str(frame_dir), **dict({'fps': 0}, **kwargs)).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        if not server.stopped:
+            server.stop()
+
+def jpegs(frame_dir):
+    return [path.read_bytes() for path in sorted(frame_dir.glob('*.jpg'))]
+
+def multipart_body(parts, content_length, boundary=b'frame'):
+    body = b'preamble that is not a part\r\n'
+    for part in parts:
+        headers = b'Content-Type: image/jpeg\r\n'
+        if content_length:
+            headers += b'Content-Length: %d\r\n' % len(part)
+        body += b'--' + boundary + b'\r\n' + headers + b'\r\n' + part + b'\r\n'
+    return body + b'--' + boundary + b'--\r\n'
+
+
+def test_multipart_boundary_parsing():
+    assert multipart_boundary('multipart/x-mixed-replace; boundary=frame') == b'frame'
+    assert multipart_boundary('multipart/x-mixed-replace;boundary="--myboundary"') == b'myboundary'
+    assert multipart_boundary('image/jpeg') is None
+    assert multipart_boundary('multipart/x-mixed-replace') is None
+
+@pytest.mark.parametrize('content_length', [True, False])
+def test_multipart_reader_splits_parts(content_length):
+    # Bodies with line breaks and boundary-like bytes inside them
+    parts = [b'\xff\xd8first\r\nline\xff\xd9', b'\xff\xd8second\n--frame-ish\xff\xd9', b'\xff\xd8\r\n\r\n\xff\xd9']
+    if content_length:
+        parts.append(b'\xff\xd8\r\n--frame\r\n\xff\xd9')
+    reader = MultipartReader(io.BytesIO(multipart_body(parts, content_length)), b'frame')
+
+    assert [reader.next_part() for _ in parts] == parts
+    assert reader.next_part() is None
+
+def test_multipart_reader_stops_at_a_truncated_part():
+    body = multipart_body([b'\xff\xd8complete\xff\xd9', b'\xff\xd8truncated\xff\xd9'], True)
+    reader = MultipartReader(io.BytesIO(body[:body.rindex(b'truncated')]), b'frame')
+
+    assert reader.next_part() == b'\xff\xd8complete\xff\xd9'
+    assert reader.next_part() is None
+
+@pytest.mark.parametrize('content_length', [True, False])
+def test_stream_parts_match_the_served_jpegs(frame_dir, serve, content_length):
+    server = serve(loop=False, content_length=content_length)
+    cap = MJPEGCapture(server.url, probe_frames=1, reconnect_attempts=0)
+
+    grabbed = [cap.jpeg]
+    for _ in range(FRAME_COUNT - 1):
+        assert cap.grab()
+        grabbed.append(cap.retrieve_encoded()[1])
+    cap.release()
+
+    assert grabbed == jpegs(frame_dir)
+    assert cap.frames_decoded == 1  # only the probe frame
+
+@pytest.mark.parametrize('reduction', [1, 2, 4, 8])
+def test_reduced_scale_decode(serve, reduction):
+    cap = MJPEGCapture(serve().url, reduction=reduction, probe_frames=1)
+
+    ret, frame = cap.read()
+    cap.release()
+
+    assert ret and frame.shape == (FRAME_HEIGHT // reduction, FRAME_WIDTH // reduction, 3)
+    assert cap.get(cv2.CAP_PROP_FRAME_WIDTH) == FRAME_WIDTH // reduction
+    assert cap.get(cv2.CAP_PROP_FRAME_HEIGHT) == FRAME_HEIGHT // reduction
+
+def test_decode_reduction_never_goes_below_the_pipeline_scale():
+    assert decode_reduction(0.5, 0.5) == 2
+    assert decode_reduction(0.3, 0.3) == 2
+    assert decode_reduction(0.25, 0.2) == 4
+    assert decode_reduction(0.1, 0.1) == 8
+    assert decode_reduction(0.6, 0.5) == 1
+
+def test_unsupported_reduction_is_rejected(serve):
+    with pytest.raises(ValueError):
+        MJPEGCapture(serve().url, reduction=3)
+
+def test_nth_policy_skips_frames_without_decoding_them(serve):
+    cap = MJPEGCapture(serve().url, reduction=2, probe_frames=1)
+    probe_decodes = cap.frames_decoded
+    reader = CaptureReader(cap, policy=DROP_NTH, skip=2, buffer_size=16, block=True).start()
+
+    values, indices = [], []
+    for _ in range(3):
+        ret, frame = reader.read(timeout=5.0)
+        assert ret
+        values.append(frame_value(frame))
+        indices.append(reader.last_frame_index)
+    reader.stop()
+    cap.release()
+
+    # The probe took frame 0, the reader keeps every third frame after it
+    assert indices == [0, 3, 6]
+    assert values == [1, 4, 7]
+    assert cap.frames_decoded - probe_decodes == reader.frames_delivered == 3
+    assert cap.frames_grabbed - 1 >= 7
+
+def test_reconnects_after_the_server_drops(frame_dir, serve):
+    server = serve(fps=50)
+    port = server.server.server_address[1]
+    cap = MJPEGCapture(server.url, probe_frames=1, reconnect_delay=0.05, reconnect_max_delay=0.2, reconnect_attempts=50, timeout=2.0)
+    assert cap.read()[0]
+
+    server.stop()
+    restart = threading.Timer(0.3, lambda: serve(port=port))
+    restart.start()
+    try:
+        # Frames already sent are read first, then the dropped connection reconnects
+        for _ in range(FRAME_COUNT * 10):
+            ret, frame = cap.read()
+            if not ret or cap.reconnects:
+                break
+    finally:
+        restart.join()
+        cap.release()
+
+    # The restarted server replays from the first frame
+    assert ret and cap.reconnects == 1
+    assert frame.shape == (FRAME_HEIGHT, FRAME_WIDTH, 3) and frame_value(frame) == 0
+
+def test_gives_up_after_the_reconnect_attempts(serve):
+    server = serve(fps=50)
+    cap = MJPEGCapture(server.url, probe_frames=1, reconnect_delay=0.01, reconnect_max_delay=0.01, reconnect_attempts=2, timeout=1.0)
+    server.stop()
+
+    grabbed = 0
+    while cap.grab():
+        grabbed += 1
+        assert grabbed < FRAME_COUNT * 10
+    cap.release()
+
+    assert cap.reconnects == 1 and cap.last_error.startswith('URLError')
+
+def test_an_unreachable_camera_is_only_retried_a_few_times_at_startup(capsys):
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    start = time.monotonic()
+    cap = MJPEGCapture(f'http://127.0.0.1:{port}/video', reconnect_delay=0.01, reconnect_max_delay=0.01,
+                       reconnect_attempts=None, startup_retries=2, timeout=1.0)
+
+    assert not cap.isOpened()
+    assert time.monotonic() - start < 5.0
+    assert "after 3 attempts" in capsys.readouterr().out
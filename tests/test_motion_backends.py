@@ -0,0 +1,87 @@
+# test_motion_backends.py
+import cv2
+import numpy as np
+import pytest
+
+from motion_backends import FrameDiffBackend, ROIBackend, create_motion_backend
+
+HEIGHT, WIDTH = 120, 160
+
+
+def background():
+    return np.full((HEIGHT, WIDTH, 3), 60, dtype=np.uint8)
+
+# Background with a bright 20x20 square at (x, y)
+def with_square(x, y):
+    frame = background()
+    frame[y:y + 20, x:x + 20] = 250
+    return frame
+
+# Feed a static background, then a frame with a square, returning the last result
+def motion_after(backend, frame, warmup=30):
+    for _ in range(warmup):
+        backend.detect(background())
+    return backend.detect(frame)
+
+
+@pytest.mark.parametrize('name', ['mog2', 'knn', 'framediff'])
+def test_backends_see_a_new_object_but_not_a_static_scene(name):
+    backend = create_motion_backend(name)
+
+    static_pixels, _ = motion_after(backend, background())
+    motion_pixels, fg_mask = motion_after(backend, with_square(60, 50))
+
+    assert static_pixels == 0
+    # Counted in scaled-frame pixels whatever the mask resolution: the 400
+    # pixel square, give or take the blur at its edges
+    assert 300 <= motion_pixels <= 800
+    assert backend.cost()['frames'] == 62 and backend.cost()['backend'] == name
+    assert fg_mask.dtype == np.uint8
+
+def test_frame_difference_runs_on_a_downsampled_mask():
+    backend = FrameDiffBackend(downscale=0.25)
+
+    first_pixels, first_mask = backend.detect(background())
+    _, mask = backend.detect(with_square(60, 40))
+
+    assert first_pixels == 0 and not first_mask.any()
+    assert mask.shape == (HEIGHT // 4, WIDTH // 4)
+    columns = np.flatnonzero(mask.any(axis=0))
+    assert 14 <= columns.min() <= 15 and 19 <= columns.max() <= 20
+
+def test_roi_ignores_motion_outside_the_regions():
+    backend = ROIBackend(FrameDiffBackend(downscale=1.0), rois=[(0, 0, 80, 60)])
+
+    outside_pixels, outside_mask = motion_after(backend, with_square(120, 90), warmup=2)
+    inside_pixels, inside_mask = motion_after(backend, with_square(20, 20), warmup=2)
+
+    assert outside_pixels == 0 and not outside_mask.any()
+    assert 400 <= inside_pixels <= 600
+    # Full-frame mask with the motion at frame coordinates (blurred by a pixel)
+    assert inside_mask.shape == (HEIGHT, WIDTH)
+    ys, xs = np.nonzero(inside_mask)
+    assert np.abs(np.array([xs.min(), ys.min(), xs.max(), ys.max()]) - [20, 20, 39, 39]).max() <= 1
+    assert backend.name == 'roi+framediff'
+
+def test_roi_mask_image_limits_the_region(tmp_path):
+    mask = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+    mask[:, WIDTH // 2:] = 255
+    mask_path = str(tmp_path / 'mask.png')
+    cv2.imwrite(mask_path, mask)
+    backend = ROIBackend(FrameDiffBackend(downscale=1.0), rois=[], mask_path=mask_path)
+
+    left_pixels, _ = motion_after(backend, with_square(10, 50), warmup=2)
+    right_pixels, _ = motion_after(backend, with_square(100, 50), warmup=2)
+
+    assert left_pixels == 0 and 400 <= right_pixels <= 600
+
+def test_roi_configuration_errors():
+    with pytest.raises(ValueError):
+        ROIBackend(FrameDiffBackend(), rois=[], mask_path=None)
+    backend = ROIBackend(FrameDiffBackend(), rois=[(WIDTH + 10, 0, 20, 20)])
+    with pytest.raises(ValueError):
+        backend.detect(background())
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_motion_backend('optical-flow')
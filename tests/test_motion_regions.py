@@ -0,0 +1,145 @@
+# test_motion_regions.py
+import cv2
+import numpy as np
+import pytest
+
+import app
+from motion_regions import detect_regions, plan_regions
+
+HEIGHT, WIDTH = 720, 1280
+
+
+# Motion mask of shape with the given (x1, y1, x2, y2) rectangles set
+def mask_with(*boxes, shape=(HEIGHT, WIDTH)):
+    mask = np.zeros(shape, dtype=np.uint8)
+    for x1, y1, x2, y2 in boxes:
+        mask[y1:y2, x1:x2] = 255
+    return mask
+
+def contains(region, box):
+    return region[0] <= box[0] and region[1] <= box[1] and region[2] >= box[2] and region[3] >= box[3]
+
+# Stand-in for torch tensors in ultralytics results
+class FakeTensor:
+
+    def __init__(self, array):
+        self.array = np.asarray(array)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+class FakeResult:
+
+    def __init__(self, boxes):
+        self.obb = None
+        self.masks = None
+        self.names = {0: 'chair'}
+        self.boxes = type('Boxes', (), {})()
+        self.boxes.xyxy = FakeTensor(np.array(boxes, dtype=np.float32).reshape(-1, 4))
+        self.boxes.conf = FakeTensor(np.full(len(boxes), 0.9, dtype=np.float32))
+        self.boxes.cls = FakeTensor(np.zeros(len(boxes)))
+        self.boxes.id = None
+
+# Detects every bright blob of each crop, in crop coordinates
+class FakeModel:
+
+    def __init__(self):
+        self.sources = []
+
+    def predict(self, source, **kwargs):
+        self.sources.append([crop.shape for crop in source])
+        results = []
+        for crop in source:
+            _, _, stats, _ = cv2.connectedComponentsWithStats((crop[:, :, 0] > 128).astype(np.uint8))
+            results.append(FakeResult([(x, y, x + w, y + h) for x, y, w, h, _ in stats[1:].tolist()]))
+        return results
+
+def frame_with(*boxes):
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    for x1, y1, x2, y2 in boxes:
+        frame[y1:y2, x1:x2] = 255
+    return frame
+
+
+def test_no_motion_runs_on_the_full_frame():
+    assert plan_regions(mask_with(), (HEIGHT, WIDTH)) is None
+    # Blobs under REGION_MIN_AREA are noise
+    assert plan_regions(mask_with((100, 100, 105, 105)), (HEIGHT, WIDTH)) is None
+
+def test_a_region_is_padded_to_the_minimum_size_around_the_motion():
+    regions = plan_regions(mask_with((600, 300, 640, 360)), (HEIGHT, WIDTH))
+
+    assert len(regions) == 1
+    x1, y1, x2, y2 = regions[0].tolist()
+    assert (x2 - x1, y2 - y1) == (320, 320)
+    assert contains(regions[0], (600, 300, 640, 360))
+
+def test_regions_at_the_edge_are_shifted_inside_the_frame():
+    regions = plan_regions(mask_with((1240, 680, 1280, 720)), (HEIGHT, WIDTH))
+
+    assert regions.tolist() == [[960, 400, 1280, 720]]
+
+def test_nearby_regions_are_merged_and_distant_ones_kept():
+    merged = plan_regions(mask_with((300, 300, 340, 340), (420, 300, 460, 340)), (HEIGHT, WIDTH))
+    separate = plan_regions(mask_with((100, 100, 140, 140), (1100, 550, 1140, 590)), (HEIGHT, WIDTH))
+
+    assert len(merged) == 1
+    assert len(separate) == 2
+    assert contains(separate[0], (100, 100, 140, 140)) or contains(separate[1], (100, 100, 140, 140))
+
+def test_too_many_or_too_large_regions_run_on_the_full_frame():
+    corners = [(50, 50, 90, 90), (1190, 50, 1230, 90), (50, 630, 90, 670), (1190, 630, 1230, 670)]
+
+    assert len(plan_regions(mask_with(*corners), (HEIGHT, WIDTH))) == 4
+    assert plan_regions(mask_with(*corners), (HEIGHT, WIDTH), max_regions=3) is None
+    assert plan_regions(mask_with((100, 100, 1100, 600)), (HEIGHT, WIDTH)) is None
+
+def test_downsampled_masks_map_to_frame_coordinates():
+    # A quarter-size mask, as the frame-difference backend produces
+    regions = plan_regions(mask_with((150, 75, 160, 90), shape=(HEIGHT // 4, WIDTH // 4)), (HEIGHT, WIDTH))
+
+    assert len(regions) == 1 and contains(regions[0], (600, 300, 640, 360))
+
+def test_boxes_are_mapped_back_to_scaled_frame_coordinates():
+    model = FakeModel()
+    frame = frame_with((600, 300, 640, 360), (100, 100, 140, 140))
+    regions = np.array([[480, 170, 800, 490], [0, 0, 320, 320]])
+
+    detections, _ = detect_regions(model, frame, regions, (0.5, 0.5))
+
+    # One batched call on full-resolution crops
+    assert model.sources == [[(320, 320, 3), (320, 320, 3)]]
+    assert sorted(detections.xyxy.tolist()) == [[50, 50, 70, 70], [300, 150, 320, 180]]
+    assert detections['class_name'].tolist() == ['chair', 'chair']
+
+def test_objects_seen_in_overlapping_crops_are_kept_once():
+    frame = frame_with((200, 200, 240, 240))
+    regions = np.array([[0, 0, 320, 320], [100, 100, 420, 420]])
+
+    detections, _ = detect_regions(FakeModel(), frame, regions, (1.0, 1.0))
+
+    assert detections.xyxy.tolist() == [[200, 200, 240, 240]]
+
+class FakeTracker:
+
+    def update_with_detections(self, detections):
+        return detections
+
+@pytest.mark.parametrize('mask, full_frames, crop_pixels', [
+    (mask_with(), 1, 640 * 360),
+    (mask_with((600, 300, 640, 360)), 0, 320 * 320),
+])
+def test_region_statistics(mask, full_frames, crop_pixels):
+    state = app.DetectionState()
+    state.tracker = FakeTracker()
+    frame = frame_with((600, 300, 640, 360))
+    scaled_frame = cv2.resize(frame, (WIDTH // 2, HEIGHT // 2))
+
+    detections, _ = app.perform_region_detection(state, FakeModel(), frame, scaled_frame, mask)
+
+    assert detections.xyxy.tolist() == [[300, 150, 320, 180]]
+    assert state.regions['full_frames'] == full_frames and state.regions['region_frames'] == 1 - full_frames
+    assert state.regions['crop_pixels'] == crop_pixels
@@ -0,0 +1,68 @@
+# test_multi_camera.py
+import cv2
+import numpy as np
+import pytest
+
+import multi_camera
+from app import initialize_video_capture
+from multi_camera import open_streams, read_frames
+
+
+# Reader stand-in that records how long each read was allowed to wait
+class FakeReader:
+
+    def __init__(self, frames, running=True):
+        self.frames = list(frames)
+        self.running = running
+        self.timeouts = []
+
+    def read(self, timeout=None):
+        self.timeouts.append(timeout)
+        if self.frames:
+            return True, self.frames.pop(0)
+        return False, None
+
+class FakeStream:
+
+    def __init__(self, name, frames=(), running=True):
+        self.name = name
+        self.reader = FakeReader(frames, running)
+
+@pytest.fixture
+def frame_dir(tmp_path):
+    for i in range(3):
+        cv2.imwrite(str(tmp_path / f'frame_{i:03d}.jpg'), np.full((48, 64, 3), 40 * i, dtype=np.uint8))
+    return str(tmp_path)
+
+
+def test_a_source_that_cannot_be_opened_raises(tmp_path):
+    with pytest.raises(IOError):
+        initialize_video_capture(str(tmp_path / 'missing.mp4'))
+
+def test_cameras_that_cannot_be_opened_are_skipped(frame_dir, tmp_path, capsys):
+    streams = open_streams([str(tmp_path / 'missing.mp4'), frame_dir])
+    try:
+        assert [stream.name for stream in streams] == ['cam1']
+        assert "cam0: Unable to open video stream" in capsys.readouterr().out
+    finally:
+        for stream in streams:
+            stream.close()
+
+def test_ready_frames_are_read_without_waiting():
+    streams = [FakeStream('cam0'), FakeStream('cam1', ['a']), FakeStream('cam2', ['b'])]
+
+    frames = read_frames(streams, tick=0)
+
+    assert [(stream.name, ret, frame) for stream, ret, frame in frames] == [('cam0', False, None), ('cam1', True, 'a'), ('cam2', True, 'b')]
+    assert all(stream.reader.timeouts == [0] for stream in streams)
+
+def test_only_one_camera_is_waited_on_when_none_has_a_frame(monkeypatch):
+    monkeypatch.setattr(multi_camera, 'MULTI_CAMERA_READ_TIMEOUT', 0.25)
+    streams = [FakeStream(f'cam{i}') for i in range(3)]
+
+    for tick in range(3):
+        frames = read_frames(streams, tick)
+        assert [stream.name for stream, _, _ in frames] == [f'cam{tick}']
+
+    # Every camera is polled each tick and waited on once in turn
+    assert [stream.reader.timeouts for stream in streams] == [[0, 0.25, 0, 0], [0, 0, 0.25, 0], [0, 0, 0, 0.25]]
@@ -0,0 +1,112 @@
+# test_phash_index.py
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from phash_index import HASH_BITS, MultiIndexHash, NearDuplicateFilter, find_duplicates
+
+
+def random_hashes(rng, count):
+    return [int(value) for value in rng.integers(0, 1 << 63, size=count, dtype=np.uint64) * 2 + rng.integers(0, 2, size=count, dtype=np.uint64)]
+
+# Flip `bits` random bits of h
+def flip(rng, h, bits):
+    for bit in rng.choice(HASH_BITS, size=bits, replace=False).tolist():
+        h ^= 1 << bit
+    return h
+
+def brute_force(entries, h, max_distance):
+    return sorted((item, bin(stored ^ h).count('1')) for item, stored in entries if bin(stored ^ h).count('1') <= max_distance)
+
+# Random image with a distinct pattern per seed, so captures only match their own copies
+def pattern(seed):
+    return np.random.default_rng(seed).integers(0, 256, size=(120, 160, 3), dtype=np.uint8)
+
+@pytest.fixture
+def captures(tmp_path):
+    image_dir, label_dir = tmp_path / 'images', tmp_path / 'labels'
+    image_dir.mkdir()
+    label_dir.mkdir()
+
+    # Captures are compared in mtime order, one second apart
+    def save(name, image, label='0 160 120 10 10 150 110'):
+        path = str(image_dir / (name + '.png'))
+        cv2.imwrite(path, image)
+        (label_dir / (name + '.txt')).write_text(label + '\n')
+        save.count += 1
+        os.utime(path, (1_700_000_000 + save.count, 1_700_000_000 + save.count))
+    save.count = 0
+    save.dirs = (str(image_dir), str(label_dir))
+    return save
+
+
+@pytest.mark.parametrize('max_distance', [0, 2, 4, 8])
+def test_multi_index_lookup_matches_brute_force(max_distance):
+    rng = np.random.default_rng(max_distance)
+    stored = random_hashes(rng, 500)
+    # Near copies of stored hashes at every distance up to and beyond the limit
+    stored += [flip(rng, stored[i], int(rng.integers(0, max_distance + 3))) for i in range(200)]
+    index = MultiIndexHash(max_distance)
+    for item, h in enumerate(stored):
+        index.add(h, item)
+
+    entries = list(enumerate(stored))
+    queries = random_hashes(rng, 50) + [flip(rng, stored[i], int(rng.integers(0, max_distance + 3))) for i in range(0, 700, 7)]
+    for h in queries:
+        assert sorted(index.query(h)) == brute_force(entries, h, max_distance)
+
+def test_capacity_keeps_only_the_most_recent_entries():
+    rng = np.random.default_rng(1)
+    stored = random_hashes(rng, 300)
+    index = MultiIndexHash(4, capacity=100)
+    for item, h in enumerate(stored):
+        index.add(h, item)
+
+    entries = list(enumerate(stored))[-100:]
+    assert len(index) == 100
+    for h in stored[::5] + [flip(rng, h, 3) for h in stored[::5]]:
+        assert sorted(index.query(h)) == brute_force(entries, h, 4)
+
+def test_a_group_never_matches_its_own_entries():
+    index = MultiIndexHash(4)
+    index.add(0b1011, 'a', group=7)
+    index.add(0b1111, 'b', group=8)
+
+    assert [item for item, _ in index.query(0b1011)] == ['a', 'b']
+    assert [item for item, _ in index.query(0b1011, group=7)] == ['b']
+
+def test_filter_suppresses_other_tracks_but_not_the_same_track():
+    duplicates = NearDuplicateFilter(max_distance=4)
+    image = pattern(0)
+
+    assert duplicates.check('chair', image, item=1) is None
+    assert duplicates.check('chair', image, item=1) is None
+    assert duplicates.check('chair', image, item=2)[0] == 1
+    assert duplicates.check('table', image, item=2) is None
+    assert duplicates.stats()['suppressed'] == 1
+
+def test_offline_pass_uses_the_same_track_rule(captures):
+    image = pattern(0)
+    captures('chair_56_0.91_7_SSC_1', image)
+    captures('chair_56_0.93_7_SSC_2', image)
+    captures('chair_56_0.92_9_SSC_1', image)
+    captures('cam1_chair_56_0.92_7_SSC_1', image)
+    captures('chair_56_0.90_11_SSC_1', pattern(1))
+
+    report = find_duplicates(*captures.dirs, max_distance=4, workers=1)
+
+    # Track 7 of the default stream keeps both its captures, track 9 and
+    # track 7 of cam1 are other tracks
+    assert sorted(path.rsplit('/', 1)[1] for path, _, _, _ in report['duplicates']) == ['cam1_chair_56_0.92_7_SSC_1.png', 'chair_56_0.92_9_SSC_1.png']
+    assert report['unique'] == 3
+
+def test_malformed_labels_do_not_abort_the_pass(captures):
+    captures('chair_56_0.91_7_SSC_1', pattern(0), label='0 160 120 ten 10 150 110')
+    captures('chair_56_0.91_8_SSC_1', pattern(1), label='0 0 120 10 10 150 110')
+    captures('chair_56_0.91_9_SSC_1', pattern(2))
+
+    report = find_duplicates(*captures.dirs, max_distance=4, workers=1)
+
+    assert (report['total'], report['unique'], report['unreadable']) == (3, 3, [])
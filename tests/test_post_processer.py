@@ -0,0 +1,127 @@
+# test_post_processer.py
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from post_processer import export_labels, label_export_params, process_folders, processing_params
+from processing_manifest import ProcessingManifest
+
+NAMES = ['chair_56_0.91_1_SSC_1', 'chair_56_0.92_2_SSC_1', 'table_60_0.88_3_SSC_1']
+
+
+# original_data with one 64x48 capture and raw label per name, and the processed_data folders
+@pytest.fixture
+def dirs(tmp_path):
+    paths = {name: str(tmp_path / name) for name in ('images', 'labels', 'processed_images', 'processed_labels', 'plots')}
+    os.makedirs(paths['images'])
+    os.makedirs(paths['labels'])
+    for i, name in enumerate(NAMES):
+        cv2.imwrite(os.path.join(paths['images'], name + '.jpg'), np.full((48, 64, 3), 40 * i, dtype=np.uint8))
+        write_label(paths, name, f'0 64 48 {10 + i} 5 {30 + i} 40')
+    paths['manifest'] = str(tmp_path / 'manifest.json')
+    return paths
+
+def write_label(dirs, name, text):
+    with open(os.path.join(dirs['labels'], name + '.txt'), 'w') as f:
+        f.write(text + '\n')
+
+def run(dirs, force=False):
+    manifest = ProcessingManifest(dirs['manifest'], processing_params(dirs['processed_images'], dirs['processed_labels'], dirs['plots']), force=force)
+    return process_folders([dirs['images']], [dirs['labels']], dirs['processed_images'], dirs['processed_labels'], dirs['plots'], manifest=manifest)
+
+def export(dirs):
+    manifest = ProcessingManifest(dirs['manifest'], label_export_params(dirs['processed_labels']))
+    return export_labels([dirs['labels']], dirs['processed_labels'], manifest)
+
+def counts(report):
+    return {key: report[key] for key in ('processed', 'unchanged', 'removed')}
+
+
+def test_reruns_only_process_new_or_changed_captures(dirs):
+    assert counts(run(dirs)) == {'processed': 3, 'unchanged': 0, 'removed': 0}
+    assert counts(run(dirs)) == {'processed': 0, 'unchanged': 3, 'removed': 0}
+
+    # Touched without a content change: only the stat info is refreshed
+    os.utime(os.path.join(dirs['images'], NAMES[0] + '.jpg'))
+    write_label(dirs, NAMES[1], '0 64 48 12 6 33 41')
+
+    assert counts(run(dirs)) == {'processed': 1, 'unchanged': 2, 'removed': 0}
+    assert counts(run(dirs)) == {'processed': 0, 'unchanged': 3, 'removed': 0}
+    assert counts(run(dirs, force=True)) == {'processed': 3, 'unchanged': 0, 'removed': 0}
+
+@pytest.mark.parametrize('touch', [False, True])
+def test_deleted_outputs_are_rebuilt(dirs, touch):
+    run(dirs)
+    for folder, ext in (('processed_images', '.jpg'), ('processed_labels', '.txt'), ('plots', '.jpg')):
+        os.remove(os.path.join(dirs[folder], NAMES[0] + ext))
+    if touch:
+        os.utime(os.path.join(dirs['labels'], NAMES[0] + '.txt'))
+
+    assert counts(run(dirs)) == {'processed': 1, 'unchanged': 2, 'removed': 0}
+    assert all(os.path.isfile(os.path.join(dirs[folder], NAMES[0] + ext))
+               for folder, ext in (('processed_images', '.jpg'), ('processed_labels', '.txt'), ('plots', '.jpg')))
+
+def test_outputs_of_deleted_captures_are_removed(dirs):
+    run(dirs)
+    os.remove(os.path.join(dirs['images'], NAMES[2] + '.jpg'))
+
+    assert counts(run(dirs)) == {'processed': 0, 'unchanged': 2, 'removed': 1}
+    for folder in ('processed_images', 'processed_labels', 'plots'):
+        assert not any(name.startswith(NAMES[2]) for name in os.listdir(dirs[folder]))
+    with open(dirs['manifest']) as f:
+        assert len(json.load(f)['entries']) == 2
+
+def test_manifest_is_saved_while_the_run_progresses(dirs):
+    manifest = ProcessingManifest(dirs['manifest'], {}, save_interval=0)
+    label_path = os.path.join(dirs['labels'], NAMES[0] + '.txt')
+    manifest.record(label_path, manifest.check(label_path, None, label_path), [])
+
+    # Nothing called save(): the record itself was checkpointed
+    with open(dirs['manifest']) as f:
+        assert list(json.load(f)['entries']) == [label_path]
+
+def test_label_export_is_incremental(dirs):
+    assert counts(export(dirs)) == {'processed': 3, 'unchanged': 0, 'removed': 0}
+    assert counts(export(dirs)) == {'processed': 0, 'unchanged': 3, 'removed': 0}
+
+    write_label(dirs, NAMES[0], '0 64 48 11 6 31 41')
+    os.remove(os.path.join(dirs['processed_labels'], NAMES[1] + '.txt'))
+    os.remove(os.path.join(dirs['labels'], NAMES[2] + '.txt'))
+
+    assert counts(export(dirs)) == {'processed': 2, 'unchanged': 0, 'removed': 1}
+    assert sorted(os.listdir(dirs['processed_labels'])) == [NAMES[0] + '.txt', NAMES[1] + '.txt']
+
+# Outputs of a run without a manifest, as {folder: {name: bytes}}
+def outputs(dirs):
+    return {folder: {name: open(os.path.join(dirs[folder], name), 'rb').read() for name in sorted(os.listdir(dirs[folder]))}
+            for folder in ('processed_images', 'processed_labels', 'plots')}
+
+def process(dirs, **kwargs):
+    return process_folders([dirs['images']], [dirs['labels']], dirs['processed_images'], dirs['processed_labels'], dirs['plots'], **kwargs)
+
+@pytest.mark.parametrize('workers, chunksize', [(2, 1), (3, 2)])
+def test_process_pool_writes_the_same_outputs_as_a_serial_run(dirs, workers, chunksize):
+    serial = process(dirs, workers=1)
+    serial_outputs = outputs(dirs)
+    for folder in ('processed_images', 'processed_labels', 'plots'):
+        for name in os.listdir(dirs[folder]):
+            os.remove(os.path.join(dirs[folder], name))
+
+    parallel = process(dirs, workers=workers, chunksize=chunksize)
+
+    assert counts(parallel) == counts(serial) == {'processed': 3, 'unchanged': 0, 'removed': 0}
+    assert outputs(dirs) == serial_outputs
+
+def test_per_file_errors_are_collected_without_stopping_the_pool(dirs):
+    with open(os.path.join(dirs['images'], 'corrupt.jpg'), 'wb') as f:
+        f.write(b'not a jpeg')
+    write_label(dirs, 'corrupt', '0 64 48 10 5 30 40')
+    cv2.imwrite(os.path.join(dirs['images'], 'unlabelled.jpg'), np.zeros((48, 64, 3), dtype=np.uint8))
+
+    report = process(dirs, workers=2, chunksize=1)
+
+    assert (report['total'], report['processed'], report['failed'], report['skipped']) == (5, 3, 1, 1)
+    assert sorted((os.path.basename(path), status) for path, status, _ in report['errors']) == [('corrupt.jpg', 'failed'), ('unlabelled.jpg', 'skipped')]
@@ -0,0 +1,94 @@
+# test_replay.py
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from app import DetectionState, initialize_video_capture, parse_args, update_frame_interval
+from capture_reader import DROP_FIFO, CaptureReader, ImageSequenceCapture
+
+FRAME_COUNT = 12
+FRAME_WIDTH, FRAME_HEIGHT = 64, 48
+
+
+# Frame i is a flat image of brightness 20 * i, so a decoded frame tells which one it was
+def frame_value(frame):
+    return int(round(frame.mean() / 20))
+
+@pytest.fixture
+def frame_dir(tmp_path):
+    directory = tmp_path / 'frames'
+    directory.mkdir()
+    for i in range(FRAME_COUNT):
+        cv2.imwrite(str(directory / f'frame_{i:03d}.png'), np.full((FRAME_HEIGHT, FRAME_WIDTH, 3), 20 * i, dtype=np.uint8))
+    (directory / 'notes.txt').write_text('not a frame')
+    return str(directory)
+
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / 'recording.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 15, (FRAME_WIDTH, FRAME_HEIGHT))
+    for i in range(FRAME_COUNT):
+        writer.write(np.full((FRAME_HEIGHT, FRAME_WIDTH, 3), 20 * i, dtype=np.uint8))
+    writer.release()
+    return path
+
+# Replay the way app.py does: every (skip + 1)th frame, no lag-based drops,
+# with a consumer as slow as consumer_delay
+def replay(source, skip, consumer_delay=0.0):
+    cap = initialize_video_capture(source)
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    reader = CaptureReader(cap, policy=DROP_FIFO, buffer_size=2, skip=skip, block=True, live=False).start()
+    state = DetectionState(consecutive_seconds=None)
+    values, intervals = [], []
+    while True:
+        ret, frame = reader.read()
+        if not ret:
+            break
+        update_frame_interval(state, reader, fps)
+        values.append(frame_value(frame))
+        intervals.append(state.frame_interval)
+        time.sleep(consumer_delay)
+    reader.stop()
+    cap.release()
+    return values, intervals, reader.stats()
+
+
+def test_image_directory_behaves_like_a_recording(frame_dir):
+    cap = ImageSequenceCapture(frame_dir, fps=10)
+
+    assert cap.isOpened()
+    assert (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT), cap.get(cv2.CAP_PROP_FPS)) == (FRAME_WIDTH, FRAME_HEIGHT, 10)
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == FRAME_COUNT
+    assert [frame_value(cap.read()[1]) for _ in range(3)] == [0, 1, 2]
+    assert cap.get(cv2.CAP_PROP_POS_FRAMES) == 3 and cap.get(cv2.CAP_PROP_POS_MSEC) == 200.0
+    while cap.grab():
+        pass
+    assert cap.read() == (False, None)
+
+def test_an_empty_directory_cannot_be_replayed(tmp_path):
+    assert not ImageSequenceCapture(str(tmp_path)).isOpened()
+    with pytest.raises(IOError):
+        initialize_video_capture(str(tmp_path))
+
+@pytest.mark.parametrize('source', ['frame_dir', 'video_path'])
+def test_replay_keeps_every_skip_plus_one_frame_however_slow_the_consumer(source, request):
+    path = request.getfixturevalue(source)
+
+    fast = replay(path, skip=2)
+    slow = replay(path, skip=2, consumer_delay=0.02)
+
+    assert fast[0] == slow[0] == [0, 3, 6, 9]
+    assert fast[2]['delivered'] == 4 and fast[2]['stale'] == 0
+
+def test_frame_intervals_follow_the_stream_fps(frame_dir):
+    _, intervals, _ = replay(frame_dir, skip=3)
+
+    # 30 FPS (REPLAY_FPS), four frames per kept frame; the first covers frames 0..0
+    assert intervals[0] == pytest.approx(1 / 30)
+    assert intervals[1:] == pytest.approx([4 / 30] * (len(intervals) - 1))
+
+def test_replay_argument():
+    assert parse_args(['--replay', 'recordings/doorway.mp4']).replay == 'recordings/doorway.mp4'
+    assert parse_args([]).replay is None
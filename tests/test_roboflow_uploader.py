@@ -0,0 +1,158 @@
+# test_roboflow_uploader.py
+import os
+
+import pytest
+
+import roboflow_uploader
+from roboflow_uploader import HTTPProject, MockRoboflowServer, upload_new_samples
+from upload_journal import UploadJournal
+
+
+# Write image/label pairs below processed_data in the current directory
+def write_samples(count, labels=None, prefix='sample'):
+    os.makedirs('processed_data/images', exist_ok=True)
+    os.makedirs('processed_data/labels', exist_ok=True)
+    for i in range(count):
+        with open(f'processed_data/images/{prefix}_{i}.jpg', 'wb') as f:
+            f.write(os.urandom(200))
+        with open(f'processed_data/labels/{prefix}_{i}.txt', 'w') as f:
+            f.write(labels[i] if labels else f"{i % 2} 0.5 0.5 0.25 0.25\n")
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def server():
+    mock = MockRoboflowServer(api_key='secret').start()
+    yield mock
+    mock.stop()
+
+@pytest.fixture
+def journal(workdir):
+    journal = UploadJournal(str(workdir / 'journal.sqlite3'))
+    yield journal
+    journal.close()
+
+def upload(project, journal, **kwargs):
+    kwargs = dict({'rate': 0, 'concurrency': 4, 'num_retries': 3}, **kwargs)
+    return upload_new_samples(project, journal, 'files', **kwargs)
+
+
+def test_samples_are_uploaded_over_http_with_annotations(server, journal):
+    write_samples(5)
+    project = HTTPProject(server.url, 'secret', 'demo')
+
+    report = upload(project, journal, batch_size=2)
+
+    assert report['uploaded'] == 5 and report['failed'] == 0 and report['batches'] == 3
+    uploads = server.uploads
+    assert sorted(record['name'] for record in uploads) == [f'sample_{i}.jpg' for i in range(5)]
+    assert all(record['project'] == 'demo' and record['annotation'] for record in uploads)
+    assert len({record['batch'] for record in uploads}) == 3
+
+def test_rerun_only_sends_new_samples(server, journal):
+    write_samples(3)
+    project = HTTPProject(server.url, 'secret', 'demo')
+    upload(project, journal)
+    requests = server.counts['requests']
+
+    write_samples(1, prefix='new')
+    report = upload(project, journal)
+
+    assert report['uploaded'] == 1 and report['unchanged'] == 3
+    assert server.counts['requests'] == requests + 2
+
+def test_identical_images_are_reported_as_duplicates(server, journal):
+    write_samples(2)
+    project = HTTPProject(server.url, 'secret', 'demo')
+    upload(project, journal)
+
+    report = upload(project, journal, full=True)
+
+    assert report['present'] == 2 and report['uploaded'] == 0 and len(server.uploads) == 2
+
+def test_server_errors_are_retried(server, journal, monkeypatch):
+    write_samples(2)
+    project = HTTPProject(server.url, 'secret', 'demo', backoff=0.01)
+    server.failure_rate = 0.5
+    outcomes = iter([0.0, 1.0, 0.0, 0.0, 1.0, 1.0, 1.0])
+    monkeypatch.setattr(roboflow_uploader.random, 'random', lambda: next(outcomes))
+
+    report = upload(project, journal, concurrency=1)
+
+    assert report['uploaded'] == 2 and report['failed'] == 0
+    assert server.counts['failed'] == 3 and project.retries == 3
+
+def test_retries_give_up_and_the_sample_stays_pending(server, journal):
+    write_samples(1)
+    project = HTTPProject(server.url, 'secret', 'demo', backoff=0.01)
+    server.failure_rate = 1.0
+
+    report = upload(project, journal, num_retries=2)
+
+    assert report['failed'] == 1 and '503' in report['errors'][0][1]
+    assert server.counts['requests'] == 3
+
+    server.failure_rate = 0.0
+    assert upload(project, journal)['uploaded'] == 1
+
+def test_throttled_requests_wait_for_retry_after(workdir, journal):
+    write_samples(8)
+    server = MockRoboflowServer(rate_limit=40).start()
+    try:
+        # Without a client rate limit the four workers race for every token,
+        # so a request may be throttled many times before it gets one
+        project = HTTPProject(server.url, None, 'demo', backoff=10.0)
+        report = upload(project, journal, concurrency=4, num_retries=40)
+    finally:
+        server.stop()
+
+    assert report['uploaded'] == 8 and report['failed'] == 0
+    assert server.counts['throttled'] > 0 and project.retries == server.counts['throttled']
+    assert report['elapsed'] < 5.0
+
+def test_client_rate_limit_avoids_throttling(workdir, journal):
+    # Each sample is an image and an annotation request
+    write_samples(4)
+    server = MockRoboflowServer(rate_limit=40, burst=2).start()
+    try:
+        report = upload(HTTPProject(server.url, None, 'demo'), journal, rate=15, concurrency=1)
+    finally:
+        server.stop()
+
+    assert report['uploaded'] == 4 and server.counts['throttled'] == 0
+
+def test_rejections_are_not_retried(server, journal):
+    write_samples(2, labels=["0 0.5 0.5 0.25 0.25\n", "7 0.5 0.5 0.25 0.25\n"])
+
+    report = upload(HTTPProject(server.url, 'secret', 'demo'), journal)
+
+    assert report['uploaded'] == 1 and report['failed'] == 1
+    assert 'Annotation rejected' in report['errors'][0][1] and 'labelmap' in report['errors'][0][1]
+    assert server.counts['requests'] == 4
+
+def test_invalid_api_key_is_rejected(server, journal):
+    write_samples(1)
+
+    report = upload(HTTPProject(server.url, 'wrong', 'demo'), journal)
+
+    assert report['failed'] == 1 and 'Invalid API key' in report['errors'][0][1]
+    assert server.counts['requests'] == 1 and server.uploads == []
+
+def test_main_mock_uses_the_roboflow_journal_batch_size(workdir, monkeypatch):
+    write_samples(3)
+    batch_sizes = []
+    journal_class = roboflow_uploader.UploadJournal
+
+    def record_batch_size(path, batch_size):
+        batch_sizes.append(batch_size)
+        return journal_class(path, batch_size)
+    monkeypatch.setattr(roboflow_uploader, 'UploadJournal', record_batch_size)
+
+    report = roboflow_uploader.main(['--mock', '--mock-latency', '0', '--rate', '0', '--storage', 'files',
+                                     '--journal', str(workdir / 'journal.sqlite3')])
+
+    assert report['uploaded'] == 3
+    assert batch_sizes == [roboflow_uploader.ROBOFLOW_JOURNAL_BATCH_SIZE]
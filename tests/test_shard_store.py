@@ -0,0 +1,82 @@
+# test_shard_store.py
+import os
+
+import pytest
+
+import shard_store
+from google_upload import list_shard_jobs
+from shard_store import ShardReader, ShardWriter, list_shards, sealed_shards
+
+
+def write(writer, key):
+    writer.write(key, {'jpg': key.encode('utf-8') * 10, 'txt': b'0 0.5 0.5 0.1 0.1\n'})
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / 'shards')
+
+
+def test_shard_names_are_unique_across_writers(store):
+    first, second = ShardWriter(store), ShardWriter(store)
+    write(first, 'a')
+    write(second, 'b')
+    first.close()
+    second.close()
+
+    assert len(set(list_shards(store))) == 2
+    assert sealed_shards(store) == set(list_shards(store))
+
+def test_a_second_writer_leaves_the_open_shard_of_the_first_alone(store):
+    first = ShardWriter(store)
+    write(first, 'a')
+    open_shard = first.shard_name
+
+    second = ShardWriter(store)
+    write(second, 'b')
+    second.close()
+
+    assert open_shard not in sealed_shards(store)
+    assert [job[0] for job in list_shard_jobs(store, 'gcs')] == [os.path.join(store, second.shard_name),
+                                                                 os.path.join(store, shard_store.INDEX_NAME)]
+
+    write(first, 'c')
+    first.close()
+    assert open_shard in sealed_shards(store)
+    reader = ShardReader(store)
+    assert sorted(reader.keys()) == ['a', 'b', 'c']
+    reader.close()
+
+def test_shards_of_a_crashed_writer_are_sealed_by_the_next_one(store):
+    crashed = ShardWriter(store)
+    write(crashed, 'a')
+    crashed.shard_file.flush()
+    crashed.lock_file.close()  # the process died: its lock is released, its shard left open
+
+    ShardWriter(store).close()
+
+    assert crashed.shard_name in sealed_shards(store)
+    assert not [name for name in os.listdir(store) if name.endswith('.lock')]
+    assert ShardReader(store).read('a', 'txt') == b'0 0.5 0.5 0.1 0.1\n'
+
+def test_unsealed_shards_without_a_session_are_sealed(store):
+    os.makedirs(store)
+    open(os.path.join(store, 'shard-000000.tar'), 'wb').close()
+
+    ShardWriter(store).close()
+
+    assert 'shard-000000.tar' in sealed_shards(store)
+
+def test_pack_and_unpack_round_trip(tmp_path, store):
+    images, labels = tmp_path / 'images', tmp_path / 'labels'
+    images.mkdir()
+    labels.mkdir()
+    (images / 'chair_1_0.90_7_SSC_1.jpg').write_bytes(b'jpeg')
+    (labels / 'chair_1_0.90_7_SSC_1.txt').write_bytes(b'label')
+
+    assert shard_store.pack_directory(str(images), str(labels), store) == 1
+    reader = ShardReader(store)
+    assert reader.metadata('chair_1_0.90_7_SSC_1') == {'class_name': 'chair', 'class_id': 1, 'confidence': 0.9,
+                                                        'track_id': '7', 'screenshot': 1}
+    reader.close()
+    assert shard_store.unpack_shards(store, str(tmp_path / 'out_images'), str(tmp_path / 'out_labels')) == 1
+    assert (tmp_path / 'out_labels' / 'chair_1_0.90_7_SSC_1.txt').read_bytes() == b'label'
@@ -0,0 +1,74 @@
+# test_streaming_postprocess.py
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import app
+from post_processer import process_folders
+
+WIDTH, HEIGHT = 160, 120
+
+
+# Smooth gradient frame, so JPEG round trips stay close to the original
+def gradient_frame():
+    x = np.linspace(0, 255, WIDTH, dtype=np.float32)
+    y = np.linspace(0, 255, HEIGHT, dtype=np.float32)[:, None]
+    return np.dstack([np.broadcast_to(x, (HEIGHT, WIDTH)), np.broadcast_to(y, (HEIGHT, WIDTH)), (x + y) / 2]).astype(np.uint8)
+
+# Original and processed folders, with app.py's processed outputs pointed at them
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    paths = {name: str(tmp_path / name) for name in ('images', 'labels', 'inline_images', 'inline_labels', 'inline_plots',
+                                                     'processed_images', 'processed_labels', 'plots')}
+    for path in paths.values():
+        os.makedirs(path)
+    monkeypatch.setattr(app, 'writer_pool', None)
+    monkeypatch.setattr(app, 'STORAGE_BACKEND', 'files')
+    monkeypatch.setattr(app, 'STREAMING_SAVE_PLOTS', True)
+    monkeypatch.setattr(app, 'PROCESSED_IMAGE_DIR', paths['inline_images'])
+    monkeypatch.setattr(app, 'PROCESSED_LABEL_DIR', paths['inline_labels'])
+    monkeypatch.setattr(app, 'PLOT_IMAGE_DIR', paths['inline_plots'])
+    return paths
+
+def read_text(path):
+    with open(path) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('bbox', [(60, 30, 100, 90), (2, 10, 40, 60), (130, 0, 158, 119)])
+def test_inline_crop_matches_the_post_processing_pass(dirs, bbox):
+    frame = gradient_frame()
+    capture = ('chair', 56, 0.91, 7, 1, np.array(bbox, dtype=np.float32), frame, WIDTH, HEIGHT)
+    name = app.capture_basename('chair', 56, 0.91, 7, 1)
+
+    app.save_processed_capture(*capture)
+    app.save_capture(dirs['images'], dirs['labels'], *capture)
+    report = process_folders([dirs['images']], [dirs['labels']], dirs['processed_images'], dirs['processed_labels'], dirs['plots'])
+
+    assert report['processed'] == 1
+    assert read_text(os.path.join(dirs['inline_labels'], name + '.txt')) == read_text(os.path.join(dirs['processed_labels'], name + '.txt'))
+    for inline, processed in (('inline_images', 'processed_images'), ('inline_plots', 'plots')):
+        inline_image = cv2.imread(os.path.join(dirs[inline], name + '.jpg'))
+        processed_image = cv2.imread(os.path.join(dirs[processed], name + '.jpg'))
+        # Square crop of the frame; the offline pass decodes one more JPEG generation
+        assert inline_image.shape == processed_image.shape == (HEIGHT, HEIGHT, 3)
+        assert np.abs(inline_image.astype(int) - processed_image.astype(int)).mean() < 3
+
+def test_crop_keeps_a_box_at_the_frame_edge(dirs):
+    app.save_processed_capture('chair', 56, 0.91, 7, 1, (130, 0, 158, 119), gradient_frame(), WIDTH, HEIGHT)
+
+    # The crop is shifted right so the whole box stays inside it: x 38..158
+    label = read_text(os.path.join(dirs['inline_labels'], app.capture_basename('chair', 56, 0.91, 7, 1) + '.txt')).split()
+    class_id, x_center, y_center, width, height = int(label[0]), *map(float, label[1:])
+    assert class_id == 56
+    assert [x_center, y_center, width, height] == pytest.approx([(144 - 38) / HEIGHT, 59.5 / HEIGHT, 28 / HEIGHT, 119 / HEIGHT], abs=1e-3)
+
+def test_plots_are_only_written_when_enabled(dirs, monkeypatch):
+    monkeypatch.setattr(app, 'STREAMING_SAVE_PLOTS', False)
+
+    app.save_processed_capture('chair', 56, 0.91, 7, 1, (60, 30, 100, 90), gradient_frame(), WIDTH, HEIGHT)
+
+    assert len(os.listdir(dirs['inline_images'])) == len(os.listdir(dirs['inline_labels'])) == 1
+    assert os.listdir(dirs['inline_plots']) == []
@@ -0,0 +1,89 @@
+# test_track_state.py
+import numpy as np
+
+from track_state import TrackStateStore
+
+
+def update(store, track_ids, confidence=0.9):
+    return store.update(['chair'] * len(track_ids), track_ids, [confidence] * len(track_ids))
+
+def test_consecutive_counts_reach_the_threshold_once():
+    store = TrackStateStore(0.5, consecutive_frames=3, max_screenshots=2)
+
+    ready = [update(store, [1])[2][0] for _ in range(4)]
+
+    assert ready == [False, False, True, False]
+
+def test_eviction_never_reuses_a_slot_of_the_current_frame():
+    store = TrackStateStore(0.5, consecutive_frames=3, max_screenshots=2, capacity=2)
+    update(store, [1, 2])
+
+    # Track 1 is looked up before track 3 needs a slot, so track 2 is evicted
+    slots, counts, _ = update(store, [1, 3])
+
+    assert slots[0] != slots[1]
+    assert counts.tolist() == [2, 1]
+    assert set(store.slots) == {('chair', 1), ('chair', 3)} and store.evicted == 1
+
+def test_more_new_tracks_than_capacity_in_one_frame():
+    store = TrackStateStore(0.5, consecutive_frames=3, max_screenshots=2, capacity=2)
+
+    slots, counts, _ = update(store, [1, 2, 3])
+
+    assert len(set(slots.tolist())) == 3 and counts.tolist() == [1, 1, 1]
+    assert store.capacity == 4 and store.evicted == 0
+    assert update(store, [1, 2, 3])[1].tolist() == [2, 2, 2]
+
+def test_least_recently_seen_track_is_evicted():
+    store = TrackStateStore(0.5, consecutive_frames=3, max_screenshots=2, capacity=2)
+    update(store, [1])
+    update(store, [2])
+    update(store, [1])
+
+    update(store, [3])
+
+    assert set(store.slots) == {('chair', 1), ('chair', 3)}
+
+def test_saturation_is_tracked_across_evictions():
+    store = TrackStateStore(0.5, consecutive_frames=1, max_screenshots=1, capacity=1)
+    slot = update(store, [1])[0][0]
+    store.record_screenshot(slot)
+    assert store.all_saturated()
+
+    slot = update(store, [2])[0][0]
+
+    assert not store.all_saturated() and store.can_capture(slot)
+
+def test_restart_consecutive_does_not_count_a_screenshot():
+    store = TrackStateStore(0.5, consecutive_frames=2, max_screenshots=2)
+    update(store, [1])
+    slot = update(store, [1])[0][0]
+
+    store.restart_consecutive(slot)
+
+    assert store.screenshots[slot] == 0 and update(store, [1])[1].tolist() == [1]
+    assert np.count_nonzero(store.screenshots) == 0
+
+def test_detections_sharing_a_key_count_once_per_frame():
+    store = TrackStateStore(0.5, consecutive_frames=3, max_screenshots=2)
+
+    frames = [update(store, [None, None]) for _ in range(4)]
+
+    assert [counts.tolist() for _, counts, _ in frames] == [[1, 1], [2, 2], [3, 3], [4, 4]]
+    assert [ready.tolist() for _, _, ready in frames] == [[False, False], [False, False], [True, False], [False, False]]
+
+def test_a_confident_detection_wins_over_an_unconfident_one_of_the_same_key():
+    store = TrackStateStore(0.5, consecutive_frames=2, max_screenshots=2)
+    update(store, [None])
+
+    slots, counts, ready = store.update(['chair', 'chair'], [None, None], [0.2, 0.9])
+
+    assert counts.tolist() == [2, 2]
+    assert ready.tolist() == [False, True]
+
+def test_seconds_threshold_counts_a_shared_key_once_per_frame():
+    store = TrackStateStore(0.5, consecutive_frames=3, max_screenshots=2, consecutive_seconds=0.3)
+
+    ready = [store.update(['chair'] * 2, [None] * 2, [0.9] * 2, interval=0.1)[2].tolist() for _ in range(4)]
+
+    assert ready == [[False, False], [False, False], [True, False], [False, False]]
@@ -0,0 +1,121 @@
+# test_writer_pool.py
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import writer_pool
+from writer_pool import WriterPool
+
+IMAGE = np.full((16, 16, 3), 128, dtype=np.uint8)
+
+
+def capture(directory, name):
+    return [(os.path.join(directory, name + '.jpg'), IMAGE), (os.path.join(directory, name + '.txt'), f'0 {name}')]
+
+def names(directory):
+    return sorted(os.listdir(directory))
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+# Hold every worker in its first write until the gate is opened
+@pytest.fixture
+def gate(monkeypatch):
+    event = threading.Event()
+    write_atomic = writer_pool.write_atomic
+
+    def gated(path, data):
+        event.wait(5.0)
+        write_atomic(path, data)
+    monkeypatch.setattr(writer_pool, 'write_atomic', gated)
+    yield event
+    event.set()
+
+@pytest.fixture
+def out(tmp_path):
+    directory = tmp_path / 'out'
+    directory.mkdir()
+    return str(directory)
+
+
+def test_drop_oldest_drops_an_image_together_with_its_label(gate, out):
+    pool = WriterPool(workers=1, queue_size=2, backpressure='drop_oldest')
+    pool.submit_files(capture(out, 'a'))
+    wait_until(lambda: pool.in_flight == 1)
+    for name in 'bcd':
+        pool.submit_files(capture(out, name))
+
+    gate.set()
+    assert pool.close(timeout=5.0)
+    assert pool.stats()['dropped'] == 1
+    assert names(out) == ['a.jpg', 'a.txt', 'c.jpg', 'c.txt', 'd.jpg', 'd.txt']
+
+def test_block_waits_for_a_free_slot(gate, out):
+    pool = WriterPool(workers=1, queue_size=1, backpressure='block')
+    pool.submit_files(capture(out, 'a'))
+    wait_until(lambda: pool.in_flight == 1)
+    pool.submit_files(capture(out, 'b'))
+
+    blocked = threading.Thread(target=pool.submit_files, args=(capture(out, 'c'),))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+
+    gate.set()
+    blocked.join(5.0)
+    assert pool.close(timeout=5.0)
+    assert pool.stats()['dropped'] == 0
+    assert len(names(out)) == 6
+
+def test_spilled_jobs_are_written_when_the_queue_drains(gate, out, tmp_path):
+    spill_dir = str(tmp_path / 'spill')
+    pool = WriterPool(workers=1, queue_size=1, backpressure='spill', spill_dir=spill_dir)
+    pool.submit_files(capture(out, 'a'))
+    wait_until(lambda: pool.in_flight == 1)
+    for name in 'bcd':
+        pool.submit_files(capture(out, name))
+    assert pool.stats()['spilled'] == 2
+    assert len(os.listdir(spill_dir)) == 2
+
+    gate.set()
+    assert pool.close(timeout=5.0)
+    assert len(names(out)) == 8
+    assert os.listdir(spill_dir) == []
+
+def test_jobs_spilled_by_a_previous_run_are_picked_up(out, tmp_path):
+    spill_dir = str(tmp_path / 'spill')
+    # Without workers and with no queue every job goes straight to the spill directory
+    crashed = WriterPool(workers=0, queue_size=0, backpressure='spill', spill_dir=spill_dir)
+    crashed.submit_files(capture(out, 'a'))
+    assert names(out) == []
+
+    pool = WriterPool(workers=1, backpressure='spill', spill_dir=spill_dir)
+    assert pool.close(timeout=5.0)
+    assert names(out) == ['a.jpg', 'a.txt']
+    assert os.listdir(spill_dir) == []
+
+def test_close_drains_the_queue_without_leaving_temporary_files(out):
+    pool = WriterPool(workers=2, queue_size=4, backpressure='block')
+    for i in range(20):
+        pool.submit_files(capture(out, f'{i:02d}'))
+
+    assert pool.close(timeout=5.0)
+    assert pool.stats()['written'] == 20
+    assert len(names(out)) == 40
+    assert not any(name.endswith('.tmp') for name in names(out))
+    with pytest.raises(RuntimeError):
+        pool.submit_files(capture(out, 'late'))
+
+def test_a_failed_encode_writes_none_of_the_files(out):
+    pool = WriterPool(workers=1)
+    pool.submit_files([(os.path.join(out, 'bad.jpg'), np.zeros((0, 0, 3), dtype=np.uint8)), (os.path.join(out, 'bad.txt'), '0')])
+
+    assert pool.close(timeout=5.0)
+    assert pool.stats()['failed'] == 1
+    assert names(out) == []
@@ -0,0 +1,167 @@
+# track_state.py
+import numpy as np
+
+
+# Array-backed per-track counters keyed by (class_name, track_id).
+# Tracks the tracker stops reporting expire after ttl_frames detection frames,
+# and the least recently seen track is evicted when capacity is reached (the
+# store only grows for a frame with more tracks than capacity).
+# With consecutive_seconds, a track is ready after that much stream time of
+# confident detections instead of a number of frames, so the threshold keeps
+# its meaning when the frame skip changes.
+class TrackStateStore:
+
+    def __init__(self, confidence_level, consecutive_frames, max_screenshots, capacity=1024, ttl_frames=60, consecutive_seconds=None):
+        self.confidence_level = confidence_level
+        self.consecutive_frames = consecutive_frames
+        self.consecutive_seconds = consecutive_seconds
+        self.max_screenshots = max_screenshots
+        self.capacity = capacity
+        self.ttl_frames = ttl_frames
+
+        self.consecutive = np.zeros(capacity, dtype=np.int32)
+        self.consecutive_time = np.zeros(capacity, dtype=np.float64)
+        self.screenshots = np.zeros(capacity, dtype=np.int32)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+        self.in_use = np.zeros(capacity, dtype=bool)
+
+        self.slots = {}
+        self.slot_keys = [None] * capacity
+        self.free_slots = list(range(capacity - 1, -1, -1))
+        self.frame = 0
+        self.evicted = 0
+
+        # O(1) "all objects saturated" bookkeeping
+        self.captured = 0   # tracks with at least one screenshot
+        self.saturated = 0  # tracks with max_screenshots screenshots
+
+    def __len__(self):
+        return len(self.slots)
+
+    # Slot of a track, stamped as seen this frame as soon as it is looked up so
+    # a later detection of the same frame can never evict it
+    def _slot(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            if not self.free_slots:
+                self._evict_least_recent()
+            slot = self.free_slots.pop()
+            self.slots[key] = slot
+            self.slot_keys[slot] = key
+            self.in_use[slot] = True
+            self.consecutive[slot] = 0
+            self.consecutive_time[slot] = 0.0
+            self.screenshots[slot] = 0
+        self.last_seen[slot] = self.frame
+        return slot
+
+    # Evict the least recently seen track. When every slot holds a track of the
+    # current frame, the store grows instead.
+    def _evict_least_recent(self):
+        slot = int(np.argmin(np.where(self.in_use, self.last_seen, np.iinfo(np.int64).max)))
+        if self.last_seen[slot] == self.frame:
+            self._grow(self.capacity * 2)
+        else:
+            self._evict(np.array([slot]))
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.consecutive = np.concatenate([self.consecutive, np.zeros(extra, dtype=np.int32)])
+        self.consecutive_time = np.concatenate([self.consecutive_time, np.zeros(extra, dtype=np.float64)])
+        self.screenshots = np.concatenate([self.screenshots, np.zeros(extra, dtype=np.int32)])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros(extra, dtype=np.int64)])
+        self.in_use = np.concatenate([self.in_use, np.zeros(extra, dtype=bool)])
+        self.slot_keys.extend([None] * extra)
+        self.free_slots.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def _evict(self, slots):
+        screenshots = self.screenshots[slots]
+        self.captured -= int(np.count_nonzero(screenshots > 0))
+        self.saturated -= int(np.count_nonzero(screenshots >= self.max_screenshots))
+        self.in_use[slots] = False
+        for slot in slots.tolist():
+            del self.slots[self.slot_keys[slot]]
+            self.slot_keys[slot] = None
+            self.free_slots.append(slot)
+        self.evicted += len(slots)
+
+    # Drop tracks not reported for more than ttl_frames detection frames
+    def evict_expired(self):
+        expired = np.flatnonzero(self.in_use & (self.frame - self.last_seen > self.ttl_frames))
+        if expired.size:
+            self._evict(expired)
+
+    # Update all detections of one frame at once. Returns the slot of every
+    # detection, its consecutive count and a mask of detections that just
+    # reached consecutive_frames (or consecutive_seconds, counting interval
+    # seconds of stream time for this frame).
+    # Counts are per frame: detections sharing a key (e.g. several untracked
+    # objects of one class) count once, the key counts as confident if any of
+    # them is, and only its first confident detection is marked ready.
+    def update(self, class_names, track_ids, confidences, interval=None):
+        self.frame += 1
+        self.evict_expired()
+
+        slots = np.fromiter((self._slot(key) for key in zip(class_names, track_ids)), dtype=np.intp, count=len(confidences))
+        confident = np.asarray(confidences) >= self.confidence_level
+
+        seen = np.unique(slots)
+        hit = np.zeros(self.capacity, dtype=bool)
+        hit[slots[confident]] = True
+        hit = hit[seen]
+        self.consecutive[seen] = np.where(hit, self.consecutive[seen] + 1, 0)
+
+        # First confident detection of every key
+        confident_index = np.flatnonzero(confident)
+        first = confident_index[np.unique(slots[confident_index], return_index=True)[1]]
+        ready = np.zeros(len(slots), dtype=bool)
+
+        counts = self.consecutive[slots]
+        if self.consecutive_seconds is None or interval is None:
+            ready[first] = counts[first] == self.consecutive_frames
+            return slots, counts, ready
+
+        self.consecutive_time[seen] = np.where(hit, self.consecutive_time[seen] + interval, 0.0)
+        elapsed = self.consecutive_time[slots[first]]
+        ready[first] = (elapsed >= self.consecutive_seconds) & (elapsed - interval < self.consecutive_seconds)
+        return slots, counts, ready
+
+    def can_capture(self, slot):
+        return self.screenshots[slot] < self.max_screenshots
+
+    # Count a screenshot for the track and restart its consecutive count
+    def record_screenshot(self, slot):
+        count = int(self.screenshots[slot]) + 1
+        self.screenshots[slot] = count
+        if count == 1:
+            self.captured += 1
+        if count == self.max_screenshots:
+            self.saturated += 1
+        self.consecutive[slot] = 0
+        self.consecutive_time[slot] = 0.0
+        return count
+
+    # Restart the track's consecutive count without counting a screenshot
+    def restart_consecutive(self, slot):
+        self.consecutive[slot] = 0
+        self.consecutive_time[slot] = 0.0
+
+    def all_saturated(self):
+        return self.captured > 0 and self.captured == self.saturated
+
+    def reset_consecutive(self):
+        self.consecutive[:] = 0
+        self.consecutive_time[:] = 0.0
+
+    # Forget screenshot counts, used when a new motion event opens the gate
+    def reset_counts(self):
+        self.consecutive[:] = 0
+        self.consecutive_time[:] = 0.0
+        self.screenshots[:] = 0
+        self.captured = 0
+        self.saturated = 0
+
+    def stats(self):
+        return {'tracks': len(self.slots), 'capacity': self.capacity, 'evicted': self.evicted,
+                'captured': self.captured, 'saturated': self.saturated}
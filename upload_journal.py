@@ -0,0 +1,66 @@
+# upload_journal.py
+import sqlite3
+import time
+
+# Statuses meaning the object is confirmed to be in the bucket
+CONFIRMED_STATUSES = ('uploaded', 'present', 'deleted')
+
+
+# Durable per-file record of a sync: what was uploaded (or found already
+# present), with which size, mtime and checksums, and whether the local copy
+# was deleted. Writes are committed in batches; an interrupted sync loses at
+# most one batch, which the next run re-checks against the bucket listing.
+class UploadJournal:
+
+    def __init__(self, path, batch_size=200):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS uploads (
+                source TEXT PRIMARY KEY,
+                destination TEXT NOT NULL,
+                size INTEGER,
+                mtime_ns INTEGER,
+                md5 TEXT,
+                crc32c TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER,
+                error TEXT,
+                updated REAL
+            )''')
+        self.connection.commit()
+
+    # Every entry keyed by source path, loaded once before a sync
+    def entries(self):
+        return {row['source']: dict(row) for row in self.connection.execute('SELECT * FROM uploads')}
+
+    def record(self, source, destination, status, size=None, mtime_ns=None, md5=None, crc32c=None, attempts=0, error=None):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO uploads (source, destination, size, mtime_ns, md5, crc32c, status, attempts, error, updated) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (source, destination, size, mtime_ns, md5, crc32c, status, attempts, error, time.time()))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.commit()
+
+    def mark_deleted(self, source):
+        self.connection.execute("UPDATE uploads SET status = 'deleted', updated = ? WHERE source = ?", (time.time(), source))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        self.connection.commit()
+        self.pending = 0
+
+    def counts(self):
+        return {row['status']: row['count'] for row in self.connection.execute('SELECT status, COUNT(*) AS count FROM uploads GROUP BY status')}
+
+    def close(self):
+        self.commit()
+        self.connection.close()
@@ -0,0 +1,248 @@
+# writer_pool.py
+import itertools
+import os
+import pickle
+import threading
+import time
+from collections import deque
+import cv2
+from shard_store import encode_sample_files, get_writer
+
+# Backpressure behaviour when the queue is full
+BACKPRESSURE_BLOCK = 'block'              # caller waits for a free slot
+BACKPRESSURE_DROP_OLDEST = 'drop_oldest'  # oldest queued job is discarded
+BACKPRESSURE_SPILL = 'spill'              # job is pickled to a local spill directory
+
+BACKPRESSURE_POLICIES = (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP_OLDEST, BACKPRESSURE_SPILL)
+
+
+# Write through a temporary file so readers never see a partial file
+def write_atomic(path, data):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+
+# Latency accumulator reported in milliseconds
+class LatencyStats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {'count': self.count, 'mean_ms': mean * 1000, 'max_ms': self.max * 1000}
+
+
+# Bounded queue of encode/write jobs drained by a pool of worker threads
+class WriterPool:
+
+    def __init__(self, workers=2, queue_size=64, backpressure=BACKPRESSURE_BLOCK, spill_dir=None, jpeg_quality=95, metrics=None):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {backpressure} (expected one of {BACKPRESSURE_POLICIES})")
+        if backpressure == BACKPRESSURE_SPILL and not spill_dir:
+            raise ValueError("A spill directory is required for the spill backpressure policy")
+
+        self.queue_size = queue_size
+        self.backpressure = backpressure
+        self.spill_dir = spill_dir
+        self.jpeg_quality = jpeg_quality
+        self.metrics = metrics
+
+        self.jobs = deque()
+        self.spilled = deque()
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.closed = False
+        self.sequence = itertools.count()
+
+        # Metrics
+        self.max_queue_depth = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled_total = 0
+        self.failed = 0
+        self.encode_latency = LatencyStats()
+        self.write_latency = LatencyStats()
+
+        # Pick up jobs spilled by a previous run
+        if backpressure == BACKPRESSURE_SPILL:
+            os.makedirs(spill_dir, exist_ok=True)
+        if spill_dir and os.path.isdir(spill_dir):
+            self.spilled.extend(sorted(os.path.join(spill_dir, name) for name in os.listdir(spill_dir) if name.endswith('.pkl')))
+
+        self.threads = [threading.Thread(target=self._worker, name=f'writer-{i}', daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit_image(self, path, image, label='Image'):
+        self.submit_files([(path, image)], label=label)
+
+    def submit_text(self, path, text, label='File'):
+        self.submit_files([(path, text)], label=label)
+
+    # Write several (path, image or text) files as one job, so backpressure
+    # keeps or drops an image together with its label
+    def submit_files(self, files, label='Files'):
+        self._submit(('files', files[0][0], list(files), label))
+
+    # Append images and texts as one sample of the shard store in shard_dir
+    def submit_sample(self, shard_dir, key, images, texts, metadata, label='Sample'):
+        self._submit(('sample', shard_dir, (key, images, texts, metadata), label))
+
+    def _submit(self, job):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("Writer pool is closed")
+
+            if len(self.jobs) >= self.queue_size:
+                if self.backpressure == BACKPRESSURE_BLOCK:
+                    self.condition.wait_for(lambda: len(self.jobs) < self.queue_size)
+                elif self.backpressure == BACKPRESSURE_DROP_OLDEST:
+                    dropped = self.jobs.popleft()
+                    self.dropped += 1
+                    print(f"Writer queue full, dropped: {dropped[1]}")
+                else:
+                    self._spill(job)
+                    self.condition.notify()
+                    return
+
+            self.jobs.append(job)
+            self.max_queue_depth = max(self.max_queue_depth, len(self.jobs))
+            self.condition.notify()
+
+    # Called with the condition held
+    def _spill(self, job):
+        spill_path = os.path.join(self.spill_dir, f"{time.time_ns()}_{next(self.sequence):06d}.pkl")
+        with open(spill_path + '.tmp', 'wb') as f:
+            pickle.dump(job, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(spill_path + '.tmp', spill_path)
+        self.spilled.append(spill_path)
+        self.spilled_total += 1
+
+    def _next_job(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.jobs or self.spilled or self.closed)
+            if self.jobs:
+                job = self.jobs.popleft()
+                self.in_flight += 1
+                self.condition.notify_all()
+                return job
+            if self.spilled:
+                spill_path = self.spilled.popleft()
+                self.in_flight += 1
+            else:
+                return None
+
+        try:
+            with open(spill_path, 'rb') as f:
+                job = pickle.load(f)
+            os.remove(spill_path)
+            return job
+        except Exception as e:
+            print(f"Failed to load spilled job {spill_path}: {e}")
+            self._finish(failed=True)
+            return self._next_job()
+
+    def _finish(self, failed=False):
+        with self.condition:
+            self.in_flight -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.written += 1
+            self.condition.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+
+            kind, path, payload, label = job
+            try:
+                if kind == 'sample':
+                    self._write_sample(path, *payload)
+                    print(f"{label} saved: {path}{payload[0]}")
+                    self._finish()
+                    continue
+
+                # Legacy single-file jobs spilled by an older run
+                files = [(path, payload)] if kind in ('image', 'text') else payload
+
+                # Encode everything first so a failed encode writes nothing
+                start = time.perf_counter()
+                encoded = [(file_path, self._encode(file_path, data)) for file_path, data in files]
+                self._observe('encode', self.encode_latency, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                for file_path, data in encoded:
+                    write_atomic(file_path, data)
+                self._observe('write', self.write_latency, time.perf_counter() - start)
+                print(f"{label} saved: {path}")
+            except Exception as e:
+                print(f"Failed to write {path}: {e}")
+                self._finish(failed=True)
+                continue
+
+            self._finish()
+
+    def _encode(self, path, payload):
+        if isinstance(payload, str):
+            return payload.encode('utf-8')
+        ok, encoded = cv2.imencode(os.path.splitext(path)[1] or '.jpg', payload, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("image encoding failed")
+        return encoded.tobytes()
+
+    def _write_sample(self, shard_dir, key, images, texts, metadata):
+        start = time.perf_counter()
+        files = encode_sample_files(images, texts, self.jpeg_quality)
+        self._observe('encode', self.encode_latency, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        get_writer(shard_dir).write(key, files, metadata)
+        self._observe('write', self.write_latency, time.perf_counter() - start)
+
+    def _observe(self, stage, latency, seconds):
+        latency.add(seconds)
+        if self.metrics is not None:
+            self.metrics.observe(stage, seconds * 1000)
+
+    # Wait until every queued and spilled job has been written
+    def flush(self, timeout=None):
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.jobs and not self.spilled and self.in_flight == 0, timeout=timeout)
+
+    def close(self, timeout=None):
+        flushed = self.flush(timeout)
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        print(f"Writer pool closed: {self.stats()}")
+        return flushed
+
+    def stats(self):
+        return {
+            'queue_depth': len(self.jobs),
+            'max_queue_depth': self.max_queue_depth,
+            'spill_depth': len(self.spilled),
+            'in_flight': self.in_flight,
+            'written': self.written,
+            'dropped': self.dropped,
+            'spilled': self.spilled_total,
+            'failed': self.failed,
+            'encode_latency': self.encode_latency.as_dict(),
+            'write_latency': self.write_latency.as_dict(),
+        }